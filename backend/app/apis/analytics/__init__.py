@@ -9,6 +9,7 @@ import uuid
 from app.apis.common import track_event as track_event_internal
 from app.apis.common import get_analytics_data as get_analytics_internal
 from app.apis.common import get_events
+from app.apis.transform_engine import engine as transform_engine
 
 router = APIRouter()
 
@@ -130,7 +131,10 @@ def get_analytics_data(password: str = Query(...)) -> Dict[str, Any]:
                 
                 # Add to totals
                 analytics["total_transformations"] += extra_analytics.get("total_transformations", 0)
-        
+
+        # Add per-backend stats from the shared transformation engine
+        analytics["transform_engine"] = transform_engine.get_stats()
+
         return analytics
     except Exception as e:
         print(f"Error getting analytics data: {str(e)}")
@@ -0,0 +1,256 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from app.apis.common import TEMPLATE_CATALOGS, TEMPLATE_IMAGE_PREFIX, get_template_manager, add_templates_listener
+from app.apis.common import load_blob, decode_data_url, get_image_media_type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Where the static catalog is written (required; there is no default, since the
+# API container's own filesystem may be ephemeral or not the one being served),
+# and the URL prefix it is served under (relative URLs by default, so the
+# directory can be served from anywhere)
+EXPORT_DIR = os.environ.get("CATALOG_EXPORT_DIR")
+EXPORT_BASE_URL = os.environ.get("CATALOG_EXPORT_BASE_URL", "")
+
+# Seconds to wait after a template write before re-exporting, so bursts of
+# writes (e.g. a bulk import) produce one export
+EXPORT_DEBOUNCE_SECONDS = 2.0
+
+# Number of old versioned manifests to keep for clients that still reference them
+KEEP_MANIFEST_VERSIONS = 5
+
+# Unreferenced images younger than this are kept, in case an export running in
+# another process has written them for a manifest it has not written yet
+IMAGE_PRUNE_GRACE_SECONDS = 600
+
+# Template fields only used server-side
+PRIVATE_TEMPLATE_FIELDS = ("landmarks",)
+
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif"
+}
+
+_export_lock = threading.Lock()
+_export_timer: Optional[threading.Timer] = None
+_timer_lock = threading.Lock()
+
+def write_file(path: str, data: bytes):
+    """Write a file atomically, so a web server never serves a partial file"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def write_precompressed(path: str, data: bytes):
+    """Write a file with .gz and (if brotli is installed) .br variants next to it"""
+    write_file(path, data)
+    write_file(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_file(f"{path}.br", brotli.compress(data, quality=11))
+
+def export_image(image_bytes: bytes, export_dir: str) -> str:
+    """Write an image under a content-hashed filename and return its URL"""
+    extension = IMAGE_EXTENSIONS.get(get_image_media_type(image_bytes), ".bin")
+    filename = f"{hashlib.sha256(image_bytes).hexdigest()[:20]}{extension}"
+    path = os.path.join(export_dir, "images", filename)
+    # Hashed files never change, so existing ones are left alone
+    if not os.path.exists(path):
+        write_file(path, image_bytes)
+    return f"{EXPORT_BASE_URL}images/{filename}"
+
+def export_blob(content_hash: str, export_dir: str) -> Optional[str]:
+    """Export a stored template image by content hash"""
+    try:
+        return export_image(load_blob(TEMPLATE_IMAGE_PREFIX, content_hash), export_dir)
+    except FileNotFoundError:
+        print(f"Template image {content_hash} not found in storage")
+        return None
+
+def export_template(template: Dict[str, Any], export_dir: str) -> Dict[str, Any]:
+    """Copy a template for the manifest with image URLs pointing at exported files"""
+    exported = {key: value for key, value in template.items() if key not in PRIVATE_TEMPLATE_FIELDS}
+
+    if template.get("image_hash"):
+        url = export_blob(template["image_hash"], export_dir)
+        if url:
+            exported["url"] = url
+    else:
+        # Older templates may still embed their image as a data URL
+        image_bytes = decode_data_url(template.get("url", ""))
+        if image_bytes is not None:
+            exported["url"] = export_image(image_bytes, export_dir)
+
+    if template.get("derivatives"):
+        derivatives = {}
+        for name, derivative in template["derivatives"].items():
+            derivatives[name] = dict(derivative)
+            for image_format, variant in derivative.items():
+                if isinstance(variant, dict) and variant.get("hash"):
+                    url = export_blob(variant["hash"], export_dir)
+                    derivatives[name][image_format] = {**variant, "url": url or variant.get("url")}
+        exported["derivatives"] = derivatives
+    return exported
+
+def prune_manifests(export_dir: str, current: str) -> List[str]:
+    """Delete all but the newest KEEP_MANIFEST_VERSIONS versioned manifests
+    
+    Returns:
+        Names of the versioned manifests that were kept, including current
+    """
+    manifests = [
+        name for name in os.listdir(export_dir)
+        if name.startswith("manifest.") and name.endswith(".json") and name not in ("manifest.json", current)
+    ]
+    manifests.sort(key=lambda name: os.path.getmtime(os.path.join(export_dir, name)), reverse=True)
+    for name in manifests[KEEP_MANIFEST_VERSIONS - 1:]:
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(export_dir, name + suffix))
+            except FileNotFoundError:
+                pass
+    return [current] + manifests[:KEEP_MANIFEST_VERSIONS - 1]
+
+def get_image_files(catalogs: Dict[str, Dict[str, Any]]) -> Set[str]:
+    """Get the exported image filenames a manifest's catalogs reference"""
+    urls = []
+    for templates in catalogs.values():
+        for template in templates.values():
+            urls.append(template.get("url"))
+            for derivative in (template.get("derivatives") or {}).values():
+                urls.extend(variant.get("url") for variant in derivative.values() if isinstance(variant, dict))
+    prefix = f"{EXPORT_BASE_URL}images/"
+    return {url[len(prefix):] for url in urls if isinstance(url, str) and url.startswith(prefix)}
+
+def prune_images(export_dir: str, manifests: List[str]):
+    """Delete exported images that none of the kept manifests reference"""
+    referenced: Set[str] = set()
+    for name in manifests:
+        try:
+            with open(os.path.join(export_dir, name), "rb") as f:
+                referenced |= get_image_files(json.load(f).get("catalogs", {}))
+        except (OSError, ValueError) as e:
+            # Without a complete picture nothing can safely be deleted
+            print(f"Not pruning images, could not read {name}: {str(e)}")
+            return
+
+    images_dir = os.path.join(export_dir, "images")
+    now = time.time()
+    for filename in os.listdir(images_dir):
+        path = os.path.join(images_dir, filename)
+        if filename in referenced or now - os.path.getmtime(path) < IMAGE_PRUNE_GRACE_SECONDS:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def export_catalog(export_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Export the faceswap, meme generator and Gemini catalogs as static files
+
+    The export directory (CATALOG_EXPORT_DIR by default) is assumed to be on a
+    single host, or a volume shared by every API process: automatic re-exports
+    run in whichever process handled the template write, and only once that
+    directory has a manifest.json.
+
+    Layout:
+        images/<hash>.<ext>         Template images and derivatives, named by content
+        manifest.<version>.json     All catalogs, immutable (+ .gz and .br)
+        manifest.json               Points at the current versioned manifest (+ .gz and .br)
+
+    Versioned files can be cached forever; only manifest.json needs a short TTL.
+    Old manifests beyond KEEP_MANIFEST_VERSIONS, and images none of the kept
+    manifests reference, are deleted.
+
+    Returns:
+        Summary with the manifest version and template counts
+
+    Raises:
+        ValueError: If no export directory is configured
+    """
+    export_dir = export_dir or EXPORT_DIR
+    if not export_dir:
+        raise ValueError("CATALOG_EXPORT_DIR is not configured")
+
+    with _export_lock:
+        start_time = time.time()
+        os.makedirs(os.path.join(export_dir, "images"), exist_ok=True)
+
+        catalogs = {}
+        for catalog, templates_key in TEMPLATE_CATALOGS.items():
+            manager = get_template_manager(templates_key)
+            if manager is None:
+                continue
+            catalogs[catalog] = {
+                template_id: export_template(template, export_dir)
+                for template_id, template in manager.get_templates().items()
+            }
+
+        # The version only depends on content, so unchanged catalogs keep their manifest
+        catalog_body = json.dumps(catalogs, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        version = hashlib.sha256(catalog_body).hexdigest()[:16]
+        manifest_name = f"manifest.{version}.json"
+        manifest_path = os.path.join(export_dir, manifest_name)
+
+        if not os.path.exists(manifest_path):
+            manifest = {"version": version, "generated_at": datetime.now().isoformat(), "catalogs": catalogs}
+            write_precompressed(manifest_path, json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+        # Always repoint manifest.json (atomically), also when the catalog went
+        # back to a version that was exported before
+        pointer = json.dumps({"version": version, "manifest": f"{EXPORT_BASE_URL}{manifest_name}"}).encode("utf-8")
+        pointer_path = os.path.join(export_dir, "manifest.json")
+        try:
+            with open(pointer_path, "rb") as f:
+                current_pointer = f.read()
+        except FileNotFoundError:
+            current_pointer = None
+        if current_pointer != pointer:
+            write_precompressed(pointer_path, pointer)
+        prune_images(export_dir, prune_manifests(export_dir, manifest_name))
+
+        summary = {
+            "version": version,
+            "manifest": manifest_name,
+            "export_dir": export_dir,
+            "templates": {catalog: len(templates) for catalog, templates in catalogs.items()},
+            "seconds": round(time.time() - start_time, 3)
+        }
+        print(f"Exported template catalog {version} to {export_dir} in {summary['seconds']}s")
+        return summary
+
+def schedule_export(templates_key: str):
+    """Re-export shortly after a template write, once a catalog has been exported"""
+    global _export_timer
+    if templates_key not in TEMPLATE_CATALOGS.values() or not EXPORT_DIR:
+        return
+    if not os.path.exists(os.path.join(EXPORT_DIR, "manifest.json")):
+        return
+
+    with _timer_lock:
+        if _export_timer is not None:
+            _export_timer.cancel()
+        _export_timer = threading.Timer(EXPORT_DEBOUNCE_SECONDS, run_scheduled_export)
+        _export_timer.daemon = True
+        _export_timer.start()
+
+def run_scheduled_export():
+    """Run a debounced export from the timer thread"""
+    try:
+        export_catalog()
+    except Exception as e:
+        print(f"Error exporting catalog: {str(e)}")
+
+add_templates_listener(schedule_export)
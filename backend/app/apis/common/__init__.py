@@ -1,10 +1,26 @@
+import os
+import socket
+import ipaddress
+import importlib.util
+from urllib.parse import urljoin, urlparse
 import databutton as db
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List, Literal, NamedTuple, Sequence, Tuple, Union
 import re
 from datetime import datetime
 import base64
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uuid
+import json
+import time
+import hashlib
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from fastapi import HTTPException, Query, Request, Response
+
+from app.apis.template_search import TemplateSearchIndex
 
 # Helper function for sanitizing storage keys
 def sanitize_storage_key(key: str) -> str:
@@ -14,6 +30,438 @@ def sanitize_storage_key(key: str) -> str:
 # Constants for analytics
 EVENTS_KEY_PREFIX = "events_"
 
+# How long parsed templates are reused before storage is read again
+TEMPLATES_CACHE_TTL = 30
+
+# Outbound HTTP: (connect, read) timeouts in seconds and connection pool size
+HTTP_TIMEOUT = (5, 20)
+HTTP_POOL_SIZE = 16
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """Get the shared HTTP session (pooled connections, retries on transient errors)
+    
+    Pass timeout=HTTP_TIMEOUT on every request; sessions have no default timeout.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504),
+                              allowed_methods=("GET", "HEAD"))
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+# Generated images: largest download accepted, attempts per download, and the
+# async download pool (generated images live on a different host than the API)
+GENERATED_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+GENERATED_IMAGE_DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_MAX_CONNECTIONS = 16
+
+_download_client = None
+_download_client_lock = threading.Lock()
+
+def get_async_download_client():
+    """Get the shared httpx.AsyncClient used to download generated images"""
+    global _download_client
+    if _download_client is None:
+        with _download_client_lock:
+            if _download_client is None:
+                import httpx
+                _download_client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=DOWNLOAD_MAX_CONNECTIONS,
+                                        max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS),
+                    timeout=httpx.Timeout(HTTP_TIMEOUT[1], connect=HTTP_TIMEOUT[0]),
+                    follow_redirects=True
+                )
+    return _download_client
+
+async def download_image(url: str, max_bytes: int = GENERATED_IMAGE_MAX_BYTES,
+                         attempts: int = GENERATED_IMAGE_DOWNLOAD_ATTEMPTS) -> bytes:
+    """Download an image without blocking the event loop
+
+    Streams the body on a pooled connection, retries connection errors and
+    transient statuses (429, 5xx) with backoff, and stops at max_bytes.
+
+    Raises:
+        ValueError: If the image cannot be downloaded or is too large
+    """
+    import asyncio
+    import httpx
+
+    client = get_async_download_client()
+    last_error = None
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(0.3 * 2 ** (attempt - 1))
+        try:
+            async with client.stream("GET", url) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    last_error = f"status {response.status_code}"
+                    continue
+                if response.status_code != 200:
+                    raise ValueError(f"Failed to download image: status {response.status_code}")
+                if int(response.headers.get("content-length") or 0) > max_bytes:
+                    raise ValueError(f"Image is larger than {max_bytes} bytes")
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(f"Image is larger than {max_bytes} bytes")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        except httpx.HTTPError as e:
+            last_error = str(e) or type(e).__name__
+    raise ValueError(f"Failed to download image after {attempts} attempts: {last_error}")
+
+async def read_generated_image(image) -> bytes:
+    """Get the bytes of one images.generate result
+
+    Results requested with response_format="b64_json" carry the image inline,
+    saving a second round trip; URL results are downloaded with download_image.
+    """
+    b64_data = getattr(image, "b64_json", None)
+    if b64_data:
+        return base64.b64decode(b64_data)
+    if not getattr(image, "url", None):
+        raise ValueError("Image generation returned no image")
+    return await download_image(image.url)
+
+# Remote images fetched by URL (e.g. template imports): largest body accepted
+# and how many redirects are followed
+MAX_REMOTE_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_REMOTE_REDIRECTS = 3
+
+def check_public_url(url: str):
+    """Check that a URL is http(s) and does not point at a private or local address
+    
+    Raises:
+        ValueError: If the URL may not be fetched
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("Only http and https image URLs are supported")
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+    except socket.gaierror:
+        raise ValueError(f"Could not resolve host {parsed.hostname}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"Host {parsed.hostname} is not a public address")
+
+def download_remote_image(url: str, max_bytes: int = MAX_REMOTE_IMAGE_BYTES) -> bytes:
+    """Download an image from a user-supplied URL
+    
+    Uses the shared session with HTTP_TIMEOUT, streams the body and stops at
+    max_bytes. Only public http(s) hosts are allowed, checked again on every
+    redirect.
+    
+    Raises:
+        ValueError: If the URL is not allowed, the download fails or the image is too large
+    """
+    session = get_http_session()
+    for _ in range(MAX_REMOTE_REDIRECTS + 1):
+        check_public_url(url)
+        with session.get(url, timeout=HTTP_TIMEOUT, stream=True, allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["location"])
+                continue
+            if response.status_code != 200:
+                raise ValueError(f"Failed to download image: HTTP {response.status_code}")
+            if int(response.headers.get("content-length") or 0) > max_bytes:
+                raise ValueError("Image is too large")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError("Image is too large")
+                chunks.append(chunk)
+            return b"".join(chunks)
+    raise ValueError("Too many redirects")
+
+# OpenAI: connection pool limits, timeouts in seconds, and how often the API key
+# is re-read from secrets so a rotated key is picked up
+OPENAI_MAX_CONNECTIONS = 64
+OPENAI_MAX_KEEPALIVE = 32
+OPENAI_TIMEOUT = 120
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_KEY_REFRESH_SECONDS = 300
+
+_openai_client = None
+_openai_key_hash: Optional[str] = None
+_openai_key_checked_at = 0.0
+_openai_client_lock = threading.Lock()
+
+def create_async_openai_client(api_key: str):
+    """Create an AsyncOpenAI client on a tuned httpx connection pool"""
+    # Imported here so modules that never call OpenAI do not need the SDK
+    import httpx
+    from openai import AsyncOpenAI
+
+    # HTTP/2 needs the optional h2 package
+    http2 = importlib.util.find_spec("h2") is not None
+
+    http_client = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=60
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=2)
+
+def get_async_openai_client():
+    """Get the shared AsyncOpenAI client
+
+    One client (and connection pool) is shared by every OpenAI call in the
+    process, so TLS connections are reused. The API key is re-read every
+    OPENAI_KEY_REFRESH_SECONDS and the client replaced if it changed.
+    """
+    global _openai_client, _openai_key_hash, _openai_key_checked_at
+    if _openai_client is not None and time.time() - _openai_key_checked_at < OPENAI_KEY_REFRESH_SECONDS:
+        return _openai_client
+
+    with _openai_client_lock:
+        if _openai_client is not None and time.time() - _openai_key_checked_at < OPENAI_KEY_REFRESH_SECONDS:
+            return _openai_client
+        try:
+            api_key = db.secrets.get("OPENAI_API_KEY")
+        except Exception as e:
+            # Keep the current client if the secret store is unavailable
+            if _openai_client is None:
+                raise
+            print(f"Error reading OPENAI_API_KEY: {str(e)}")
+            api_key = None
+
+        if api_key:
+            key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+            if key_hash != _openai_key_hash:
+                if _openai_client is not None:
+                    print("OPENAI_API_KEY changed, creating a new OpenAI client")
+                # The old client is left for in-flight requests to finish with
+                _openai_client = create_async_openai_client(api_key)
+                _openai_key_hash = key_hash
+        elif _openai_client is None:
+            raise ValueError("OPENAI_API_KEY not found in secrets")
+        _openai_key_checked_at = time.time()
+    return _openai_client
+
+# Binary storage prefixes for content-addressed template and showcase images
+TEMPLATE_IMAGE_PREFIX = "template_image_"
+SHOWCASE_IMAGE_PREFIX = "showcase_image_"
+
+# Base of the API routes in image URLs handed to clients. Relative by default:
+# the frontend reaches the API under /routes on its own origin. Set API_BASE_URL
+# explicitly when clients load images from another origin.
+API_BASE_URL = (os.environ.get("API_BASE_URL") or "/routes").rstrip("/")
+
+# Path of the unauthenticated media router that serves stored images (see app.apis.media)
+MEDIA_IMAGE_ROUTE = "/media/image"
+
+# Image URLs this app has handed out: the media route, and the per-router image
+# routes older records still reference
+_image_url_pattern = re.compile(r"/(?:media/image|templates/image|showcase/image)/([0-9a-f]{64})$")
+
+def get_media_url(image_hash: str) -> str:
+    """Get the URL that serves a stored image"""
+    return f"{API_BASE_URL}{MEDIA_IMAGE_ROUTE}/{image_hash}"
+
+def get_image_hash_from_url(url: Optional[str]) -> Optional[str]:
+    """Get the content hash from one of this app's image URLs, or None for other URLs"""
+    match = _image_url_pattern.search(url or "")
+    return match.group(1) if match else None
+
+# Content-addressed blob storage
+#
+# Images are stored in binary storage under "{prefix}{sha256}". The same bytes
+# always map to the same key, so blobs are written once and can be cached forever.
+
+# Blob keys we know are already in binary storage (avoids re-uploading)
+_stored_blob_keys = set()
+
+def get_image_media_type(image_bytes: bytes) -> str:
+    """Detect the media type of an image from its magic bytes"""
+    if image_bytes.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_bytes.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+def is_content_hash(value: str) -> bool:
+    """Check whether a string is a SHA-256 content hash"""
+    return bool(re.fullmatch(r"[0-9a-f]{64}", value or ""))
+
+def store_blob(prefix: str, data: bytes) -> str:
+    """Store bytes in binary storage under their content hash and return the hash"""
+    content_hash = hashlib.sha256(data).hexdigest()
+    storage_key = sanitize_storage_key(f"{prefix}{content_hash}")
+    if storage_key not in _stored_blob_keys:
+        db.storage.binary.put(storage_key, data)
+        _stored_blob_keys.add(storage_key)
+    return content_hash
+
+@lru_cache(maxsize=128)
+def load_blob(prefix: str, content_hash: str) -> bytes:
+    """Load a content-addressed blob (cached, blobs never change)"""
+    return db.storage.binary.get(sanitize_storage_key(f"{prefix}{content_hash}"))
+
+def blob_image_response(prefix: str, content_hash: str) -> Response:
+    """Serve a content-addressed image with immutable caching headers
+    
+    Raises:
+        FileNotFoundError: If the hash is malformed or no such blob exists
+    """
+    if not is_content_hash(content_hash):
+        raise FileNotFoundError(content_hash)
+    image_bytes = load_blob(prefix, content_hash)
+    return Response(
+        content=image_bytes,
+        media_type=get_image_media_type(image_bytes),
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{content_hash}"'
+        }
+    )
+
+def decode_data_url(url: str) -> Optional[bytes]:
+    """Decode a base64 data URL, or return None if the URL is not one"""
+    if not url or not url.startswith("data:") or "," not in url:
+        return None
+    return base64.b64decode(url.split(",", 1)[1])
+
+def store_template_image(image_bytes: bytes) -> str:
+    """Store a template image and return its content hash"""
+    return store_blob(TEMPLATE_IMAGE_PREFIX, image_bytes)
+
+def get_template_image_url(image_hash: str) -> str:
+    """Get the URL that serves a stored template image"""
+    return get_media_url(image_hash)
+
+# Template image URLs
+#
+# Stored templates only reference their images (and derivatives) by content
+# hash; URLs are built when templates are served, so stored records never
+# depend on where the API is hosted.
+
+def with_template_image_urls(template: Dict[str, Any]) -> Dict[str, Any]:
+    """Get a copy of a stored template with URLs for its stored images"""
+    if not template.get("image_hash") and not template.get("derivatives"):
+        return template
+    template = dict(template)
+    if template.get("image_hash"):
+        template["url"] = get_template_image_url(template["image_hash"])
+    if template.get("derivatives"):
+        template["derivatives"] = {
+            name: {
+                key: {**value, "url": get_template_image_url(value["hash"])}
+                if isinstance(value, dict) and value.get("hash") else value
+                for key, value in derivative.items()
+            }
+            for name, derivative in template["derivatives"].items()
+        }
+    return template
+
+def strip_template_image_urls(template: Dict[str, Any]) -> bool:
+    """Remove image URLs that can be rebuilt from hashes before a template is stored
+    
+    Returns:
+        True if the template was changed
+    """
+    changed = False
+    if template.get("image_hash") and "url" in template and (
+            not template["url"] or get_image_hash_from_url(template["url"])):
+        del template["url"]
+        changed = True
+    for derivative in template.get("derivatives", {}).values():
+        for value in derivative.values():
+            if isinstance(value, dict) and value.get("hash") and "url" in value:
+                del value["url"]
+                changed = True
+    return changed
+
+# HTTP caching helpers for read-heavy endpoints
+def make_etag(version: Union[str, bytes]) -> str:
+    """Build a strong ETag from a content version (a version string or the content itself)"""
+    if isinstance(version, str):
+        version = version.encode("utf-8")
+    return f'"{hashlib.sha256(version).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check whether an If-None-Match header matches an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def cached_json_response(request: Request, body: bytes, etag: str,
+                         max_age: int = 60, stale_while_revalidate: int = 86400) -> Response:
+    """Return a pre-serialized JSON body with caching headers, or 304 if the client has it
+    
+    Args:
+        request: Incoming request (for If-None-Match)
+        body: Serialized JSON body
+        etag: Strong ETag for the body
+        max_age: Seconds the response is fresh
+        stale_while_revalidate: Seconds a stale response may be served while revalidating
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Cursor pagination helpers
+# Cursor key element types: JSON numbers decode as int or float
+CURSOR_NUMBER = (int, float)
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    """Encode the last sort key of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(sort: str, cursor: str, key_types: Sequence) -> tuple:
+    """Decode an opaque cursor back into a sort key for the given order
+    
+    Args:
+        sort: The order being paged
+        cursor: next_cursor from the previous page
+        key_types: Expected type (or tuple of types) of each sort key element
+        
+    Raises:
+        HTTPException: 400 if the cursor is malformed or its key does not
+            match key_types, so it can never be compared against real keys
+    """
+    try:
+        cursor_sort, *key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail=f"Cursor does not belong to sort '{sort}'")
+    if len(key) != len(key_types) or any(
+        isinstance(value, bool) or not isinstance(value, value_type)
+        for value, value_type in zip(key, key_types)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(key)
+
 # Analytics functions
 def track_event(event_type: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
     """Track custom events like page views, button clicks, etc.
@@ -197,9 +645,152 @@ def get_analytics_data(template_manager=None, custom_stats_key: Optional[str] =
             "methods": {}
         }
 
+class TemplatesSnapshot(NamedTuple):
+    """Parsed templates together with their serialized form and ETag"""
+    templates: Dict[str, Any]
+    body: bytes
+    etag: str
+    loaded_at: float
+
+# Template listing: orderings, page size and how long usage counts are cached
+TEMPLATE_SORTS = ("default", "popular", "name", "newest")
+# Sort key element types of each ordering (see get_template_order)
+TEMPLATE_SORT_KEY_TYPES = {
+    "default": (int, str),
+    "popular": (int, str),
+    "name": (str, str),
+    "newest": (CURSOR_NUMBER, str)
+}
+DEFAULT_TEMPLATE_PAGE_SIZE = 50
+MAX_TEMPLATE_PAGE_SIZE = 200
+USAGE_CACHE_TTL = 60
+
+def get_template_thumbnail_url(template: Dict[str, Any]) -> Optional[str]:
+    """Get the smallest image URL for a template, falling back to the original"""
+    thumbnail = template.get("derivatives", {}).get("thumbnail", {})
+    return thumbnail.get("webp", {}).get("url") or thumbnail.get("jpeg", {}).get("url") or template.get("url")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated fields= parameter (None means all fields)"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+def project_template(template_id: str, template: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build a list entry for a template with only the requested fields
+    
+    Besides the stored fields, "id" and "thumbnail" are available; "id" is
+    always included.
+    """
+    if fields is None:
+        return {"id": template_id, **template, "thumbnail": get_template_thumbnail_url(template)}
+    
+    item = {"id": template_id}
+    for field in fields:
+        if field == "thumbnail":
+            item["thumbnail"] = get_template_thumbnail_url(template)
+        elif field in template:
+            item[field] = template[field]
+    return item
+
+def get_created_timestamp(template: Dict[str, Any]) -> float:
+    """Get a template's creation time as a timestamp (0 if unknown)"""
+    try:
+        return datetime.fromisoformat(template["created_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+class TemplateListParams(NamedTuple):
+    """Projection and pagination parameters for template list endpoints"""
+    fields: Optional[str]
+    sort: Optional[str]
+    limit: Optional[int]
+    cursor: Optional[str]
+    
+    def is_paged(self) -> bool:
+        """Whether any listing parameter was given"""
+        return any(value is not None for value in self)
+
+def template_list_params(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include, e.g. id,name,thumbnail"),
+    sort: Optional[Literal["default", "popular", "name", "newest"]] = Query(None, description="Listing order"),
+    limit: Optional[int] = Query(None, description="Templates per page", ge=1, le=MAX_TEMPLATE_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's next_cursor")
+) -> TemplateListParams:
+    """FastAPI dependency for the template list query parameters"""
+    return TemplateListParams(fields, sort, limit, cursor)
+
+def template_list_response(request: Request, template_manager: "TemplateManager",
+                           params: TemplateListParams) -> Response:
+    """Serve a template list endpoint
+    
+    Without any listing parameters this returns the full templates dict, as
+    the endpoints always have. With fields, sort, limit or cursor it returns
+    {"templates": [...], "next_cursor": ..., "total": ...} instead, so payload
+    size depends on the page size rather than the catalog size.
+    """
+    if not params.is_paged():
+        snapshot = template_manager.get_templates_snapshot()
+        return cached_json_response(request, snapshot.body, snapshot.etag)
+    
+    sort = params.sort or "default"
+    limit = params.limit or DEFAULT_TEMPLATE_PAGE_SIZE
+    items, next_cursor, total, version = template_manager.page_templates(
+        sort, limit, params.cursor, parse_fields(params.fields))
+    etag = make_etag(f"{version}|{params.fields}|{sort}|{limit}|{params.cursor}")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return cached_json_response(request, b"", etag)
+    body = json.dumps({"templates": items, "next_cursor": next_cursor, "total": total},
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return cached_json_response(request, body, etag)
+
+# Template catalogs shared across the APIs, by name
+TEMPLATE_CATALOGS = {
+    "faceswap": "meme_templates",
+    "meme_generator": "meme_generator_templates",
+    # gemini_transform shares the meme generator's catalog
+    "gemini": "meme_generator_templates"
+}
+
+# Callbacks run with the storage key after templates are written
+_template_listeners: List[Callable[[str], None]] = []
+
+def add_templates_listener(callback: Callable[[str], None]):
+    """Register a callback to run after templates under a storage key change"""
+    _template_listeners.append(callback)
+
+def get_template_manager(templates_key: str) -> Optional["TemplateManager"]:
+    """Find a template manager for a storage key
+    
+    Several modules create managers over the same catalog; the one that owns
+    the default templates is preferred, so a missing catalog is initialized
+    with real defaults.
+    """
+    managers = [manager for manager in TemplateManager._instances if manager.templates_key == templates_key]
+    if not managers:
+        return None
+    return max(managers, key=lambda manager: len(manager.default_templates))
+
+def invalidate_templates(templates_key: str):
+    """Invalidate cached templates for every manager using a storage key
+    
+    Call this after writing templates to storage outside of a TemplateManager.
+    """
+    for manager in TemplateManager._instances:
+        if manager.templates_key == templates_key:
+            manager.invalidate()
+    for callback in _template_listeners:
+        try:
+            callback(templates_key)
+        except Exception as e:
+            print(f"Error in templates listener: {str(e)}")
+
 class TemplateManager:
     """Centralized template management for all meme transformation APIs"""
     
+    # All template managers, so writes can invalidate every manager sharing a key
+    _instances: List["TemplateManager"] = []
+    
     def __init__(self, templates_key: str, usage_stats_key: str, default_templates: Dict[str, Any]):
         """Initialize the template manager
         
@@ -211,23 +802,159 @@ class TemplateManager:
         self.templates_key = templates_key
         self.usage_stats_key = usage_stats_key
         self.default_templates = default_templates
+        self._snapshot: Optional[TemplatesSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+        self._usage_counts: Dict[str, int] = {}
+        self._usage_loaded_at = 0.0
+        self._orders: Dict[str, Tuple[str, List[tuple]]] = {}
+        self._search_index = TemplateSearchIndex()
+        TemplateManager._instances.append(self)
     
     def initialize_templates(self) -> Dict[str, Any]:
         """Initialize templates for the first time or reset to defaults"""
         # Save templates to storage
         db.storage.json.put(sanitize_storage_key(self.templates_key), self.default_templates)
         print(f"Initialized {len(self.default_templates)} templates for {self.templates_key}")
+        self.invalidate()
         return self.default_templates
     
-    def get_templates(self) -> Dict[str, Any]:
-        """Get available templates"""
+    def load_templates(self) -> Dict[str, Any]:
+        """Read templates from storage, bypassing the in-memory cache"""
         try:
-            templates = db.storage.json.get(sanitize_storage_key(self.templates_key))
-            return templates
+            return db.storage.json.get(sanitize_storage_key(self.templates_key))
         except FileNotFoundError:
+            if not self.default_templates:
+                # Managers without defaults only read the catalog: leave seeding
+                # to the manager that owns the defaults, never write an empty one
+                owner = get_template_manager(self.templates_key)
+                if owner is None or not owner.default_templates:
+                    return {}
+                return owner.initialize_templates()
             # Initialize templates if they don't exist
             return self.initialize_templates()
     
+    def get_templates_snapshot(self) -> TemplatesSnapshot:
+        """Get templates with their serialized body and ETag
+        
+        Templates are cached for TEMPLATES_CACHE_TTL seconds. The body and ETag
+        are computed once per load, so cached responses never re-serialize.
+        """
+        snapshot = self._snapshot
+        if snapshot and time.time() - snapshot.loaded_at < TEMPLATES_CACHE_TTL:
+            return snapshot
+        
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            if snapshot and time.time() - snapshot.loaded_at < TEMPLATES_CACHE_TTL:
+                return snapshot
+            
+            templates = {
+                template_id: with_template_image_urls(template)
+                for template_id, template in self.load_templates().items()
+            }
+            body = json.dumps(templates, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._snapshot = TemplatesSnapshot(templates, body, make_etag(body), time.time())
+            return self._snapshot
+    
+    def get_templates(self) -> Dict[str, Any]:
+        """Get available templates
+        
+        The returned dict is shared with other callers and must not be mutated.
+        """
+        return self.get_templates_snapshot().templates
+    
+    def invalidate(self):
+        """Drop cached templates so the next read goes to storage"""
+        self._snapshot = None
+        self._orders = {}
+    
+    def get_search_index(self) -> TemplateSearchIndex:
+        """Get the search index, synced with the current templates
+        
+        After a write only the templates that changed are reindexed.
+        """
+        snapshot = self.get_templates_snapshot()
+        if self._search_index.version != snapshot.etag:
+            changed = self._search_index.sync(snapshot.templates, snapshot.etag)
+            if changed:
+                print(f"Reindexed {changed} templates for {self.templates_key}")
+        return self._search_index
+    
+    def get_usage_counts(self) -> Dict[str, int]:
+        """Get successful uses per template, cached for USAGE_CACHE_TTL seconds"""
+        if time.time() - self._usage_loaded_at >= USAGE_CACHE_TTL:
+            try:
+                stats = db.storage.json.get(sanitize_storage_key(self.usage_stats_key))
+            except FileNotFoundError:
+                stats = {}
+            self._usage_counts = {
+                template_id: data.get("count", 0)
+                for template_id, data in stats.get("templates", {}).items()
+            }
+            self._usage_loaded_at = time.time()
+        return self._usage_counts
+    
+    def get_template_order(self, sort: str) -> Tuple[str, List[tuple]]:
+        """Get the sorted keys for a listing order, rebuilt only when templates or usage change
+        
+        Every key ends with the template ID, so keys are unique and can be used
+        as pagination cursors.
+        
+        Returns:
+            Tuple of (version string for ETags, sorted keys)
+        """
+        snapshot = self.get_templates_snapshot()
+        version = snapshot.etag
+        if sort == "popular":
+            self.get_usage_counts()
+            version = f"{version}|{self._usage_loaded_at}"
+        
+        cached = self._orders.get(sort)
+        if cached and cached[0] == version:
+            return cached
+        
+        templates = snapshot.templates
+        if sort == "popular":
+            usage_counts = self.get_usage_counts()
+            keys = [(-usage_counts.get(template_id, 0), template_id) for template_id in templates]
+        elif sort == "name":
+            keys = [(template.get("name", template_id).casefold(), template_id) for template_id, template in templates.items()]
+        elif sort == "newest":
+            keys = [(-get_created_timestamp(template), template_id) for template_id, template in templates.items()]
+        else:
+            keys = [(position, template_id) for position, template_id in enumerate(templates)]
+        keys.sort()
+        
+        self._orders[sort] = (version, keys)
+        return version, keys
+    
+    def page_templates(self, sort: str = "default", limit: int = DEFAULT_TEMPLATE_PAGE_SIZE,
+                       cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str], int, str]:
+        """Get one page of templates in the given order
+        
+        Args:
+            sort: One of TEMPLATE_SORTS
+            limit: Page size (capped at MAX_TEMPLATE_PAGE_SIZE)
+            cursor: next_cursor from the previous page
+            fields: Fields to include in each entry (None for all)
+            
+        Returns:
+            Tuple of (entries, next_cursor, total templates, version string)
+        """
+        if sort not in TEMPLATE_SORTS:
+            raise HTTPException(status_code=400, detail=f"Unknown sort '{sort}'")
+        limit = max(1, min(limit, MAX_TEMPLATE_PAGE_SIZE))
+        
+        version, keys = self.get_template_order(sort)
+        start = bisect_right(keys, decode_cursor(sort, cursor, TEMPLATE_SORT_KEY_TYPES[sort])) if cursor else 0
+        page_keys = keys[start:start + limit]
+        has_more = start + limit < len(keys)
+        next_cursor = encode_cursor(sort, page_keys[-1]) if page_keys and has_more else None
+        
+        templates = self.get_templates()
+        items = [project_template(key[-1], templates[key[-1]], fields) for key in page_keys]
+        return items, next_cursor, len(keys), version
+    
     def get_template_prompt(self, template_id: str) -> str:
         """Get template prompt based on template_id"""
         templates = self.get_templates()
@@ -1,15 +1,18 @@
 import mediapipe as mp
 import cv2
 import numpy as np
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Response, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Response, Query, Request
 import databutton as db
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, NamedTuple
 import io
-import base64
 import time
 import json
 import re
 import uuid
+import threading
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from app.apis.openai import generate_meme_text, MemeGenerationRequest
 # Import image generation functions from the main OpenAI module
@@ -20,6 +23,10 @@ from app.apis.showcase import add_to_showcase
 from app.apis.image_generation import generate_viral_meme_image
 # Import common functions for analytics and template management
 from app.apis.common import sanitize_storage_key, TemplateManager, track_event as track_common_event, get_analytics_data
+from app.apis.common import template_list_params, template_list_response, TemplateListParams
+from app.apis.common import load_blob, TEMPLATE_IMAGE_PREFIX, get_http_session, HTTP_TIMEOUT
+from app.apis.image_processing import get_derivative_hash, normalize_image
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/faceswap")
 
@@ -99,63 +106,103 @@ def track_template_usage_extended(template_id: str, success: bool = True, error_
         # Don't let analytics errors disrupt the main functionality
         print(f"Error in extended template usage tracking: {str(e)}")
 
+# Key points for alignment (using more points for better accuracy)
+ALIGNMENT_LANDMARKS = [
+    # Eyes
+    33, 133,  # Left eye corners
+    362, 263,  # Right eye corners
+    # Nose
+    4, 5, 6,  # Nose bridge and tip
+    # Mouth
+    61, 291,  # Mouth corners
+    # Eyebrows
+    70, 105,  # Left eyebrow
+    336, 300  # Right eyebrow
+]
+
+# Jawline points (usually indices 0-16 in MediaPipe) and forehead points for the face mask
+OUTLINE_LANDMARKS = list(range(0, 17))
+FOREHEAD_LANDMARKS = [19, 24, 151, 337, 338, 396]
+
+# MediaPipe graphs are not thread-safe, and detection runs in worker threads
+_face_mesh_lock = threading.Lock()
+
 # Functions for face detection and transformation
 def detect_face_landmarks(image):
     """Detect facial landmarks using MediaPipe Face Mesh"""
     img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    results = mp_face_mesh.process(img_rgb)
+    with _face_mesh_lock:
+        results = mp_face_mesh.process(img_rgb)
     landmarks = results.multi_face_landmarks
     return landmarks
 
-def extract_face_mesh(landmarks, image_shape):
-    """Extract a more comprehensive set of facial landmarks from MediaPipe results"""
+def landmarks_to_points(landmarks) -> Optional[Dict[int, List[float]]]:
+    """Keep the normalized (x, y) coordinates of the landmarks used for swapping"""
     if not landmarks:
         return None
+    face = landmarks[0].landmark
+    return {
+        idx: [face[idx].x, face[idx].y]
+        for idx in ALIGNMENT_LANDMARKS + OUTLINE_LANDMARKS + FOREHEAD_LANDMARKS
+        if idx < len(face)
+    }
+
+def compute_template_landmarks(image_bytes: bytes) -> Optional[Dict[str, List[float]]]:
+    """Detect landmarks on a template image for storing with the template
     
-    # Get key points for alignment (using more points for better accuracy)
-    # We'll use more landmarks for better face alignment
-    key_points = [
-        # Eyes
-        33, 133,  # Left eye corners
-        362, 263,  # Right eye corners
-        # Nose
-        4, 5, 6,  # Nose bridge and tip
-        # Mouth
-        61, 291,  # Mouth corners
-        # Eyebrows
-        70, 105,  # Left eyebrow
-        336, 300  # Right eyebrow
-    ]
+    Coordinates are normalized, so they apply to every derivative size.
+    
+    Returns:
+        {landmark index: [x, y]} with string keys for JSON, or None if no face was found
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    points = landmarks_to_points(detect_face_landmarks(image))
+    if not points:
+        return None
+    return {str(idx): [round(x, 5), round(y, 5)] for idx, (x, y) in points.items()}
+
+def load_template_landmarks(template: Dict) -> Optional[Dict[int, List[float]]]:
+    """Get precomputed landmarks stored on a template, if any"""
+    stored = template.get("landmarks")
+    if not stored:
+        return None
+    return {int(idx): point for idx, point in stored.items()}
+
+def extract_face_mesh(points, image_shape):
+    """Extract the alignment landmarks in pixel coordinates"""
+    if not points:
+        return None
     
     # Extract the coordinates
-    points = []
-    for idx in key_points:
-        if idx < len(landmarks[0].landmark):
-            lm = landmarks[0].landmark[idx]
-            points.append([lm.x * image_shape[1], lm.y * image_shape[0]])
+    coordinates = []
+    for idx in ALIGNMENT_LANDMARKS:
+        if idx in points:
+            x, y = points[idx]
+            coordinates.append([x * image_shape[1], y * image_shape[0]])
     
-    return np.float32(points)
+    return np.float32(coordinates)
 
-def create_face_mask(landmarks, image_shape):
+def create_face_mask(points, image_shape):
     """Create a mask of the face area based on landmarks"""
-    if not landmarks:
+    if not points:
         return None
     
     mask = np.zeros(image_shape[:2], dtype=np.uint8)
     
     # Get face outline points
     face_outline = []
-    # Jawline points (usually indices 0-16 in MediaPipe)
-    for i in range(0, 17):
-        lm = landmarks[0].landmark[i]
-        face_outline.append([int(lm.x * image_shape[1]), int(lm.y * image_shape[0])])
+    for i in OUTLINE_LANDMARKS:
+        x, y = points[i]
+        face_outline.append([int(x * image_shape[1]), int(y * image_shape[0])])
     
     # Add some forehead points (approximate by extending above certain landmarks)
-    for i in [19, 24, 151, 337, 338, 396]:
-        lm = landmarks[0].landmark[i]
+    for i in FOREHEAD_LANDMARKS:
+        lm_x, lm_y = points[i]
         # Move these points up to create forehead outline
-        x = int(lm.x * image_shape[1])
-        y = int(lm.y * image_shape[0]) - 30  # Move up by 30 pixels
+        x = int(lm_x * image_shape[1])
+        y = int(lm_y * image_shape[0]) - 30  # Move up by 30 pixels
         face_outline.append([x, y])
     
     # Convert to numpy array and draw filled polygon
@@ -167,11 +214,17 @@ def create_face_mask(landmarks, image_shape):
     
     return mask
 
-def meme_face_swap(user_image, meme_template_image):
-    """Swap faces between user image and meme template with improved blending"""
+def meme_face_swap(user_image, meme_template_image, template_landmarks=None):
+    """Swap faces between user image and meme template with improved blending
+    
+    Args:
+        user_image: User image (BGR)
+        meme_template_image: Template image (BGR)
+        template_landmarks: Precomputed template landmarks; detected if not given
+    """
     # Detect facial landmarks
-    user_landmarks = detect_face_landmarks(user_image)
-    meme_landmarks = detect_face_landmarks(meme_template_image)
+    user_landmarks = landmarks_to_points(detect_face_landmarks(user_image))
+    meme_landmarks = template_landmarks or landmarks_to_points(detect_face_landmarks(meme_template_image))
 
     if not user_landmarks or not meme_landmarks:
         raise ValueError("Face detection failed on one of the images. Make sure faces are clearly visible.")
@@ -226,37 +279,154 @@ def meme_face_swap(user_image, meme_template_image):
 
     return blended_image
 
-def generate_meme(user_image_bytes, meme_template_image_bytes):
-    """Generate meme from user image and template image bytes"""
+# Images are resized to at most this size for consistent processing
+MAX_SWAP_DIMENSION = 1024
+
+def limit_image_size(image, max_dimension: int = MAX_SWAP_DIMENSION):
+    """Downscale an OpenCV image if it is larger than max_dimension"""
+    height, width = image.shape[:2]
+    if max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)))
+    return image
+
+def decode_template_image(image_bytes: bytes):
+    """Decode and resize a template image for face swapping (None if undecodable)"""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return limit_image_size(image)
+
+def generate_meme(user_image_bytes, meme_template_image_bytes, template_landmarks=None, meme_template_image=None):
+    """Generate meme from user image and template image bytes
+    
+    Args:
+        user_image_bytes: Encoded user image
+        meme_template_image_bytes: Encoded template image
+        template_landmarks: Precomputed template landmarks, if any
+        meme_template_image: Already decoded template (from the template cache), if any
+    """
     user_image = cv2.imdecode(np.frombuffer(user_image_bytes, np.uint8), cv2.IMREAD_COLOR)
-    meme_template_image = cv2.imdecode(np.frombuffer(meme_template_image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if meme_template_image is None:
+        meme_template_image = decode_template_image(meme_template_image_bytes)
 
     if user_image is None:
         raise ValueError("Invalid user image.")
     if meme_template_image is None:
         raise ValueError("Invalid meme template image.")
 
-    # Resize images for consistent processing if they're too large
-    max_dimension = 1024
-    user_h, user_w = user_image.shape[:2]
-    template_h, template_w = meme_template_image.shape[:2]
-    
-    # Resize user image if needed
-    if max(user_h, user_w) > max_dimension:
-        scale = max_dimension / max(user_h, user_w)
-        user_image = cv2.resize(user_image, (int(user_w * scale), int(user_h * scale)))
-    
-    # Resize template image if needed
-    if max(template_h, template_w) > max_dimension:
-        scale = max_dimension / max(template_h, template_w)
-        meme_template_image = cv2.resize(meme_template_image, (int(template_w * scale), int(template_h * scale)))
+    # Resize the user image for consistent processing if it's too large
+    user_image = limit_image_size(user_image)
 
-    result_image = meme_face_swap(user_image, meme_template_image)
+    result_image = meme_face_swap(user_image, meme_template_image, template_landmarks)
     _, result_img_encoded = cv2.imencode('.png', result_image)
     
     return result_img_encoded.tobytes()
 
-# We'll use template_manager.get_templates() instead of initialize_templates()
+# Decoded template images kept in memory, most recently used last
+TEMPLATE_CACHE_SIZE = 64
+
+# Startup warm-up: parallel fetches, and how long startup waits before letting it finish in the background
+WARMUP_WORKERS = 8
+WARMUP_TIMEOUT = 30
+
+class CachedTemplateImage(NamedTuple):
+    """A template image held in memory, encoded and decoded"""
+    source: str
+    image_bytes: bytes
+    decoded: Optional[np.ndarray]
+
+_template_cache: "OrderedDict[str, CachedTemplateImage]" = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+def get_template_source(template: Dict) -> str:
+    """Identify the image a template currently uses, so cache entries expire on image changes"""
+    return get_derivative_hash(template, "working") or template.get("image_hash") or template.get("url", "")
+
+def get_legacy_template_key(template_id: str) -> str:
+    """Storage key of a template image stored before content-addressed storage"""
+    return sanitize_storage_key(f"template_{template_id}_image")
+
+def fetch_template_image(template_id: str, template: Dict) -> bytes:
+    """Load a template image from storage
+    
+    Raises:
+        ValueError: If the image is not in storage (legacy templates are stored
+            by resolve_legacy_template_images during warm-up)
+    """
+    # Admin-added templates reference content-addressed images; prefer the
+    # working-size derivative, which is already small enough for face swapping
+    for image_hash in (get_derivative_hash(template, "working"), template.get("image_hash")):
+        if not image_hash:
+            continue
+        try:
+            return load_blob(TEMPLATE_IMAGE_PREFIX, image_hash)
+        except FileNotFoundError:
+            print(f"Template image {image_hash} for {template_id} not found in storage")
+    
+    try:
+        return db.storage.binary.get(get_legacy_template_key(template_id))
+    except FileNotFoundError:
+        raise ValueError(f"Template image for {template_id} is not in storage yet")
+
+def resolve_legacy_template_images(templates: Dict[str, Dict]) -> Dict[str, int]:
+    """Store the images of legacy templates under their canonical keys, once
+    
+    Templates without a content-addressed image used to be stored as either
+    template_{id}_image or template_{id}, or not at all. Existence is checked
+    with a single listing; images under the old key are copied and missing
+    ones are downloaded from the template URL, so requests only ever read
+    template_{id}_image.
+    
+    Returns:
+        Counts of templates already stored, copied, downloaded and failed
+    """
+    legacy = {template_id: template for template_id, template in templates.items() if not template.get("image_hash")}
+    results = {"stored": 0, "copied": 0, "downloaded": 0, "failed": 0}
+    if not legacy:
+        return results
+    
+    stored_keys = {stored_file.name for stored_file in db.storage.binary.list()}
+    for template_id, template in legacy.items():
+        template_key = get_legacy_template_key(template_id)
+        if template_key in stored_keys:
+            results["stored"] += 1
+            continue
+        try:
+            alt_key = sanitize_storage_key(f"template_{template_id}")
+            if alt_key in stored_keys:
+                image_bytes = db.storage.binary.get(alt_key)
+                results["copied"] += 1
+            else:
+                response = get_http_session().get(template["url"], timeout=HTTP_TIMEOUT)
+                if response.status_code != 200:
+                    raise ValueError(f"HTTP {response.status_code}")
+                image_bytes = response.content
+                results["downloaded"] += 1
+            db.storage.binary.put(template_key, image_bytes)
+        except Exception as e:
+            print(f"Error storing image for template {template_id}: {str(e)}")
+            results["failed"] += 1
+    return results
+
+def cache_template_image(template_id: str, source: str, image_bytes: bytes) -> CachedTemplateImage:
+    """Decode a template image and keep it in the LRU template cache"""
+    entry = CachedTemplateImage(source, image_bytes, decode_template_image(image_bytes))
+    with _template_cache_lock:
+        _template_cache[template_id] = entry
+        _template_cache.move_to_end(template_id)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return entry
+
+def get_cached_template(template_id: str, template: Dict) -> Optional[CachedTemplateImage]:
+    """Get a template's cached image if it is still current"""
+    with _template_cache_lock:
+        entry = _template_cache.get(template_id)
+        if entry is None or entry.source != get_template_source(template):
+            return None
+        _template_cache.move_to_end(template_id)
+        return entry
 
 # Get template data and image
 def get_template(template_id: str):
@@ -266,48 +436,67 @@ def get_template(template_id: str):
         raise ValueError(f"Template '{template_id}' not found")
     
     template = templates[template_id]
-    template_key = f"template_{template_id}_image"
-    sanitized_key = sanitize_storage_key(template_key)
+    entry = get_cached_template(template_id, template)
+    if entry is None:
+        entry = cache_template_image(template_id, get_template_source(template), fetch_template_image(template_id, template))
+    return template, entry.image_bytes
+
+def get_decoded_template(template_id: str):
+    """Get the decoded template image from the cache (None if it is not cached)"""
+    templates = template_manager.get_templates()
+    if template_id not in templates:
+        return None
+    entry = get_cached_template(template_id, templates[template_id])
+    return entry.decoded if entry else None
+
+def warm_template_cache() -> Dict[str, int]:
+    """Fetch template images ahead of the first request
     
-    print(f"Looking for template {template_id} with key {sanitized_key}")
+    Legacy template images are first stored under their canonical keys (see
+    resolve_legacy_template_images), then the most used templates are loaded
+    and decoded into the template cache.
     
-    try:
-        # First try with the _image suffix
-        try:
-            image_bytes = db.storage.binary.get(sanitized_key)
-            print(f"Found template image with key {sanitized_key}")
-        except FileNotFoundError:
-            # Then try without the _image suffix
-            alt_key = sanitize_storage_key(f"template_{template_id}")
-            print(f"Template image not found with key {sanitized_key}, trying {alt_key}")
-            image_bytes = db.storage.binary.get(alt_key)
-            
-            # Store it with the correct key for next time
-            print(f"Found template with alternate key {alt_key}, copying to {sanitized_key}")
-            db.storage.binary.put(sanitized_key, image_bytes)
-    except FileNotFoundError:
-        # If not cached, fetch from URL
-        print(f"Template not found in storage, fetching from URL: {template['url']}")
-        try:
-            import requests
-            response = requests.get(template["url"])
-            if response.status_code != 200:
-                raise ValueError(f"Failed to fetch template image for {template_id}: HTTP {response.status_code}")
-            image_bytes = response.content
-            # Cache for future use
-            db.storage.binary.put(sanitized_key, image_bytes)
-            print(f"Downloaded and stored template image for {template_id}")
-        except Exception as e:
-            print(f"Error fetching template: {str(e)}")
-            raise ValueError(f"Error fetching template: {str(e)}")
+    Returns:
+        Counts of cached and failed templates, and of legacy images resolved
+    """
+    start_time = time.time()
+    templates = template_manager.get_templates()
+    usage_counts = template_manager.get_usage_counts()
+    ordered = sorted(templates, key=lambda template_id: -usage_counts.get(template_id, 0))
     
-    return template, image_bytes
+    legacy = resolve_legacy_template_images(templates)
+    results = {"cached": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="template-warmup") as executor:
+        futures = {executor.submit(get_template, template_id): template_id for template_id in ordered[:TEMPLATE_CACHE_SIZE]}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                results["cached"] += 1
+            except Exception as e:
+                print(f"Error warming template {futures[future]}: {str(e)}")
+                results["failed"] += 1
+    
+    results.update({f"legacy_{name}": count for name, count in legacy.items()})
+    print(f"Warmed {len(templates)} templates in {time.time() - start_time:.2f}s: {results}")
+    return results
+
+@router.on_event("startup")
+async def start_template_warmup():
+    """Warm the template cache at startup, waiting at most WARMUP_TIMEOUT seconds"""
+    warmup = asyncio.ensure_future(run_in_threadpool(warm_template_cache))
+    done, _ = await asyncio.wait({warmup}, timeout=WARMUP_TIMEOUT)
+    if not done:
+        print(f"Template warm-up still running after {WARMUP_TIMEOUT}s, continuing in the background")
 
 # API endpoints
 @router.get("/templates")
-def get_templates():
-    """Get available meme templates"""
-    return template_manager.get_templates()
+def get_templates(request: Request, params: TemplateListParams = Depends(template_list_params)):
+    """Get available meme templates
+    
+    Pass fields, sort, limit or cursor to get a paginated list instead of the
+    full templates dict.
+    """
+    return template_list_response(request, template_manager, params)
 
 @router.post("/transform")
 async def transform_image(
@@ -355,6 +544,14 @@ async def transform_image(
             track_template_usage_extended(template_id, False, "empty_file")
             raise HTTPException(status_code=400, detail="Empty image file")
         
+        # Normalize once so every transformation path gets upright, 8-bit sRGB
+        # input of bounded size without metadata
+        try:
+            user_image_bytes = (await run_in_threadpool(normalize_image, user_image_bytes)).data
+        except ValueError as e:
+            track_template_usage_extended(template_id, False, "invalid_image")
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Get template info (we need this regardless of transformation method)
         try:
             template, template_image_bytes = get_template(template_id)
@@ -404,7 +601,7 @@ async def transform_image(
                     # Fallback to traditional method as last resort
                     print("Falling back to traditional face swap method")
                     try:
-                        result_bytes = generate_meme(user_image_bytes, template_image_bytes)
+                        result_bytes = generate_meme(user_image_bytes, template_image_bytes, load_template_landmarks(template), get_decoded_template(template_id))
                         transform_method = "opencv_fallback"
                     except ValueError as fallback_error:
                         # Handle errors from traditional method
@@ -434,7 +631,7 @@ async def transform_image(
         else:
             # Use traditional OpenCV-based method
             try:
-                result_bytes = generate_meme(user_image_bytes, template_image_bytes)
+                result_bytes = generate_meme(user_image_bytes, template_image_bytes, load_template_landmarks(template), get_decoded_template(template_id))
                 transform_method = "opencv"
             except ValueError as e:
                 # More specific error handling for face detection issues
@@ -517,13 +714,10 @@ async def transform_image(
                 print(f"Warning: Could not add caption to headers: {str(e)}")
                 # Continue without caption headers rather than failing the request
         
-        # Convert result bytes to base64 data URL for showcase if needed
-        image_data_url = f"data:image/png;base64,{base64.b64encode(result_bytes).decode('utf-8')}"
-        
         # Add to public showcase with 50% probability (for demo purposes)
         # In production you'd use quality metrics or user opt-in
         try:
-            templates = get_templates()
+            templates = template_manager.get_templates()
             if template_id in templates:
                 template = templates[template_id]
                 if np.random.random() > 0.5:  # Add ~50% of transformations to showcase
@@ -532,7 +726,7 @@ async def transform_image(
                         template_name=template["name"],
                         template_description=template["description"],
                         template_url=template["url"],
-                        result_url=image_data_url,
+                        result_bytes=result_bytes,
                         caption=caption
                     )
         except Exception as e:
@@ -586,8 +780,8 @@ async def track_faceswap_event(event_data: dict):
 
 # Create a public endpoint version of templates that doesn't require authentication
 @router.get("/templates/public", operation_id="get_templates_public2")
-def get_templates_public2():
+def get_templates_public2(request: Request, params: TemplateListParams = Depends(template_list_params)):
     """Get available meme templates - publicly accessible endpoint"""
-    return get_templates()
+    return get_templates(request, params)
 
 # No need to explicitly initialize templates, the TemplateManager handles this
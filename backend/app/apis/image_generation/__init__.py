@@ -1,16 +1,20 @@
 from typing import Optional, Dict, Any, List, Tuple, Union
 import time
-import base64
 import io
 from PIL import Image
-import requests
-from openai import OpenAI
 import databutton as db
 import re
 
 # Create a router for the image_generation module
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+
+from app.apis.common import get_async_openai_client, download_image, read_generated_image
+from app.apis.model_router import image_router
+from app.apis.vision_cache import vision_cache, get_image_hash, DESCRIPTION, MEME_RESULT
+from app.apis.image_processing import prepare_provider_image
+from app.apis.single_flight import ai_flights, get_fingerprint
 
 router = APIRouter(prefix="/image-generation")
 
@@ -41,13 +45,21 @@ PRIMARY_MODEL = "gpt-4o"  # Main model (highest quality)
 BACKUP_MODEL = "dall-e-3"   # Backup model for image generation
 MODEL_USAGE_KEY = "openai_model_usage"
 
+# Per-model timeouts for meme image generation, so a hanging model fails over;
+# GPT-4o makes two calls (describe, then generate), so it gets longer
+IMAGE_TIMEOUTS = {PRIMARY_MODEL: 90, BACKUP_MODEL: 60}
+
+# DALL-E 3 prompts are limited to 4000 characters, so long image descriptions are cut
+MAX_DESCRIPTION_CHARS = 3000
+
 # Helper function to sanitize storage keys
 def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
 # Function to track model performance and usage - same as in __init__.py
-def track_model_performance(model: str, processing_time: float, success: bool = True, error: str = None):
+def track_model_performance(model: str, processing_time: float, success: bool = True, error: str = None,
+                            routing: str = None):
     """Track model performance for analytics"""
     import json
     from datetime import datetime
@@ -85,6 +97,11 @@ def track_model_performance(model: str, processing_time: float, success: bool =
             model_stats["total_time"] = model_stats.get("total_time", 0) + processing_time
         model_stats["last_used"] = datetime.now().isoformat()
         
+        # Track routing decisions
+        if routing:
+            routing_stats = model_stats.setdefault("routing", {})
+            routing_stats[routing] = routing_stats.get(routing, 0) + 1
+        
         # Track errors
         if not success and error:
             if error not in stats["errors"]:
@@ -99,59 +116,65 @@ def track_model_performance(model: str, processing_time: float, success: bool =
 
 # Initialize OpenAI client
 def get_openai_client():
-    """Get OpenAI client with API key"""
-    api_key = db.secrets.get("OPENAI_API_KEY")
-    return OpenAI(api_key=api_key)
+    """Get the shared AsyncOpenAI client (pooled connections, cached API key)"""
+    return get_async_openai_client()
 
 # Image generation with GPT-4o Vision
-async def generate_meme_image_with_gpt4o(client, user_image_bytes, template_id, character_name, style_description):
+async def generate_meme_image_with_gpt4o(client, user_image_bytes, template_id, character_name, style_description,
+                                         routing=None):
     """Generate a meme image using GPT-4o Vision
     
     Args:
-        client: OpenAI client
+        client: AsyncOpenAI client
         user_image_bytes: User's image as bytes
         template_id: The ID of the meme template
         character_name: Name of the character (e.g., "Pepe the Frog")
         style_description: Description of the character style
+        routing: Routing decision to record with the model's performance
         
     Returns:
         Generated image bytes
     """
     try:
-        # Convert image to base64 for API
-        base64_image = base64.b64encode(user_image_bytes).decode('utf-8')
-        
         # Start tracking processing time
         start_time = time.time()
         
-        response = client.chat.completions.create(
-            model=PRIMARY_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are an expert AI artist specializing in viral meme transformations. "
-                               f"Your task is to transform the given photo into a {character_name} meme while "
-                               f"preserving the person's pose, clothing, and composition. "
-                               f"Style details: {style_description}"
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"Transform this person into a {character_name} viral meme character. "
-                                               f"Keep the same pose, clothing, and background. "
-                                               f"Make it look like an authentic viral meme."},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
+        # Reuse the reply for this image and character if it was generated recently
+        image_hash = get_image_hash(user_image_bytes)
+        result_params = f"{character_name}|{style_description}"
+        generation_result = vision_cache.get(image_hash, MEME_RESULT, result_params)
+        if generation_result is None:
+            # Downscale and re-encode the image to what GPT-4o actually looks at
+            vision_image = await run_in_threadpool(prepare_provider_image, user_image_bytes, "openai")
+            response = await client.chat.completions.create(
+                model=PRIMARY_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": f"You are an expert AI artist specializing in viral meme transformations. "
+                                   f"Your task is to transform the given photo into a {character_name} meme while "
+                                   f"preserving the person's pose, clothing, and composition. "
+                                   f"Style details: {style_description}"
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": f"Transform this person into a {character_name} viral meme character. "
+                                                   f"Keep the same pose, clothing, and background. "
+                                                   f"Make it look like an authentic viral meme."},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": vision_image.to_data_url()}
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=1000
+            )
         
-        # Extract the response
-        generation_result = response.choices[0].message.content
+            # Extract the response
+            generation_result = response.choices[0].message.content or ""
+            vision_cache.put(image_hash, MEME_RESULT, generation_result, result_params)
         
         # Check if the result contains an image URL
         if "image.png" in generation_result or "https://" in generation_result:
@@ -165,18 +188,21 @@ async def generate_meme_image_with_gpt4o(client, user_image_bytes, template_id,
                 image_url = re.sub(r'[)\]\'"]$', '', image_url)
                 
                 # Download the image
-                img_response = requests.get(image_url)
-                if img_response.status_code == 200:
+                try:
+                    image_bytes = await download_image(image_url)
+                except ValueError as e:
+                    print(f"Failed to download GPT-4o image: {str(e)}")
+                else:
                     # Process successful - track performance
                     processing_time = time.time() - start_time
-                    track_model_performance(PRIMARY_MODEL, processing_time, success=True)
+                    track_model_performance(PRIMARY_MODEL, processing_time, success=True, routing=routing)
                     
-                    return img_response.content, PRIMARY_MODEL
+                    return image_bytes, PRIMARY_MODEL
         
         # If we couldn't find or process an image URL, fall back to DALL-E
         print(f"GPT-4o Vision couldn't generate a usable image. Falling back to {BACKUP_MODEL}")
         track_model_performance(PRIMARY_MODEL, time.time() - start_time, 
-                               success=False, error="no_image_url_found")
+                               success=False, error="no_image_url_found", routing=routing)
         
         # Return None to indicate we need to fall back to DALL-E
         return None, None
@@ -184,58 +210,66 @@ async def generate_meme_image_with_gpt4o(client, user_image_bytes, template_id,
     except Exception as e:
         # Log the error and track
         print(f"Error in GPT-4o Vision image generation: {str(e)}")
-        track_model_performance(PRIMARY_MODEL, 0, success=False, error=str(e))
+        track_model_performance(PRIMARY_MODEL, 0, success=False, error=str(e), routing=routing)
         
         # Return None to indicate fallback
         return None, None
 
 # Image generation with DALL-E 3
-async def generate_meme_image_with_dalle(client, user_image_bytes, template_id, character_name, style_description):
+async def generate_meme_image_with_dalle(client, user_image_bytes, template_id, character_name, style_description,
+                                         routing=None):
     """Generate a meme image using DALL-E 3 as a fallback
     
     Args:
-        client: OpenAI client
+        client: AsyncOpenAI client
         user_image_bytes: User's image as bytes
         template_id: The ID of the meme template
         character_name: Name of the character (e.g., "Pepe the Frog")
         style_description: Description of the character style
+        routing: Routing decision to record with the model's performance
         
     Returns:
         Generated image bytes
     """
     try:
-        # Convert user image to base64 for reference (we can't feed it directly to DALL-E)
-        # But we will describe the image
+        # We can't feed the user image directly to DALL-E, so we describe it instead
         
         # Start tracking processing time
         start_time = time.time()
         
-        # First, use GPT-4o to describe the image for DALL-E
-        base64_image = base64.b64encode(user_image_bytes).decode('utf-8')
-        
-        description_response = client.chat.completions.create(
-            model="gpt-4o",  # Using GPT-4o to describe the image
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that describes images in detail for image generation."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Describe this person's appearance, pose, clothing, and background in detail. "
-                                             "Focus only on visible elements that would be important for recreating the image."},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
+        # Reuse a description already written for this image
+        image_hash = get_image_hash(user_image_bytes)
+        image_description = vision_cache.get(image_hash, DESCRIPTION)
+        if image_description is None:
+            # First, use GPT-4o to describe the image for DALL-E
+            vision_image = await run_in_threadpool(prepare_provider_image, user_image_bytes, "openai")
+            description_response = await client.chat.completions.create(
+                model="gpt-4o",  # Using GPT-4o to describe the image
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant that describes images in detail for image generation."
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Describe this person's appearance, pose, clothing, and background in detail. "
+                                                 "Focus only on visible elements that would be important for recreating the image."},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": vision_image.to_data_url()}
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=500
+            )
         
-        image_description = description_response.choices[0].message.content
+            image_description = description_response.choices[0].message.content
+            vision_cache.put(image_hash, DESCRIPTION, image_description)
+        else:
+            print("Reusing cached image description for DALL-E")
+        image_description = image_description[:MAX_DESCRIPTION_CHARS]
         
         # Now use DALL-E to generate the image based on the description
         prompt = (
@@ -243,36 +277,27 @@ async def generate_meme_image_with_dalle(client, user_image_bytes, template_id,
             f"Style: {style_description}. Make it look exactly like a viral meme, with the same pose and clothing as described."
         )
         
-        dalle_response = client.images.generate(
+        dalle_response = await client.images.generate(
             model=BACKUP_MODEL,
             prompt=prompt,
             size="1024x1024",
             quality="standard",
             n=1,
+            response_format="b64_json",  # Image comes back inline, no second download
         )
         
-        # Get the image URL
-        image_url = dalle_response.data[0].url
+        image_bytes = await read_generated_image(dalle_response.data[0])
         
-        # Download the generated image
-        img_response = requests.get(image_url)
-        if img_response.status_code == 200:
-            # Process successful - track performance
-            processing_time = time.time() - start_time
-            track_model_performance(BACKUP_MODEL, processing_time, success=True)
-            
-            return img_response.content, BACKUP_MODEL
-        else:
-            # Failed to download image
-            print(f"Failed to download DALL-E image: {img_response.status_code}")
-            track_model_performance(BACKUP_MODEL, time.time() - start_time, 
-                                  success=False, error=f"download_failed_{img_response.status_code}")
-            return None, None
+        # Process successful - track performance
+        processing_time = time.time() - start_time
+        track_model_performance(BACKUP_MODEL, processing_time, success=True, routing=routing)
+        
+        return image_bytes, BACKUP_MODEL
         
     except Exception as e:
         # Log the error and track
         print(f"Error in DALL-E image generation: {str(e)}")
-        track_model_performance(BACKUP_MODEL, 0, success=False, error=str(e))
+        track_model_performance(BACKUP_MODEL, 0, success=False, error=str(e), routing=routing)
         
         # Return None to indicate failure
         return None, None
@@ -281,6 +306,8 @@ async def generate_meme_image_with_dalle(client, user_image_bytes, template_id,
 async def generate_viral_meme_image(user_image_bytes, template_id):
     """Generate a viral meme image with fallback between models
     
+    Concurrent calls with the same image and template share one generation.
+    
     Args:
         user_image_bytes: User's image as bytes
         template_id: The ID of the meme template
@@ -288,6 +315,14 @@ async def generate_viral_meme_image(user_image_bytes, template_id):
     Returns:
         Tuple of (generated image bytes, model used)
     """
+    result, _ = await ai_flights.run(
+        get_fingerprint("viral_meme", user_image_bytes, template_id),
+        lambda: _generate_viral_meme_image(user_image_bytes, template_id)
+    )
+    return result
+
+async def _generate_viral_meme_image(user_image_bytes, template_id):
+    """Generate a viral meme image, trying the healthiest image model first"""
     # Template-specific details for better results
     template_details = {
         "doge": {
@@ -320,27 +355,35 @@ async def generate_viral_meme_image(user_image_bytes, template_id):
     
     client = get_openai_client()
     
-    # First try with GPT-4o Vision (primary model)
-    result_image, model_used = await generate_meme_image_with_gpt4o(
-        client, 
-        user_image_bytes, 
-        template_id, 
-        details["name"], 
-        details["description"]
-    )
+    # When GPT-4o Vision has already analysed this image (the faceswap chain tries
+    # the vision transform first), its person description is cached: go straight
+    # to DALL-E instead of paying for another GPT-4o vision call
+    models = [PRIMARY_MODEL, BACKUP_MODEL]
+    if vision_cache.get(get_image_hash(user_image_bytes), DESCRIPTION) is not None:
+        models = [BACKUP_MODEL]
     
-    # If GPT-4o failed, try with DALL-E
-    if result_image is None:
-        result_image, model_used = await generate_meme_image_with_dalle(
+    # The image router tries GPT-4o Vision first unless its circuit is open,
+    # in which case requests go straight to DALL-E (with occasional probes)
+    async def generate(model: str, routing: str):
+        generator = generate_meme_image_with_gpt4o if model == PRIMARY_MODEL else generate_meme_image_with_dalle
+        result_image, model_used = await generator(
             client, 
             user_image_bytes, 
             template_id, 
             details["name"], 
-            details["description"]
+            details["description"],
+            routing=routing
         )
+        if result_image is None:
+            raise ValueError(f"{model} did not produce an image")
+        return result_image, model_used
     
-    # If both failed, raise an exception
-    if result_image is None:
-        raise ValueError("Failed to generate image with both primary and backup models")
+    try:
+        (result_image, model_used), _, _ = await image_router.run(
+            models, generate, IMAGE_TIMEOUTS, pass_decision=True
+        )
+    except Exception as e:
+        # If both failed, raise an exception
+        raise ValueError("Failed to generate image with both primary and backup models") from e
     
     return result_image, model_used
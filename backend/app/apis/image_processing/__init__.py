@@ -0,0 +1,261 @@
+import io
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, NamedTuple, Tuple
+from PIL import Image, ImageCms, ImageOps
+
+# Import common functions for content-addressed image storage
+from app.apis.common import store_template_image
+
+# Template derivatives generated at upload time (longest edge in pixels)
+TEMPLATE_DERIVATIVE_SIZES = {
+    "thumbnail": 160,
+    "card": 480,
+    "working": 1024
+}
+
+# Output formats for each derivative: (PIL format, save options)
+TEMPLATE_DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True})
+}
+
+# Uploads are capped to this size (longest edge in pixels) during normalization
+MAX_UPLOAD_DIMENSION = 2048
+
+# Refuse to decode images larger than this many pixels (decompression bombs)
+MAX_UPLOAD_PIXELS = 50_000_000
+
+_SRGB_PROFILE = ImageCms.createProfile("sRGB")
+
+# What each AI provider actually looks at: images are downscaled to fit
+# (longest edge, and for OpenAI the shortest edge it tiles at in high detail)
+# before upload, since anything larger only costs upload time and tokens
+PROVIDER_IMAGE_PROFILES = {
+    "openai": {"max_dimension": 2048, "max_short_side": 768, "quality": 85},
+    "gemini": {"max_dimension": 1536, "max_short_side": None, "quality": 85}
+}
+
+# Encoded provider payloads kept in memory, keyed by input hash and provider
+PROVIDER_IMAGE_CACHE_SIZE = 64
+
+_provider_images: "OrderedDict[Tuple[str, str], ProviderImage]" = OrderedDict()
+_provider_images_lock = threading.Lock()
+
+# Worker pool for image encoding; Pillow releases the GIL while resizing and encoding
+_image_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image-processing")
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """Decode image bytes into a fully loaded Pillow image"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    return image
+
+def resize_to_fit(image: Image.Image, max_dimension: int) -> Image.Image:
+    """Downscale an image so its longest edge is at most max_dimension"""
+    width, height = image.size
+    scale = max_dimension / max(width, height)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+def flatten_alpha(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    """Composite an image with transparency onto a solid background"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, background)
+        flattened.paste(image, mask=image.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    """Encode an image in one of the derivative formats"""
+    pil_format, options = TEMPLATE_DERIVATIVE_FORMATS[image_format]
+    if pil_format == "JPEG":
+        image = flatten_alpha(image)
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+def render_derivative(image: Image.Image, max_dimension: int, image_format: str) -> Tuple[bytes, Tuple[int, int]]:
+    """Resize and encode one derivative
+
+    Returns:
+        Tuple of (encoded bytes, (width, height))
+    """
+    resized = resize_to_fit(image, max_dimension)
+    return encode_image(resized, image_format), resized.size
+
+class NormalizedImage(NamedTuple):
+    """An upload decoded, cleaned up and re-encoded once for every downstream consumer"""
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+    content_hash: str
+
+def convert_to_srgb(image: Image.Image) -> Image.Image:
+    """Convert an image to 8-bit sRGB (RGBA when it has transparency)"""
+    # 16-bit and 32-bit grayscale: scale down to 8 bits per channel
+    if image.mode in ("I;16", "I;16B", "I;16L", "I"):
+        image = image.point(lambda value: value * (1 / 256)).convert("L")
+    elif image.mode == "F":
+        image = image.convert("L")
+
+    # Apply an embedded color profile (e.g. CMYK or Adobe RGB) so colors stay correct
+    icc_profile = image.info.get("icc_profile")
+    if icc_profile:
+        try:
+            source_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+            has_alpha = "A" in image.getbands()
+            output_mode = "RGBA" if has_alpha and image.mode in ("RGBA", "LA") else "RGB"
+            if image.mode in ("LA", "PA"):
+                image = image.convert("RGBA")
+            image = ImageCms.profileToProfile(image, source_profile, _SRGB_PROFILE, outputMode=output_mode)
+        except Exception as e:
+            print(f"Could not apply embedded color profile: {str(e)}")
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+def load_upload(image_bytes: bytes) -> Image.Image:
+    """Decode an uploaded image, upright and in 8-bit sRGB
+
+    Raises:
+        ValueError: If the bytes are not a decodable image or are too large
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.width * image.height > MAX_UPLOAD_PIXELS:
+            raise ValueError(f"Image is too large ({image.width}x{image.height})")
+        image.load()
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError("Invalid image file") from e
+
+    image = ImageOps.exif_transpose(image)
+    return convert_to_srgb(image)
+
+def normalize_image(image_bytes: bytes, max_dimension: int = MAX_UPLOAD_DIMENSION) -> NormalizedImage:
+    """Normalize an uploaded image once so downstream stages get small, predictable input
+
+    Decodes the image, applies EXIF orientation, converts to 8-bit sRGB, caps
+    the dimensions and re-encodes without metadata: JPEG for opaque images,
+    PNG when there is transparency.
+
+    Raises:
+        ValueError: If the bytes are not a decodable image
+    """
+    image = load_upload(image_bytes)
+    image = resize_to_fit(image, max_dimension)
+
+    # Saving without exif/icc_profile strips all metadata
+    buffer = io.BytesIO()
+    if image.mode == "RGBA":
+        image.save(buffer, format="PNG", optimize=True)
+        media_type = "image/png"
+    else:
+        image.save(buffer, format="JPEG", quality=90, optimize=True)
+        media_type = "image/jpeg"
+    data = buffer.getvalue()
+
+    return NormalizedImage(
+        data=data,
+        media_type=media_type,
+        width=image.width,
+        height=image.height,
+        content_hash=hashlib.sha256(data).hexdigest()
+    )
+
+class ProviderImage(NamedTuple):
+    """An image sized and encoded for one AI provider's API"""
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def to_data_url(self) -> str:
+        return f"data:{self.media_type};base64,{self.to_base64()}"
+
+def prepare_provider_image(image_bytes: bytes, provider: str) -> ProviderImage:
+    """Downscale and re-encode an image for a provider's vision/image API
+
+    The image is resized to the provider's effective input resolution (see
+    PROVIDER_IMAGE_PROFILES) and encoded as JPEG, or WebP when it has
+    transparency, with the matching media type. Results are cached by content
+    hash, so fallbacks and retries with the same image skip the work.
+
+    Raises:
+        ValueError: If the bytes are not a decodable image
+    """
+    profile = PROVIDER_IMAGE_PROFILES[provider]
+    cache_key = (hashlib.sha256(image_bytes).hexdigest(), provider)
+    with _provider_images_lock:
+        cached = _provider_images.get(cache_key)
+        if cached is not None:
+            _provider_images.move_to_end(cache_key)
+            return cached
+
+    image = resize_to_fit(load_upload(image_bytes), profile["max_dimension"])
+    if profile["max_short_side"] and min(image.size) > profile["max_short_side"]:
+        scale = profile["max_short_side"] / min(image.size)
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if image.mode == "RGBA":
+        image.save(buffer, format="WEBP", quality=profile["quality"], method=4)
+        media_type = "image/webp"
+    else:
+        image.save(buffer, format="JPEG", quality=profile["quality"], optimize=True)
+        media_type = "image/jpeg"
+    prepared = ProviderImage(buffer.getvalue(), media_type, image.width, image.height)
+
+    with _provider_images_lock:
+        _provider_images[cache_key] = prepared
+        while len(_provider_images) > PROVIDER_IMAGE_CACHE_SIZE:
+            _provider_images.popitem(last=False)
+    return prepared
+
+def generate_template_derivatives(image_bytes: bytes) -> Dict[str, Dict[str, Any]]:
+    """Generate and store every template derivative for an image
+
+    The image is decoded once and each size/format pair is rendered in the
+    worker pool. Derivatives are stored by content hash, so regenerating them
+    for an unchanged image does not write anything new.
+
+    Returns:
+        Template metadata like {"thumbnail": {"width": 160, "height": 120,
+        "webp": {"hash": ..., "size": ...}, "jpeg": {...}}, ...}. URLs are
+        added when templates are served (see common.with_template_image_urls).
+    """
+    image = decode_image(image_bytes)
+
+    futures = {
+        (name, image_format): _image_pool.submit(render_derivative, image, max_dimension, image_format)
+        for name, max_dimension in TEMPLATE_DERIVATIVE_SIZES.items()
+        for image_format in TEMPLATE_DERIVATIVE_FORMATS
+    }
+
+    derivatives: Dict[str, Dict[str, Any]] = {}
+    for (name, image_format), future in futures.items():
+        derivative_bytes, (width, height) = future.result()
+        derivative_hash = store_template_image(derivative_bytes)
+        entry = derivatives.setdefault(name, {"width": width, "height": height})
+        entry[image_format] = {
+            "hash": derivative_hash,
+            "size": len(derivative_bytes)
+        }
+    return derivatives
+
+def get_derivative_hash(template: Dict[str, Any], name: str, image_format: str = "jpeg"):
+    """Get the content hash of a template derivative, or None if it has none"""
+    return template.get("derivatives", {}).get(name, {}).get(image_format, {}).get("hash")
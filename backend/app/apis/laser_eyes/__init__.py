@@ -7,6 +7,9 @@ import io
 import logging
 from typing import Optional
 import os
+from fastapi.concurrency import run_in_threadpool
+
+from app.apis.image_processing import normalize_image
 
 router = APIRouter(prefix="/laser-eyes")
 
@@ -41,6 +44,12 @@ async def add_laser_eyes(image: UploadFile = File(...), intensity: float = Query
         # Read the image content
         contents = await image.read()
         
+        # Normalize orientation, color and size before detection
+        try:
+            contents = (await run_in_threadpool(normalize_image, contents)).data
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Convert to OpenCV format
         nparr = np.frombuffer(contents, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -107,6 +116,8 @@ async def add_laser_eyes(image: UploadFile = File(...), intensity: float = Query
         # Return the processed image
         return Response(content=png_image, media_type="image/png")
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
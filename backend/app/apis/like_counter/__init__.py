@@ -0,0 +1,153 @@
+import threading
+import time
+import atexit
+from typing import Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+class LikeCounter:
+    """Batched like counter shared by the showcase endpoints
+
+    Increments are accumulated in memory per item and handed to flush_fn in
+    batches, either every flush_interval seconds or as soon as max_pending
+    increments are waiting. Readers merge the pending count into the stored
+    count, so a like is visible immediately even before it is flushed.
+
+    A failed flush puts its increments back, so likes are never lost. Counts
+    read during a flush may briefly include a batch that was just persisted.
+    """
+
+    def __init__(self, flush_fn: Callable[[Dict[str, int]], None],
+                 flush_interval: float = 2.0, max_pending: int = 500):
+        """Initialize the like counter
+
+        Args:
+            flush_fn: Called with {item_id: increment} to persist a batch
+            flush_interval: Maximum seconds between flushes
+            max_pending: Number of pending increments that triggers an early flush
+        """
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stats = {"increments": 0, "flushes": 0, "flushed_likes": 0, "flush_errors": 0}
+        self._pending: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def increment(self, item_id: str, amount: int = 1) -> int:
+        """Add likes to an item and return its unflushed like count"""
+        with self._lock:
+            self._pending[item_id] = self._pending.get(item_id, 0) + amount
+            self._pending_total += amount
+            self.stats["increments"] += amount
+            count = self._pending[item_id] + self._in_flight.get(item_id, 0)
+            should_flush = self._pending_total >= self.max_pending
+            if self._flusher is None:
+                self._start_flusher()
+
+        if should_flush:
+            self._wakeup.set()
+        return count
+
+    def pending(self, item_id: str) -> int:
+        """Get the number of likes for an item that are not yet in storage"""
+        with self._lock:
+            return self._pending.get(item_id, 0) + self._in_flight.get(item_id, 0)
+
+    def merge(self, item_id: str, stored_likes: int) -> int:
+        """Combine a stored like count with the pending likes for an item"""
+        return stored_likes + self.pending(item_id)
+
+    def flush(self) -> int:
+        """Persist all pending increments in one batch
+
+        Returns:
+            Number of likes flushed
+        """
+        # Only one flush at a time so batches reach storage in order
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                deltas = self._pending
+                self._in_flight = deltas
+                self._pending = {}
+                self._pending_total = 0
+
+            try:
+                self.flush_fn(deltas)
+            except Exception as e:
+                # Put the increments back so they are retried on the next flush
+                print(f"Error flushing likes: {str(e)}")
+                with self._lock:
+                    for item_id, amount in deltas.items():
+                        self._pending[item_id] = self._pending.get(item_id, 0) + amount
+                        self._pending_total += amount
+                    self._in_flight = {}
+                    self.stats["flush_errors"] += 1
+                return 0
+
+            flushed = sum(deltas.values())
+            with self._lock:
+                self._in_flight = {}
+                self.stats["flushes"] += 1
+                self.stats["flushed_likes"] += flushed
+            return flushed
+
+    def _start_flusher(self):
+        """Start the background flush thread (called with the lock held)"""
+        self._flusher = threading.Thread(target=self._flush_loop, name="like-counter-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        """Flush on a timer, or early when too many increments are pending"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+def benchmark(total_likes: int = 10000, workers: int = 32, storage_latency: float = 0.02) -> Dict[str, float]:
+    """Fire total_likes concurrent likes at a single item and report throughput
+
+    Storage is simulated in memory with a fixed write latency, so this measures
+    the counter itself and how many storage writes the burst costs.
+
+    Usage:
+        python -c "from app.apis.like_counter import benchmark; benchmark()"
+    """
+    item_id = "benchmark-item"
+    stored = {"likes": 0, "writes": 0}
+
+    def flush_to_memory(deltas: Dict[str, int]):
+        time.sleep(storage_latency)  # Simulated storage round trip
+        stored["likes"] += deltas.get(item_id, 0)
+        stored["writes"] += 1
+
+    counter = LikeCounter(flush_to_memory, flush_interval=0.05, max_pending=500)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: counter.increment(item_id), range(total_likes)))
+    accept_time = time.time() - start_time
+
+    counter.flush()
+    total_time = time.time() - start_time
+
+    if stored["likes"] != total_likes:
+        raise AssertionError(f"Lost likes: expected {total_likes}, stored {stored['likes']}")
+
+    results = {
+        "likes": total_likes,
+        "storage_writes": stored["writes"],
+        "accept_seconds": accept_time,
+        "total_seconds": total_time,
+        "likes_per_second": total_likes / accept_time if accept_time > 0 else float("inf")
+    }
+    print(f"{total_likes} likes accepted in {accept_time:.3f}s "
+          f"({results['likes_per_second']:.0f}/s), persisted with {stored['writes']} storage writes "
+          f"in {total_time:.3f}s total")
+    return results
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+from app.apis.common import blob_image_response, TEMPLATE_IMAGE_PREFIX, SHOWCASE_IMAGE_PREFIX
+
+# Public router for stored images (auth is disabled for it in routers.json):
+# browsers load these through <img src>, which sends no bearer token
+router = APIRouter(prefix="/media")
+
+# Binary storage prefixes searched for an image hash
+MEDIA_IMAGE_PREFIXES = (TEMPLATE_IMAGE_PREFIX, SHOWCASE_IMAGE_PREFIX)
+
+@router.get("/image/{image_hash}")
+def get_media_image(image_hash: str):
+    """Serve a stored template or showcase image by its content hash"""
+    for prefix in MEDIA_IMAGE_PREFIXES:
+        try:
+            # Content-addressed images never change, so they can be cached forever
+            return blob_image_response(prefix, image_hash)
+        except FileNotFoundError:
+            continue
+    raise HTTPException(status_code=404, detail="Image not found")
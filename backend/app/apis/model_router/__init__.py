@@ -0,0 +1,298 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# Rolling window of calls used to judge a model's health
+HEALTH_WINDOW_SECONDS = 300
+HEALTH_WINDOW_CALLS = 100
+
+# A model's circuit opens when at least MIN_CALLS recent calls have an error
+# rate of FAILURE_RATE or more, or after CONSECUTIVE_FAILURES failures in a row
+MIN_CALLS = 5
+FAILURE_RATE = 0.5
+CONSECUTIVE_FAILURES = 3
+
+# Models with an error rate above this are tried after healthy ones
+DEGRADED_FAILURE_RATE = 0.2
+
+# Models whose p90 latency exceeds their latency budget are also tried after
+# healthy ones; run() budgets each model this fraction of its timeout
+LATENCY_BUDGET_FRACTION = 0.75
+
+# An open circuit stays open for OPEN_SECONDS, doubling on each failed probe
+# up to MAX_OPEN_SECONDS. After that, PROBE_FRACTION of requests try the model
+# again (one probe at a time) and a successful probe closes the circuit.
+OPEN_SECONDS = 30
+MAX_OPEN_SECONDS = 600
+PROBE_FRACTION = 0.1
+
+# A probe that has not reported back after this long no longer blocks new probes
+PROBE_TIMEOUT_SECONDS = 120
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class ModelHealth:
+    """Rolling call outcomes and circuit state for one model"""
+
+    def __init__(self):
+        self.calls: Deque[Tuple[float, bool, float]] = deque(maxlen=HEALTH_WINDOW_CALLS)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_seconds = OPEN_SECONDS
+        self.probe_in_flight = False
+        self.probe_started_at = 0.0
+        self.skipped = 0
+
+    def prune(self, now: float):
+        while self.calls and now - self.calls[0][0] > HEALTH_WINDOW_SECONDS:
+            self.calls.popleft()
+
+    def failure_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, success, _ in self.calls if not success) / len(self.calls)
+
+    def latency(self, percentile: float = 0.5) -> float:
+        latencies = sorted(seconds for _, success, seconds in self.calls if success)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+class ModelAttempt:
+    """One call to one model, recorded with its router when the block exits
+
+    Used as an async context manager: a clean exit records a success, an
+    exception records a failure (and is re-raised), and cancellation frees a
+    probe slot without judging the model.
+    """
+
+    def __init__(self, router: "ModelRouter", model: str, decision: str,
+                 on_failure: Optional[Callable[[str, float, Exception, str], None]] = None):
+        self.router = router
+        self.model = model
+        self.decision = decision
+        self.on_failure = on_failure
+        self.start_time = 0.0
+        self.seconds = 0.0
+        self.error: Optional[Exception] = None
+
+    async def __aenter__(self) -> "ModelAttempt":
+        self.start_time = time.time()
+        return self
+
+    async def __aexit__(self, exc_type, error, traceback) -> bool:
+        self.seconds = time.time() - self.start_time
+        probe = self.decision == "probe"
+        if exc_type is None:
+            self.router.record(self.model, True, self.seconds, probe=probe)
+        elif not issubclass(exc_type, Exception):
+            # Cancelled, or the client went away: free the probe slot only
+            if probe:
+                self.router.release_probe(self.model)
+        else:
+            if isinstance(error, asyncio.TimeoutError):
+                error = TimeoutError(f"{self.model} timed out after {self.seconds:.1f}s")
+            self.error = error
+            self.router.record(self.model, False, self.seconds, probe=probe)
+            print(f"{self.router.name} router: {self.model} failed ({self.decision}): {str(error)}")
+            if self.on_failure is not None:
+                self.on_failure(self.model, self.seconds, error, self.decision)
+        return False
+
+def get_latency_budgets(timeouts: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """Get per-model p90 latency budgets from per-model timeouts"""
+    return {model: timeout * LATENCY_BUDGET_FRACTION for model, timeout in (timeouts or {}).items()}
+
+class ModelRouter:
+    """Adaptive model selection with a circuit breaker per model
+
+    order() ranks candidate models (in preference order) by recent health:
+    healthy models first, degraded ones (too many errors or too slow) next,
+    and models with an open circuit last, so they are only used when everything else fails. Once an open
+    circuit has cooled down, a small fraction of requests probe the model
+    again. run() tries the ranked models until one succeeds and records the
+    outcome of each call; callers that cannot hand over a single awaitable
+    (e.g. streams) use ranked() and attempt() to get the same bookkeeping.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get_health(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth()
+        return health
+
+    def order(self, models: Sequence[str], latency_budgets: Optional[Dict[str, float]] = None) -> List[Tuple[str, str]]:
+        """Rank models for one request
+
+        Args:
+            models: Candidate models in preference order
+            latency_budgets: Optional per-model p90 latency budget in seconds
+
+        Returns:
+            List of (model, decision) where decision is "preferred", "degraded",
+            "probe" or "circuit_open"
+        """
+        now = time.time()
+        healthy, degraded, probes, blocked = [], [], [], []
+        with self._lock:
+            for model in models:
+                health = self._get_health(model)
+                health.prune(now)
+                if health.state == OPEN and now - health.opened_at >= health.open_seconds:
+                    health.state = HALF_OPEN
+                if health.probe_in_flight and now - health.probe_started_at > PROBE_TIMEOUT_SECONDS:
+                    health.probe_in_flight = False
+
+                if health.state == CLOSED:
+                    budget = (latency_budgets or {}).get(model)
+                    if len(health.calls) >= MIN_CALLS and (
+                        health.failure_rate() >= DEGRADED_FAILURE_RATE
+                        or (budget and health.latency(0.9) > budget)
+                    ):
+                        degraded.append((model, "degraded"))
+                    else:
+                        healthy.append((model, "preferred"))
+                elif health.state == HALF_OPEN and not health.probe_in_flight and random.random() < PROBE_FRACTION:
+                    health.probe_in_flight = True
+                    health.probe_started_at = now
+                    probes.append((model, "probe"))
+                else:
+                    health.skipped += 1
+                    blocked.append((model, "circuit_open"))
+
+        # A probe goes first so it actually gets tried, then the healthy models
+        return probes + healthy + degraded + blocked
+
+    def record(self, model: str, success: bool, seconds: float, probe: bool = False):
+        """Record the outcome of one call and update the model's circuit"""
+        now = time.time()
+        with self._lock:
+            health = self._get_health(model)
+            health.calls.append((now, success, seconds))
+            health.prune(now)
+            if probe:
+                health.probe_in_flight = False
+
+            if success:
+                health.consecutive_failures = 0
+                if health.state != CLOSED:
+                    print(f"{self.name} router: {model} recovered, closing circuit")
+                    health.state = CLOSED
+                    health.open_seconds = OPEN_SECONDS
+                    # Start from a clean window so old failures do not keep it demoted
+                    health.calls.clear()
+                    health.calls.append((now, success, seconds))
+                return
+
+            health.consecutive_failures += 1
+            if health.state == HALF_OPEN or (health.state == OPEN and probe):
+                # Failed probe: stay open for longer
+                health.open_seconds = min(health.open_seconds * 2, MAX_OPEN_SECONDS)
+                health.state = OPEN
+                health.opened_at = now
+            elif health.state == CLOSED and (
+                health.consecutive_failures >= CONSECUTIVE_FAILURES
+                or (len(health.calls) >= MIN_CALLS and health.failure_rate() >= FAILURE_RATE)
+            ):
+                print(f"{self.name} router: opening circuit for {model} "
+                      f"({health.consecutive_failures} consecutive failures, {health.failure_rate():.0%} error rate)")
+                health.state = OPEN
+                health.opened_at = now
+
+    def release_probe(self, model: str):
+        """Give up a probe slot without recording an outcome (e.g. the request was cancelled)"""
+        with self._lock:
+            self._get_health(model).probe_in_flight = False
+
+    def ranked(self, models: Sequence[str], timeouts: Optional[Dict[str, float]] = None) -> List[Tuple[str, str]]:
+        """Rank models like order(), labelling healthy models after the first as "fallback"
+
+        Args:
+            models: Candidate models in preference order
+            timeouts: Optional per-model timeout in seconds, used for latency budgets
+        """
+        return [
+            (model, "fallback" if position > 0 and decision == "preferred" else decision)
+            for position, (model, decision) in enumerate(self.order(models, get_latency_budgets(timeouts)))
+        ]
+
+    def attempt(self, model: str, decision: str,
+                on_failure: Optional[Callable[[str, float, Exception, str], None]] = None) -> ModelAttempt:
+        """Track one call to a model (see ModelAttempt)"""
+        return ModelAttempt(self, model, decision, on_failure)
+
+    async def run(
+        self,
+        models: Sequence[str],
+        call: Callable[..., Awaitable[Any]],
+        timeouts: Optional[Dict[str, float]] = None,
+        on_failure: Optional[Callable[[str, float, Exception, str], None]] = None,
+        pass_decision: bool = False
+    ) -> Tuple[Any, str, str]:
+        """Call models in ranked order until one succeeds
+
+        Args:
+            models: Candidate models in preference order
+            call: Makes the request with a given model; raise to fall through
+            timeouts: Optional per-model timeout in seconds; a model whose p90
+                latency exceeds LATENCY_BUDGET_FRACTION of it is ranked as degraded
+            on_failure: Called with (model, seconds, error, decision) for each failed call
+            pass_decision: Call call(model, decision) instead of call(model), for
+                callers that track their own performance
+
+        Returns:
+            Tuple of (result, model used, routing decision for that model)
+        """
+        errors = []
+        for model, decision in self.ranked(models, timeouts):
+            attempt = self.attempt(model, decision, on_failure)
+            try:
+                async with attempt:
+                    pending = call(model, decision) if pass_decision else call(model)
+                    timeout = (timeouts or {}).get(model)
+                    if timeout:
+                        result = await asyncio.wait_for(pending, timeout)
+                    else:
+                        result = await pending
+            except Exception as e:
+                errors.append(f"{model}: {str(attempt.error or e)}")
+                continue
+            return result, model, decision
+        raise Exception(f"All models failed. {' '.join(errors)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the health of each model seen by this router"""
+        now = time.time()
+        stats = {}
+        with self._lock:
+            for model, health in self._health.items():
+                health.prune(now)
+                stats[model] = {
+                    "state": health.state,
+                    "calls": len(health.calls),
+                    "failure_rate": round(health.failure_rate(), 3),
+                    "p50_seconds": round(health.latency(0.5), 3),
+                    "p90_seconds": round(health.latency(0.9), 3),
+                    "skipped": health.skipped,
+                    "open_seconds": health.open_seconds if health.state != CLOSED else 0
+                }
+        return stats
+
+# Routers for caption text and for meme image generation
+text_router = ModelRouter("text")
+image_router = ModelRouter("image")
+
+def get_router_stats() -> Dict[str, Any]:
+    """Get the health of every model, by router"""
+    return {router.name: router.get_stats() for router in (text_router, image_router)}
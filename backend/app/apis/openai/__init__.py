@@ -1,13 +1,16 @@
 from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Union, Dict, Any, Tuple
+from typing import AsyncIterator, List, Optional, Union, Dict, Any, Tuple
 import databutton as db
-from openai import OpenAI
 import json
 import re  # For sanitizing storage keys
+import random
+import asyncio
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import time
-import base64  # For encoding images for vision API
 import io  # For converting bytes to image objects
 from PIL import Image  # For image processing
 
@@ -16,6 +19,13 @@ from app.apis.extended_prompts import get_extended_prompt
 
 # Import necessary libs for image generation
 import requests
+from fastapi.concurrency import run_in_threadpool
+
+from app.apis.common import get_async_openai_client, read_generated_image
+from app.apis.model_router import text_router, get_router_stats
+from app.apis.vision_cache import vision_cache, get_image_hash, GUIDANCE, DESCRIPTION
+from app.apis.image_processing import prepare_provider_image
+from app.apis.single_flight import ai_flights, get_fingerprint
 
 router = APIRouter(prefix="/openai")
 
@@ -26,14 +36,56 @@ VISION_MODEL = "gpt-4o"  # Vision model for image transformations
 IMAGE_MODEL = "dall-e-3"  # Image generation model
 MODEL_USAGE_KEY = "openai_model_usage"  # Key for tracking model usage
 
+# The vision analysis also describes the person after this marker, so a DALL-E
+# fallback for the same image can reuse the description (see image_generation)
+PERSON_DESCRIPTION_MARKER = "PERSON DESCRIPTION:"
+
+CAPTION_SYSTEM_PROMPT = "You are a hilarious viral meme generator. Your captions are short, witty, and perfect for viral memes. Keep captions under 140 characters. Include internet slang when appropriate."
+
+# Per-model timeouts for caption generation, so a hanging model fails over quickly
+CAPTION_TIMEOUTS = {PRIMARY_MODEL: 20, BACKUP_MODEL: 15}
+
+# Topic used when a caption request has no prompt
+DEFAULT_CAPTION_TOPIC = "current internet trends, viral memes, or popular culture"
+
+# Captions for repeat requests (same template, prompt, style and context)
+CAPTION_CACHE_SIZE = 1024
+CAPTION_CACHE_TTL = 3600
+
+# Default-topic requests are served from a pool of pre-generated captions per
+# prompt. A caption is retired after CAPTION_POOL_MAX_SERVES serves (so the
+# pool keeps rotating) or once it is older than CAPTION_POOL_TTL, and pools
+# are topped up in the background when they run low.
+CAPTION_POOL_TTL = 6 * 3600
+CAPTION_POOL_MAX_SERVES = 3
+CAPTION_POOL_BATCH = 8
+CAPTION_POOL_MIN_SIZE = 6
+CAPTION_POOL_MAX_SIZE = 48
+CAPTION_POOL_MAX_POOLS = 128
+
+# Template-specific prompting
+CAPTION_TEMPLATE_PROMPTS = {
+    "doge": "Create a funny Doge meme caption (using Doge speak like 'much wow, very meme') about",
+    "pepe": "Create a funny Pepe the Frog viral meme caption about",
+    "anime": "Create a funny anime-style viral meme caption (with references to anime tropes) about",
+    "btc_laser_eyes": "Create a funny laser eyes meme caption (celebrating internet meme culture) about",
+    "voxel": "Create a funny voxel art style viral meme caption about"
+}
+
 # Helper function to sanitize storage keys
 def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
 # Function to track model performance and usage
-def track_model_performance(model: str, processing_time: float, success: bool = True, error: str = None):
-    """Track model performance for analytics"""
+def track_model_performance(model: str, processing_time: float, success: bool = True, error: str = None,
+                            routing: str = None):
+    """Track model performance for analytics
+
+    Args:
+        routing: Why the model router picked this model ("preferred", "fallback",
+            "degraded", "probe" or "circuit_open")
+    """
     import json
     from datetime import datetime
     import re
@@ -70,6 +122,11 @@ def track_model_performance(model: str, processing_time: float, success: bool =
             model_stats["success_count"] = model_stats.get("success_count", 0) + 1
             model_stats["total_time"] = model_stats.get("total_time", 0) + processing_time
         model_stats["last_used"] = datetime.now().isoformat()
+
+        # Track routing decisions
+        if routing:
+            routing_stats = model_stats.setdefault("routing", {})
+            routing_stats[routing] = routing_stats.get(routing, 0) + 1
         
         # Track errors
         if not success and error:
@@ -84,85 +141,93 @@ def track_model_performance(model: str, processing_time: float, success: bool =
         print(f"Error tracking model performance: {str(e)}")
 
 # Function to generate text with fallback to backup model
-async def generate_text_with_fallback(client, prompt) -> Tuple[str, List[str], str]:
-    """Generate text using the primary model with fallback to backup model
-    
+async def generate_text_with_fallback(client, prompt, n: int = 3) -> Tuple[str, List[str], str]:
+    """Generate text with the healthiest model, falling back to the others
+
+    The text router normally tries PRIMARY_MODEL first, but skips it while its
+    circuit is open (recent errors or timeouts) and only probes it with a
+    fraction of requests until it recovers. Every call is tracked with
+    track_model_performance, including the routing decision.
+
+    Args:
+        client: AsyncOpenAI client instance
+        prompt: The caption prompt
+        n: Number of captions to generate
+
     Returns:
         Tuple of (caption, alternatives, model_used)
     """
-    # First try with the primary model (GPT-4o)
-    try:
-        response = client.chat.completions.create(
-            model=PRIMARY_MODEL,
+    async def generate(model: str) -> Tuple[str, List[str]]:
+        response = await client.chat.completions.create(
+            model=model,
             messages=[
-                {"role": "system", "content": "You are a hilarious viral meme generator. Your captions are short, witty, and perfect for viral memes. Keep captions under 140 characters. Include internet slang when appropriate."},
+                {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            n=3,  # Generate 3 alternatives
+            n=n,  # Generate alternatives
             max_tokens=150
         )
-        
+
         # Extract the main caption and alternatives
         main_caption = response.choices[0].message.content.strip() if response.choices else ""
-        
+
         # Get alternative captions
         alternatives = []
-        for i in range(1, len(response.choices)):
-            if i < len(response.choices):
-                alt = response.choices[i].message.content.strip()
-                if alt and alt != main_caption:
-                    alternatives.append(alt)
-        
-        return main_caption, alternatives, PRIMARY_MODEL
-    
-    except Exception as primary_error:
-        # Log the error with the primary model
-        print(f"Primary model ({PRIMARY_MODEL}) error: {str(primary_error)}. Falling back to {BACKUP_MODEL}")
-        track_model_performance(PRIMARY_MODEL, 0, success=False, error=str(primary_error))
-        
-        # Try with the backup model
-        try:
-            response = client.chat.completions.create(
-                model=BACKUP_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a hilarious viral meme generator. Your captions are short, witty, and perfect for viral memes. Keep captions under 140 characters. Include internet slang when appropriate."},
-                    {"role": "user", "content": prompt}
-                ],
-                n=3,  # Generate 3 alternatives
-                max_tokens=150
-            )
-            
-            # Extract the main caption and alternatives
-            main_caption = response.choices[0].message.content.strip() if response.choices else ""
-            
-            # Get alternative captions
-            alternatives = []
-            for i in range(1, len(response.choices)):
-                if i < len(response.choices):
-                    alt = response.choices[i].message.content.strip()
-                    if alt and alt != main_caption:
-                        alternatives.append(alt)
-            
-            return main_caption, alternatives, BACKUP_MODEL
-        
-        except Exception as backup_error:
-            # Both models failed, log and re-raise
-            print(f"Backup model ({BACKUP_MODEL}) also failed: {str(backup_error)}")
-            track_model_performance(BACKUP_MODEL, 0, success=False, error=str(backup_error))
-            raise Exception(f"Both models failed. Primary error: {str(primary_error)}. Backup error: {str(backup_error)}")
+        for choice in response.choices[1:]:
+            alt = choice.message.content.strip()
+            if alt and alt != main_caption:
+                alternatives.append(alt)
+        return main_caption, alternatives
+
+    def track_failure(model: str, seconds: float, error: Exception, routing: str):
+        track_model_performance(model, seconds, success=False, error=str(error), routing=routing)
+
+    async def generate_with_router() -> Tuple[str, List[str], str]:
+        start_time = time.time()
+        (caption, alternatives), model_used, routing = await text_router.run(
+            [PRIMARY_MODEL, BACKUP_MODEL], generate, CAPTION_TIMEOUTS, track_failure
+        )
+        track_model_performance(model_used, time.time() - start_time, success=True, routing=routing)
+        return caption, alternatives, model_used
+
+    # Identical prompts already in flight (e.g. a viral template) share one call
+    (caption, alternatives, model_used), _ = await ai_flights.run(
+        get_fingerprint("caption", prompt, n), generate_with_router
+    )
+    return caption, list(alternatives), model_used
 
 # Initialize OpenAI client
 def get_openai_client():
-    """Get OpenAI client with API key"""
-    api_key = db.secrets.get("OPENAI_API_KEY")
-    return OpenAI(api_key=api_key)
+    """Get the shared AsyncOpenAI client (pooled connections, cached API key)"""
+    return get_async_openai_client()
 
 # Function for transforming images with GPT-4o Vision
 async def transform_image_with_gpt4_vision(client, user_image_bytes, template_id, custom_prompt=None):
     """Transform a user image into a viral meme character using GPT-4o Vision
     
+    Concurrent calls with the same image, template and prompt share one
+    upstream transformation.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        user_image_bytes: The user's photo as bytes
+        template_id: The meme template to use (e.g., 'pepe', 'wojak')
+        custom_prompt: Optional custom instructions for the transformation
+        
+    Returns:
+        Tuple of (image_bytes, transform_method)
+    """
+    result, _ = await ai_flights.run(
+        get_fingerprint("gpt4_vision", user_image_bytes, template_id, custom_prompt),
+        lambda: _transform_image_with_gpt4_vision(client, user_image_bytes, template_id, custom_prompt)
+    )
+    return result
+
+async def _transform_image_with_gpt4_vision(client, user_image_bytes, template_id, custom_prompt=None):
+    """Transform a user image with GPT-4o Vision guidance and DALL-E 3
+    
     Args:
-        client: OpenAI client instance
+        client: AsyncOpenAI client instance
         user_image_bytes: The user's photo as bytes
         template_id: The meme template to use (e.g., 'pepe', 'wojak')
         custom_prompt: Optional custom instructions for the transformation
@@ -175,9 +240,6 @@ async def transform_image_with_gpt4_vision(client, user_image_bytes, template_id
         import time
         start_time = time.time()
         
-        # Convert image bytes to base64 for API
-        base64_image = base64.b64encode(user_image_bytes).decode('utf-8')
-        
         # Template-specific prompts
         template_descriptions = {
             "doge": "the Doge meme character (Shiba Inu dog with the characteristic expression)",
@@ -214,43 +276,62 @@ async def transform_image_with_gpt4_vision(client, user_image_bytes, template_id
         SPECIFIC GUIDANCE FOR THIS CHARACTER: {extended_prompt}
         
         Make your description extremely detailed, specific, and actionable - as if directing another AI 
-        to create this transformation perfectly."""
+        to create this transformation perfectly.
+        
+        Finish with a separate section starting with the line "{PERSON_DESCRIPTION_MARKER}" that plainly
+        describes the person's appearance, pose, clothing, and background as they are in the photo."""
         
         # Add custom instructions if provided
         user_prompt = "Analyze this image and provide artistic guidance for transforming this person into the meme character."
         if custom_prompt:
             user_prompt += f" Additional requirements: {custom_prompt}"
         
-        # Call GPT-4o Vision API for image analysis
-        vision_response = client.chat.completions.create(
-            model=VISION_MODEL,  # Using GPT-4o for vision analysis
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000,
-            response_format={"type": "text"}
-        )
-        
-        # Extract the detailed analysis
-        artistic_guidance = vision_response.choices[0].message.content if vision_response.choices else ""
-        
-        # Check if we got a content policy refusal
-        if "sorry" in artistic_guidance.lower() and ("can't" in artistic_guidance.lower() or "cannot" in artistic_guidance.lower()):
-            print("Received potential content policy refusal from GPT-4o Vision")
-            # Use a more neutral prompt that's less likely to be flagged
-            artistic_guidance = f"Create a transformation of the person into {template_description}, maintaining key facial proportions but applying the characteristic stylistic elements of the meme character. Focus on making a seamless blend that looks authentic to the meme style while preserving the person's identity."
+        # Reuse guidance already written for this image and template (e.g. on a retry)
+        image_hash = get_image_hash(user_image_bytes)
+        guidance_params = f"{template_id}|{custom_prompt or ''}"
+        artistic_guidance = vision_cache.get(image_hash, GUIDANCE, guidance_params)
+        vision_called = artistic_guidance is None
+        if vision_called:
+            # Downscale and re-encode the image to what GPT-4o actually looks at
+            vision_image = await run_in_threadpool(prepare_provider_image, user_image_bytes, "openai")
+            
+            # Call GPT-4o Vision API for image analysis
+            vision_response = await client.chat.completions.create(
+                model=VISION_MODEL,  # Using GPT-4o for vision analysis
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": user_prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": vision_image.to_data_url()}
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=1300,
+                response_format={"type": "text"}
+            )
         
-        print("Received artistic guidance from GPT-4o Vision")
+            # Extract the detailed analysis, and keep the person description for DALL-E fallbacks
+            analysis = (vision_response.choices[0].message.content or "") if vision_response.choices else ""
+            artistic_guidance, _, person_description = analysis.partition(PERSON_DESCRIPTION_MARKER)
+            artistic_guidance = artistic_guidance.strip()
+            vision_cache.put(image_hash, DESCRIPTION, person_description.strip())
+        
+            # Check if we got a content policy refusal
+            if "sorry" in artistic_guidance.lower() and ("can't" in artistic_guidance.lower() or "cannot" in artistic_guidance.lower()):
+                print("Received potential content policy refusal from GPT-4o Vision")
+                # Use a more neutral prompt that's less likely to be flagged
+                artistic_guidance = f"Create a transformation of the person into {template_description}, maintaining key facial proportions but applying the characteristic stylistic elements of the meme character. Focus on making a seamless blend that looks authentic to the meme style while preserving the person's identity."
+            else:
+                vision_cache.put(image_hash, GUIDANCE, artistic_guidance, guidance_params)
+            
+            print("Received artistic guidance from GPT-4o Vision")
+        else:
+            print("Reusing cached artistic guidance for this image")
         
         # Step 2: Generate the image transformation using the guidance
         print("Step 2: Generating transformed image...")
@@ -264,24 +345,16 @@ async def transform_image_with_gpt4_vision(client, user_image_bytes, template_id
         high quality, and maintain the authentic style of the meme."""
         
         # Use the image generation model
-        image_response = client.images.generate(
+        image_response = await client.images.generate(
             model="dall-e-3",  # Using DALL-E 3 for high-quality image generation
             prompt=prompt_for_image,
             size="1024x1024",
             quality="standard",
-            n=1
+            n=1,
+            response_format="b64_json"  # Image comes back inline, no second download
         )
         
-        # Get the generated image URL
-        image_url = image_response.data[0].url
-        
-        # Download the generated image
-        import requests
-        img_response = requests.get(image_url)
-        if not img_response.ok:
-            raise ValueError(f"Failed to download image from URL: {image_url}")
-        
-        transformed_image_bytes = img_response.content
+        transformed_image_bytes = await read_generated_image(image_response.data[0])
         transform_method = "gpt4o_vision_guidance"
         
         # Calculate and log processing time
@@ -289,8 +362,11 @@ async def transform_image_with_gpt4_vision(client, user_image_bytes, template_id
         print(f"Image transformed in {processing_time:.2f} seconds using GPT-4o Vision guidance")
         
         # Track model usage and performance
-        track_model_performance(VISION_MODEL, processing_time / 2, success=True)  # Approximate split
-        track_model_performance("dall-e-3", processing_time / 2, success=True)  # Approximate split
+        if vision_called:
+            track_model_performance(VISION_MODEL, processing_time / 2, success=True)  # Approximate split
+            track_model_performance("dall-e-3", processing_time / 2, success=True)  # Approximate split
+        else:
+            track_model_performance("dall-e-3", processing_time, success=True)
         
         # Return with method information so it can be tracked
         return transformed_image_bytes, transform_method
@@ -389,7 +465,10 @@ async def get_model_analytics(password: str = Query(...)):
             "models": model_stats,
             "errors": errors,
             "primary_model": PRIMARY_MODEL,
-            "backup_model": BACKUP_MODEL
+            "backup_model": BACKUP_MODEL,
+            "routing": get_router_stats(),
+            "vision_cache": vision_cache.get_stats(),
+            "single_flight": ai_flights.get_stats()
         }
     except Exception as e:
         print(f"Error getting model analytics data: {str(e)}")
@@ -417,67 +496,202 @@ async def generate_viral_meme_image(user_image_bytes, template_id):
         None  # No custom prompt
     )
 
+def normalize_caption_request(request: MemeGenerationRequest) -> MemeGenerationRequest:
+    """Normalize a caption request so equivalent requests share cache entries and pools"""
+    prompt = " ".join((request.prompt or "").split()) or None
+    if prompt and prompt.lower() == DEFAULT_CAPTION_TOPIC:
+        prompt = None
+    return MemeGenerationRequest(
+        template_id=request.template_id.strip().lower(),
+        prompt=prompt,
+        style=" ".join((request.style or "").split()).lower() or "funny",
+        context=request.context or None
+    )
+
+def build_caption_prompt(request: MemeGenerationRequest) -> str:
+    """Build the caption generation prompt for a request"""
+    # Default prompt for unknown templates
+    base_prompt = CAPTION_TEMPLATE_PROMPTS.get(
+        request.template_id,
+        "Create a funny viral meme caption about"
+    )
+
+    # User's custom prompt or default to market conditions
+    topic = request.prompt or DEFAULT_CAPTION_TOPIC
+
+    # Build the final prompt
+    full_prompt = f"{base_prompt} {topic}. Make it {request.style}, witty and internet-related."
+
+    # Add context if provided
+    if request.context:
+        context_str = json.dumps(request.context)
+        full_prompt += f"\n\nUse this additional context: {context_str}"
+    return full_prompt
+
+def is_default_topic(request: MemeGenerationRequest) -> bool:
+    """Check whether a (normalized) request can be served from a caption pool"""
+    return not request.prompt and not request.context
+
+class CaptionCache:
+    """LRU cache of caption responses plus per-prompt pools of default-topic captions"""
+
+    def __init__(self):
+        self._responses: "OrderedDict[str, Tuple[MemeGenerationResponse, float]]" = OrderedDict()
+        # Pool entries are (caption, model_used, created_at, serves)
+        self._pools: "OrderedDict[str, List[Tuple[str, str, float, int]]]" = OrderedDict()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(request: MemeGenerationRequest) -> str:
+        """Key a normalized request by template, prompt, style and context"""
+        return json.dumps(
+            [request.template_id, (request.prompt or "").lower(), request.style, request.context or {}],
+            sort_keys=True, default=str
+        )
+
+    def get(self, key: str) -> Optional[MemeGenerationResponse]:
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > CAPTION_CACHE_TTL:
+                del self._responses[key]
+                return None
+            self._responses.move_to_end(key)
+            return entry[0].model_copy()
+
+    def put(self, key: str, response: MemeGenerationResponse):
+        with self._lock:
+            self._responses[key] = (response.model_copy(), time.time())
+            self._responses.move_to_end(key)
+            while len(self._responses) > CAPTION_CACHE_SIZE:
+                self._responses.popitem(last=False)
+
+    def add_to_pool(self, prompt: str, captions: List[str], model_used: str):
+        """Add freshly generated captions to a prompt's pool"""
+        now = time.time()
+        with self._lock:
+            pool = self._pools.setdefault(prompt, [])
+            self._pools.move_to_end(prompt)
+            known = {entry[0] for entry in pool}
+            for caption in captions:
+                if caption and caption not in known:
+                    pool.append((caption, model_used, now, 0))
+                    known.add(caption)
+            del pool[:-CAPTION_POOL_MAX_SIZE]
+            while len(self._pools) > CAPTION_POOL_MAX_POOLS:
+                self._pools.popitem(last=False)
+
+    def take_from_pool(self, prompt: str) -> Tuple[Optional[MemeGenerationResponse], int]:
+        """Pick random fresh captions from a prompt's pool, retiring well-worn ones
+
+        Returns:
+            Tuple of (response, or None if the pool is empty; captions left in the pool)
+        """
+        now = time.time()
+        with self._lock:
+            pool = self._pools.get(prompt)
+            if not pool:
+                return None, 0
+            pool[:] = [entry for entry in pool if now - entry[2] <= CAPTION_POOL_TTL]
+            if not pool:
+                return None, 0
+            picked = random.sample(range(len(pool)), min(3, len(pool)))
+            captions = [pool[index] for index in picked]
+            for index in picked:
+                caption, model_used, created_at, serves = pool[index]
+                pool[index] = (caption, model_used, created_at, serves + 1)
+            pool[:] = [entry for entry in pool if entry[3] < CAPTION_POOL_MAX_SERVES]
+            return MemeGenerationResponse(
+                caption=captions[0][0],
+                alternative_captions=[entry[0] for entry in captions[1:]],
+                model_used=captions[0][1]
+            ), len(pool)
+
+    async def refill(self, prompt: str):
+        """Top up a prompt's pool; requests for the same prompt share one in-flight refill"""
+        async def generate() -> None:
+            caption, alternatives, model_used = await generate_text_with_fallback(
+                get_openai_client(), prompt, n=CAPTION_POOL_BATCH
+            )
+            self.add_to_pool(prompt, [caption] + alternatives, model_used)
+
+        await ai_flights.run(get_fingerprint("caption_pool", prompt), generate)
+
+    def schedule_refill(self, prompt: str):
+        """Top up a prompt's pool in the background"""
+        task = asyncio.get_running_loop().create_task(self._refill_in_background(prompt))
+        # Keep a reference so the task is not garbage collected while running
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill_in_background(self, prompt: str):
+        try:
+            await self.refill(prompt)
+        except Exception as e:
+            print(f"Error refilling caption pool: {str(e)}")
+
+caption_cache = CaptionCache()
+
 @router.post("/generate-meme-text", operation_id="generate_meme_text")
 async def generate_meme_text(request: MemeGenerationRequest) -> MemeGenerationResponse:
     """Generate meme text/captions using GPT-4o
-    
+
     This endpoint uses OpenAI's GPT-4o to generate creative and funny meme captions
-    based on the selected template and optional context.
-    
+    based on the selected template and optional context. Default-topic requests
+    are served from pre-generated caption pools and repeat requests from a cache.
+
     Args:
         request: The meme generation request containing template and context
-        
+
     Returns:
         Meme caption text and alternatives
     """
     try:
+        request = normalize_caption_request(request)
+        full_prompt = build_caption_prompt(request)
+        default_topic = is_default_topic(request)
+        cache_key = caption_cache.get_key(request)
+
+        if default_topic:
+            # Serve default-topic requests from the pool, topping it up when it runs low.
+            # An empty pool is filled by one refill that concurrent requests wait on.
+            pooled, remaining = caption_cache.take_from_pool(full_prompt)
+            if pooled is None:
+                await caption_cache.refill(full_prompt)
+                pooled, remaining = caption_cache.take_from_pool(full_prompt)
+            if remaining < CAPTION_POOL_MIN_SIZE:
+                caption_cache.schedule_refill(full_prompt)
+            if pooled is not None:
+                return pooled
+        else:
+            cached = caption_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         client = get_openai_client()
-        
+
         # Track start time for model performance monitoring
-        import time
         start_time = time.time()
-        
-        # Template-specific prompting
-        template_prompts = {
-            "doge": "Create a funny Doge meme caption (using Doge speak like 'much wow, very meme') about",
-            "pepe": "Create a funny Pepe the Frog viral meme caption about",
-            "anime": "Create a funny anime-style viral meme caption (with references to anime tropes) about",
-            "btc_laser_eyes": "Create a funny laser eyes meme caption (celebrating internet meme culture) about",
-            "voxel": "Create a funny voxel art style viral meme caption about"
-        }
-        
-        # Default prompt for unknown templates
-        base_prompt = template_prompts.get(
-            request.template_id, 
-            "Create a funny viral meme caption about"
-        )
-        
-        # User's custom prompt or default to market conditions
-        topic = request.prompt or "current internet trends, viral memes, or popular culture"
-        
-        # Build the final prompt
-        full_prompt = f"{base_prompt} {topic}. Make it {request.style}, witty and internet-related."
-        
-        # Add context if provided
-        if request.context:
-            context_str = json.dumps(request.context)
-            full_prompt += f"\n\nUse this additional context: {context_str}"
-        
+
         # Call OpenAI API with fallback logic
         caption, alternatives, model_used = await generate_text_with_fallback(client, full_prompt)
-        
+
         # Calculate and log processing time
         processing_time = time.time() - start_time
         print(f"Caption generated using model {model_used} in {processing_time:.2f} seconds")
-        
-        # Track model usage and performance
-        track_model_performance(model_used, processing_time, success=True)
-        
-        return MemeGenerationResponse(
+
+        response = MemeGenerationResponse(
             caption=caption,
             alternative_captions=alternatives,
             model_used=model_used
         )
+        if default_topic:
+            caption_cache.add_to_pool(full_prompt, [caption] + alternatives, model_used)
+        else:
+            caption_cache.put(cache_key, response)
+        return response
     except Exception as e:
         print(f"Error generating meme text: {str(e)}")
         # Try to track the failure
@@ -486,3 +700,139 @@ async def generate_meme_text(request: MemeGenerationRequest) -> MemeGenerationRe
         except:
             pass  # Don't let tracking errors disrupt the main error handling
         raise HTTPException(status_code=500, detail=f"Failed to generate meme text: {str(e)}")
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_caption_tokens(client, model: str, prompt: str, n: int = 3) -> AsyncIterator[Tuple[int, str]]:
+    """Stream caption tokens from one model
+
+    Yields:
+        Tuples of (choice index, token text)
+    """
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        n=n,
+        max_tokens=150,
+        stream=True
+    )
+    async for chunk in stream:
+        for choice in chunk.choices:
+            if choice.delta and choice.delta.content:
+                yield choice.index, choice.delta.content
+
+async def with_first_token_timeout(tokens: AsyncIterator[Tuple[int, str]], timeout: float) -> AsyncIterator[Tuple[int, str]]:
+    """Pass tokens through, failing with asyncio.TimeoutError if none arrives within timeout seconds"""
+    iterator = tokens.__aiter__()
+    try:
+        first = await asyncio.wait_for(iterator.__anext__(), timeout)
+    except StopAsyncIteration:
+        return
+    yield first
+    async for token in iterator:
+        yield token
+
+def caption_response_events(response: MemeGenerationResponse, cached: bool) -> List[str]:
+    """Events for a complete caption response"""
+    events = [sse_event("caption", {"caption": response.caption})]
+    events += [sse_event("alternative", {"caption": alternative}) for alternative in response.alternative_captions]
+    events.append(sse_event("done", {"model_used": response.model_used, "cached": cached}))
+    return events
+
+@router.post("/generate-meme-text/stream", operation_id="generate_meme_text_stream")
+async def generate_meme_text_stream(request: MemeGenerationRequest):
+    """Stream meme captions as server-sent events
+
+    Events:
+        token: {"text": ...} pieces of the main caption as the model writes it
+        caption: {"caption": ...} the complete main caption
+        alternative: {"caption": ...} one alternative caption (sent after the main one)
+        done: {"model_used": ..., "cached": ...}
+        error: {"detail": ...} generation failed
+
+    Cached and pooled captions are sent straight away without token events.
+    If the primary model fails before sending any token, the backup model is
+    used instead.
+    """
+    request = normalize_caption_request(request)
+    full_prompt = build_caption_prompt(request)
+    default_topic = is_default_topic(request)
+    cache_key = caption_cache.get_key(request)
+
+    async def events():
+        if default_topic:
+            pooled, remaining = caption_cache.take_from_pool(full_prompt)
+            # An empty pool is filled from this stream's own captions, so only
+            # a pool that is running low is topped up
+            if pooled is not None and remaining < CAPTION_POOL_MIN_SIZE:
+                caption_cache.schedule_refill(full_prompt)
+            if pooled is not None:
+                for event in caption_response_events(pooled, True):
+                    yield event
+                return
+        else:
+            cached = caption_cache.get(cache_key)
+            if cached is not None:
+                for event in caption_response_events(cached, True):
+                    yield event
+                return
+
+        try:
+            client = get_openai_client()
+        except Exception as e:
+            print(f"Error generating meme text: {str(e)}")
+            yield sse_event("error", {"detail": "Failed to generate meme text"})
+            return
+
+        def track_failure(model: str, seconds: float, error: Exception, routing: str):
+            track_model_performance(model, seconds, success=False, error=str(error), routing=routing)
+
+        for model, routing in text_router.ranked([PRIMARY_MODEL, BACKUP_MODEL], CAPTION_TIMEOUTS):
+            texts: Dict[int, str] = {}
+            try:
+                # The router records the outcome, or frees a probe slot if the client goes away
+                async with text_router.attempt(model, routing, track_failure) as attempt:
+                    # A model that has not started answering within its timeout is skipped
+                    tokens = with_first_token_timeout(stream_caption_tokens(client, model, full_prompt), CAPTION_TIMEOUTS[model])
+                    async for index, token in tokens:
+                        texts[index] = texts.get(index, "") + token
+                        if index == 0:
+                            yield sse_event("token", {"text": token})
+            except Exception:
+                if texts:
+                    # Tokens were already sent, so switching models would garble the caption
+                    yield sse_event("error", {"detail": "Caption generation was interrupted"})
+                    return
+                continue
+
+            caption = texts.get(0, "").strip()
+            alternatives = []
+            for index in sorted(texts):
+                alternative = texts[index].strip()
+                if index > 0 and alternative and alternative != caption:
+                    alternatives.append(alternative)
+
+            print(f"Caption streamed using model {model} in {attempt.seconds:.2f} seconds")
+            track_model_performance(model, attempt.seconds, success=True, routing=routing)
+
+            response = MemeGenerationResponse(caption=caption, alternative_captions=alternatives, model_used=model)
+            if default_topic:
+                caption_cache.add_to_pool(full_prompt, [caption] + alternatives, model)
+            else:
+                caption_cache.put(cache_key, response)
+            for event in caption_response_events(response, False):
+                yield event
+            return
+
+        yield sse_event("error", {"detail": "Failed to generate meme text"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException
 import databutton as db
 from app.apis.common import sanitize_storage_key, TemplateManager
+from app.apis.common import template_list_params, template_list_response, TemplateListParams
 
 # Create a public router with no auth dependency
 router = APIRouter()
@@ -14,10 +15,10 @@ template_manager = TemplateManager(TEMPLATES_KEY, USAGE_STATS_KEY, DEFAULT_TEMPL
 
 # This endpoint is deprecated - use /faceswap/templates/public instead
 @router.get("/public/faceswap/templates")
-def get_templates_public():
+def get_templates_public(request: Request, params: TemplateListParams = Depends(template_list_params)):
     """Get available meme templates - publicly accessible endpoint
     
     Note: This endpoint is deprecated. Please use /faceswap/templates/public instead.
     """
     # Use the template manager to get templates
-    return template_manager.get_templates()
+    return template_list_response(request, template_manager, params)
@@ -1,12 +1,24 @@
 import uuid
 import re
-from typing import Dict, List, Optional
+import math
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+from typing import Dict, List, Literal, Optional, Tuple
 from datetime import datetime, timedelta
 import random
-from fastapi import APIRouter, HTTPException, Query
+import threading
+import time
+import atexit
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel, Field
 import databutton as db
 
+from app.apis.like_counter import LikeCounter
+from app.apis.common import make_etag, etag_matches, cached_json_response
+from app.apis.common import store_blob, blob_image_response, decode_data_url
+from app.apis.common import get_media_url, get_image_hash_from_url, SHOWCASE_IMAGE_PREFIX
+from app.apis.common import encode_cursor, decode_cursor, CURSOR_NUMBER
+
 router = APIRouter(prefix="/showcase")
 
 # Sanitize storage key to prevent invalid storage keys
@@ -15,9 +27,58 @@ def sanitize_storage_key(key: str) -> str:
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
 # Storage keys
-SHOWCASE_KEY = "transformation_showcase"
+SHOWCASE_KEY = "transformation_showcase"  # Legacy single-document showcase
+SHOWCASE_INDEX_KEY = "transformation_showcase_index"
+SHOWCASE_ITEM_PREFIX = "showcase_item_"
+SHOWCASE_LIKES_PREFIX = "showcase_likes_"
+SHOWCASE_LIKES_MANIFEST_KEY = "showcase_likes_manifest"
 MEME_TEMPLATES_KEY = "meme_templates"
 
+# Maximum number of items kept in the showcase
+MAX_SHOWCASE_ITEMS = 20000
+
+# Serializes read-modify-write of the showcase index within this process
+_index_lock = threading.Lock()
+
+# Entries of the most recently read or written index, in order and by item ID.
+# Reads reuse it for SHOWCASE_INDEX_TTL seconds before going back to storage.
+SHOWCASE_INDEX_TTL = 5
+_index: List[dict] = []
+_index_entries: Dict[str, dict] = {}
+_index_loaded_at = 0.0
+
+# Items this worker added recently, re-added if another worker's index write
+# dropped them; and how often the index is checked against the item records
+SHOWCASE_RECONCILE_SECONDS = 600
+_recent_adds: Dict[str, Tuple[dict, float]] = {}
+_reconciled_at = 0.0
+
+# How often like shards written by other workers are re-read
+LIKE_SHARDS_TTL = 5
+
+# Number of like shard slots, which bounds the number of shard documents
+LIKE_SHARD_SLOTS = 32
+
+# How long a worker holds its slot without renewing the lease
+LIKE_SLOT_LEASE_SECONDS = 600
+
+# This worker's slot, the reset generation it belongs to and the likes stored in the slot
+WORKER_ID = uuid.uuid4().hex
+_worker_slot: Optional[int] = None
+_like_generation: Optional[int] = None
+_worker_likes: Dict[str, int] = {}
+_worker_likes_total = 0
+
+# Likes summed over the other workers' shards
+_shard_likes: Dict[str, int] = {}
+_shard_likes_total = 0
+_shards_loaded_at = 0.0
+_likes_lock = threading.Lock()
+
+# Hot score tuning: every HOT_DECAY_SECONDS of age is worth a 10x difference in likes
+HOT_EPOCH = 1735689600  # 2025-01-01T00:00:00Z
+HOT_DECAY_SECONDS = 45000
+
 # Data models
 class ShowcaseItem(BaseModel):
     id: str = Field(..., description="Unique ID for the showcase item")
@@ -27,6 +88,8 @@ class ShowcaseItem(BaseModel):
     template_description: str = Field(..., description="Description of the template")
     template_url: str = Field(..., description="URL to the original template image")
     result_url: str = Field(..., description="URL to the transformed image")
+    template_image_hash: Optional[str] = Field(None, description="Content hash of the template image in binary storage")
+    result_image_hash: Optional[str] = Field(None, description="Content hash of the transformed image in binary storage")
     likes: int = Field(default=0, description="Number of likes for this transformation")
     username: Optional[str] = Field(None, description="Username of the creator (if available)")
     caption: Optional[str] = Field(None, description="Optional caption for the transformation")
@@ -34,25 +97,593 @@ class ShowcaseItem(BaseModel):
 class ShowcaseResponse(BaseModel):
     items: List[ShowcaseItem] = Field(..., description="List of showcase items")
     total: int = Field(..., description="Total number of showcase items available")
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor for the next page, if there is one")
 
 class ClearShowcaseResponse(BaseModel):
     success: bool = Field(..., description="Whether the operation was successful")
     message: str = Field(..., description="Message describing the result")
 
-# Helper function to ensure we have showcase data
-def ensure_showcase_data() -> List[dict]:
-    """Ensure showcase data exists, creating sample data if needed"""
+# Helpers for storing showcase images as content-addressed blobs
+def store_showcase_image(image_bytes: bytes) -> str:
+    """Store an image in binary storage under its content hash and return the hash"""
+    return store_blob(SHOWCASE_IMAGE_PREFIX, image_bytes)
+
+def externalize_image_url(url: str) -> Tuple[str, Optional[str]]:
+    """Turn an image URL into what a showcase record stores
+    
+    Data URLs are moved into binary storage, and URLs of images this app
+    already stores are reduced to their hash. Records only keep the hash of
+    stored images; their URLs are built when items are served.
+    
+    Returns:
+        Tuple of (url, image_hash). The url is empty when there is a hash;
+        external URLs are returned unchanged with no hash.
+    """
+    image_bytes = decode_data_url(url)
+    if image_bytes is not None:
+        return "", store_showcase_image(image_bytes)
+    image_hash = get_image_hash_from_url(url)
+    if image_hash:
+        return "", image_hash
+    return url, None
+
+def with_image_urls(item: dict) -> dict:
+    """Fill in the URLs of a showcase item's stored images"""
+    for url_field, hash_field in (("result_url", "result_image_hash"), ("template_url", "template_image_hash")):
+        image_hash = item.get(hash_field) or get_image_hash_from_url(item.get(url_field))
+        if image_hash:
+            item[hash_field] = image_hash
+            item[url_field] = get_media_url(image_hash)
+    return item
+
+def migrate_showcase_images(showcase_items: List[dict]) -> bool:
+    """Replace inline data URLs in showcase items with blob references
+    
+    Returns:
+        True if any item was changed
+    """
+    changed = False
+    for item in showcase_items:
+        for url_field, hash_field in (("result_url", "result_image_hash"), ("template_url", "template_image_hash")):
+            url = item.get(url_field)
+            if url and url.startswith("data:"):
+                item[url_field], item[hash_field] = externalize_image_url(url)
+                changed = True
+    return changed
+
+# Showcase storage layout
+#
+# Each item is stored as its own record under "showcase_item_{id}". A compact
+# index holds one entry per item ({"id", "timestamp", "likes"}), newest first,
+# so listing a page only reads the index plus the records on that page.
+# Item records never change after creation and are the source of truth: the
+# index is a read-modify-write document that concurrent adds on different
+# workers can overwrite, so entries missing from it are restored. Each worker
+# re-adds the items it added within SHOWCASE_RECONCILE_SECONDS, and every
+# SHOWCASE_RECONCILE_SECONDS the index is checked against the item records.
+# An item's like count is the base count in its index entry plus the likes it
+# received through any worker.
+#
+# Like counts are sharded over a fixed set of LIKE_SHARD_SLOTS slots. A worker
+# leases a free slot in the "showcase_likes_manifest" document, keeps the likes
+# already in it and adds the likes it receives, so it is the only writer of its
+# "showcase_likes_slot_{n}" document and workers flushing at the same time never
+# overwrite each other's likes. When a worker goes away its lease expires and
+# the next worker to claim the slot carries its likes forward, so the number of
+# shards stays bounded across restarts. Readers merge the slots listed in the
+# manifest, re-reading them every LIKE_SHARDS_TTL seconds.
+#
+# The manifest also holds a reset generation. Clearing the showcase bumps it;
+# workers check it before every flush and drop likes counted before the reset
+# instead of writing them back.
+
+def get_item_storage_key(item_id: str) -> str:
+    """Get the storage key for a single showcase item record"""
+    return sanitize_storage_key(f"{SHOWCASE_ITEM_PREFIX}{item_id}")
+
+def make_index_entry(item: dict) -> dict:
+    """Build the index entry for a showcase item"""
+    return {"id": item["id"], "timestamp": item["timestamp"], "likes": item.get("likes", 0)}
+
+# Showcase rankings
+#
+# "new", "top" and "hot" orderings are kept as sorted key lists in memory and
+# updated incrementally as items and likes arrive. The hot score only depends
+# on an item's likes and creation time (not on the current time), so scores
+# only change when likes change and never need a periodic re-sort.
+
+def get_created_seconds(timestamp: str) -> float:
+    """Get the creation time of a showcase item as epoch seconds"""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+def hot_score(likes: int, timestamp: str) -> float:
+    """Calculate the hot score of an item: log-scaled likes plus a bonus for newer items"""
+    order = math.log10(max(likes, 1))
+    return round(order + (get_created_seconds(timestamp) - HOT_EPOCH) / HOT_DECAY_SECONDS, 7)
+
+class ShowcaseRankings:
+    """Precomputed showcase orderings with cursor pagination"""
+    
+    SORTS = ("new", "top", "hot")
+    # Sort key element types of each ordering (see get_sort_keys)
+    KEY_TYPES = {
+        "new": (CURSOR_NUMBER, str),
+        "top": (int, CURSOR_NUMBER, str),
+        "hot": (CURSOR_NUMBER, CURSOR_NUMBER, str)
+    }
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: Dict[str, list] = {sort: [] for sort in self.SORTS}
+        self._entry_keys: Dict[str, Dict[str, tuple]] = {}
+        self.fingerprint = None
+    
+    @staticmethod
+    def get_sort_keys(entry: dict) -> Dict[str, tuple]:
+        """Build ascending sort keys for an index entry (best item sorts first)"""
+        created = get_created_seconds(entry["timestamp"])
+        likes = entry.get("likes", 0)
+        return {
+            "new": (-created, entry["id"]),
+            "top": (-likes, -created, entry["id"]),
+            "hot": (-hot_score(likes, entry["timestamp"]), -created, entry["id"])
+        }
+    
+    def rebuild(self, index: List[dict]):
+        """Rebuild all orderings from a full index"""
+        entry_keys = {entry["id"]: self.get_sort_keys(entry) for entry in index}
+        keys = {sort: sorted(k[sort] for k in entry_keys.values()) for sort in self.SORTS}
+        with self._lock:
+            self._entry_keys = entry_keys
+            self._keys = keys
+    
+    def upsert(self, entry: dict):
+        """Add an item or update its position after its likes changed"""
+        new_keys = self.get_sort_keys(entry)
+        with self._lock:
+            old_keys = self._entry_keys.get(entry["id"])
+            for sort in self.SORTS:
+                if old_keys:
+                    self._remove_key(sort, old_keys[sort])
+                insort(self._keys[sort], new_keys[sort])
+            self._entry_keys[entry["id"]] = new_keys
+    
+    def remove(self, item_id: str):
+        """Remove an item from all orderings"""
+        with self._lock:
+            old_keys = self._entry_keys.pop(item_id, None)
+            if old_keys:
+                for sort in self.SORTS:
+                    self._remove_key(sort, old_keys[sort])
+    
+    def _remove_key(self, sort: str, key: tuple):
+        """Remove a key from one ordering (called with the lock held)"""
+        keys = self._keys[sort]
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+    
+    def page(self, sort: str, limit: int, offset: int = 0, cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """Get one page of item IDs in the given order
+        
+        Returns:
+            Tuple of (item_ids, next_cursor)
+        """
+        with self._lock:
+            keys = self._keys[sort]
+            start = bisect_right(keys, decode_cursor(sort, cursor, self.KEY_TYPES[sort])) if cursor else offset
+            page_keys = keys[start:start + limit]
+            has_more = start + limit < len(keys)
+        
+        next_cursor = encode_cursor(sort, page_keys[-1]) if page_keys and has_more else None
+        return [key[-1] for key in page_keys], next_cursor
+
+rankings = ShowcaseRankings()
+
+def get_like_shard_key(slot: int) -> str:
+    """Get the storage key of a like shard slot"""
+    return sanitize_storage_key(f"{SHOWCASE_LIKES_PREFIX}slot_{slot}")
+
+def get_stored_likes(item_id: str) -> int:
+    """Get an item's persisted like count: its index base count plus every shard"""
+    base_likes = _index_entries.get(item_id, {}).get("likes", 0)
+    return base_likes + _shard_likes.get(item_id, 0) + _worker_likes.get(item_id, 0)
+
+def with_stored_likes(entry: dict) -> dict:
+    """Get an index entry with its merged like count, for ranking"""
+    return {**entry, "likes": get_stored_likes(entry["id"])}
+
+def migrate_legacy_like_shards() -> dict:
+    """Fold the per-process like shards of earlier versions into slot 0
+    
+    Earlier versions wrote one "showcase_likes_{worker_id}" shard per process.
+    This runs once, when no manifest exists yet.
+    
+    Returns:
+        The new like shard manifest
+    """
+    slot_prefix = get_like_shard_key(0)[:-1]
+    legacy_keys = [stored_file.name for stored_file in db.storage.json.list()
+                   if stored_file.name.startswith(SHOWCASE_LIKES_PREFIX)
+                   and stored_file.name != SHOWCASE_LIKES_MANIFEST_KEY
+                   and not stored_file.name.startswith(slot_prefix)]
+    manifest = {"generation": 0, "slots": {}}
+    if legacy_keys:
+        likes: Dict[str, int] = {}
+        for key in legacy_keys:
+            try:
+                for item_id, count in db.storage.json.get(key).items():
+                    likes[item_id] = likes.get(item_id, 0) + count
+            except FileNotFoundError:
+                continue
+        db.storage.json.put(get_like_shard_key(0), {"generation": 0, "likes": likes})
+        manifest["slots"]["0"] = {"worker": None, "expires": 0}
+    db.storage.json.put(SHOWCASE_LIKES_MANIFEST_KEY, manifest)
+    for key in legacy_keys:
+        try:
+            db.storage.json.delete(key)
+        except Exception as e:
+            print(f"Error deleting legacy like shard {key}: {str(e)}")
+    if legacy_keys:
+        print(f"Folded {len(legacy_keys)} legacy like shards into slot 0")
+    return manifest
+
+def load_like_manifest() -> dict:
+    """Load the like shard manifest: {"generation": int, "slots": {slot: {"worker", "expires"}}}"""
+    try:
+        return db.storage.json.get(SHOWCASE_LIKES_MANIFEST_KEY)
+    except FileNotFoundError:
+        return migrate_legacy_like_shards()
+
+def load_like_shard(slot: int, generation: int) -> Dict[str, int]:
+    """Load the likes in a slot, ignoring likes written before the last reset"""
+    try:
+        shard = db.storage.json.get(get_like_shard_key(slot))
+    except FileNotFoundError:
+        return {}
+    return shard.get("likes", {}) if shard.get("generation") == generation else {}
+
+def holds_like_slot(manifest: dict) -> bool:
+    """Check whether this worker still holds its slot lease in a manifest"""
+    lease = manifest["slots"].get(str(_worker_slot))
+    return lease is not None and lease["worker"] == WORKER_ID
+
+def claim_like_slot(manifest: dict) -> int:
+    """Lease a free like shard slot for this worker (called with _likes_lock held)
+    
+    Storage has no compare-and-swap, so the claim is written and read back;
+    if another worker claimed the same slot at the same time, a different
+    free slot is tried.
+    
+    Returns:
+        The claimed slot
+    
+    Raises:
+        RuntimeError: If every slot is leased by a live worker
+    """
+    global _worker_slot, _worker_likes, _worker_likes_total
+    for _ in range(3):
+        now = time.time()
+        free_slots = [slot for slot in range(LIKE_SHARD_SLOTS)
+                      if manifest["slots"].get(str(slot), {"expires": 0})["expires"] < now]
+        if not free_slots:
+            break
+        # Prefer slots that were used before so likes stay in few documents
+        slot = random.choice(free_slots[:4])
+        manifest["slots"][str(slot)] = {"worker": WORKER_ID, "expires": now + LIKE_SLOT_LEASE_SECONDS}
+        db.storage.json.put(SHOWCASE_LIKES_MANIFEST_KEY, manifest)
+        
+        manifest = load_like_manifest()
+        if manifest["slots"].get(str(slot), {}).get("worker") == WORKER_ID:
+            # Carry forward the likes flushed by the slot's previous holders
+            _worker_slot = slot
+            _worker_likes = load_like_shard(slot, manifest["generation"])
+            _worker_likes_total = sum(_worker_likes.values())
+            return slot
+    raise RuntimeError("No free like shard slot")
+
+def release_like_slot():
+    """Give up this worker's slot lease at shutdown so a new worker can reuse the slot"""
+    with _likes_lock:
+        if _worker_slot is None:
+            return
+        try:
+            manifest = db.storage.json.get(SHOWCASE_LIKES_MANIFEST_KEY)
+            if holds_like_slot(manifest):
+                manifest["slots"][str(_worker_slot)] = {"worker": None, "expires": 0}
+                db.storage.json.put(SHOWCASE_LIKES_MANIFEST_KEY, manifest)
+        except Exception as e:
+            print(f"Error releasing like shard slot {_worker_slot}: {str(e)}")
+
+def reset_like_generation(generation: int):
+    """Forget likes from before a reset (called with _likes_lock held)"""
+    global _like_generation, _worker_slot, _worker_likes, _worker_likes_total, _shard_likes, _shard_likes_total
+    _like_generation = generation
+    _worker_slot = None
+    _worker_likes, _worker_likes_total = {}, 0
+    _shard_likes, _shard_likes_total = {}, 0
+
+def refresh_like_shards(force: bool = False) -> bool:
+    """Re-read the other workers' like shards if they are older than LIKE_SHARDS_TTL
+    
+    Returns:
+        True if the merged like counts changed
+    """
+    global _shard_likes, _shard_likes_total, _shards_loaded_at
+    if not force and time.time() - _shards_loaded_at < LIKE_SHARDS_TTL:
+        return False
+    manifest = load_like_manifest()
+    generation = manifest["generation"]
+    own_slot = str(_worker_slot) if _like_generation == generation else None
+    shard_likes: Dict[str, int] = {}
+    for slot in manifest["slots"]:
+        if slot == own_slot:
+            continue
+        for item_id, likes in load_like_shard(int(slot), generation).items():
+            shard_likes[item_id] = shard_likes.get(item_id, 0) + likes
+    with _likes_lock:
+        reset = generation != _like_generation
+        if reset:
+            reset_like_generation(generation)
+        changed = reset or shard_likes != _shard_likes
+        _shard_likes = shard_likes
+        _shard_likes_total = sum(shard_likes.values())
+        _shards_loaded_at = time.time()
+    return changed
+
+def get_index_fingerprint(index: List[dict]) -> tuple:
+    """Cheap summary of an index and the like shards, used to notice changes made by other workers"""
+    return (len(index), index[0]["id"] if index else None, sum(entry.get("likes", 0) for entry in index),
+            _shard_likes_total + _worker_likes_total)
+
+def remember_index(index: List[dict]):
+    """Record the entries of the most recently read or written index"""
+    global _index, _index_entries, _index_loaded_at
+    _index = index
+    _index_entries = {entry["id"]: entry for entry in index}
+    _index_loaded_at = time.time()
+
+def sync_rankings(index: List[dict]):
+    """Rebuild the rankings if the index or like counts changed since they were built"""
+    fingerprint = get_index_fingerprint(index)
+    if fingerprint != rankings.fingerprint:
+        rankings.rebuild([with_stored_likes(entry) for entry in index])
+        rankings.fingerprint = fingerprint
+
+def merge_index_entries(index: List[dict], entries: List[dict]) -> List[dict]:
+    """Add entries to an index, keeping it newest first"""
+    indexed_ids = {entry["id"] for entry in index}
+    missing = [entry for entry in entries if entry["id"] not in indexed_ids]
+    if not missing:
+        return index
+    return sorted(index + missing, key=lambda entry: entry["timestamp"], reverse=True)
+
+def find_unindexed_items(index: List[dict]) -> List[dict]:
+    """Build index entries for item records that are missing from an index"""
+    global _reconciled_at
+    indexed_ids = {entry["id"] for entry in index}
+    entries = []
+    for stored_file in db.storage.json.list():
+        if not stored_file.name.startswith(SHOWCASE_ITEM_PREFIX):
+            continue
+        item_id = stored_file.name[len(SHOWCASE_ITEM_PREFIX):]
+        if item_id in indexed_ids:
+            continue
+        try:
+            entries.append(make_index_entry(load_showcase_item(item_id)))
+        except (FileNotFoundError, KeyError):
+            continue
+    _reconciled_at = time.time()
+    return entries
+
+def find_missing_entries(index: List[dict]) -> List[dict]:
+    """Find items that exist as records but were dropped from the stored index
+    
+    This worker's recent adds are checked on every load; a full check against
+    the item records runs every SHOWCASE_RECONCILE_SECONDS.
+    """
+    now = time.time()
+    for item_id, (_, added_at) in list(_recent_adds.items()):
+        if now - added_at > SHOWCASE_RECONCILE_SECONDS:
+            _recent_adds.pop(item_id, None)
+    
+    indexed_ids = {entry["id"] for entry in index}
+    missing = [entry for item_id, (entry, _) in list(_recent_adds.items())
+               if item_id not in indexed_ids and item_exists(item_id)]
+    if now - _reconciled_at > SHOWCASE_RECONCILE_SECONDS:
+        missing = merge_index_entries(missing, find_unindexed_items(index))
+    return missing
+
+def load_showcase_index() -> List[dict]:
+    """Load the showcase index, resyncing rankings if another worker changed it or its likes"""
+    index = db.storage.json.get(sanitize_storage_key(SHOWCASE_INDEX_KEY))
+    missing = find_missing_entries(index)
+    if missing:
+        index = merge_index_entries(index, missing)
+        db.storage.json.put(sanitize_storage_key(SHOWCASE_INDEX_KEY), index)
+        print(f"Restored {len(missing)} showcase items missing from the index")
+    remember_index(index)
+    refresh_like_shards()
+    sync_rankings(index)
+    return index
+
+def save_showcase_index(index: List[dict]):
+    """Save the showcase index
+    
+    Callers update the rankings incrementally for the entries they changed.
+    """
+    db.storage.json.put(sanitize_storage_key(SHOWCASE_INDEX_KEY), index)
+    remember_index(index)
+    rankings.fingerprint = get_index_fingerprint(index)
+
+def item_exists(item_id: str) -> bool:
+    """Check storage (not the record cache) for a showcase item record"""
+    try:
+        db.storage.json.get(get_item_storage_key(item_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+def apply_like_deltas(deltas: Dict[str, int]):
+    """Add a batch of like increments to this worker's like shard in a single write"""
+    global _worker_likes, _worker_likes_total
+    with _likes_lock:
+        manifest = load_like_manifest()
+        if manifest["generation"] != _like_generation:
+            # The showcase was cleared: drop likes for the items that went with it
+            if _like_generation is not None:
+                load_showcase_item.cache_clear()
+                deltas = {item_id: amount for item_id, amount in deltas.items() if item_exists(item_id)}
+            reset_like_generation(manifest["generation"])
+        if not deltas:
+            return
+        
+        if _worker_slot is None or not holds_like_slot(manifest):
+            claim_like_slot(manifest)
+        elif manifest["slots"][str(_worker_slot)]["expires"] - time.time() < LIKE_SLOT_LEASE_SECONDS / 2:
+            manifest["slots"][str(_worker_slot)]["expires"] = time.time() + LIKE_SLOT_LEASE_SECONDS
+            db.storage.json.put(SHOWCASE_LIKES_MANIFEST_KEY, manifest)
+        
+        worker_likes = dict(_worker_likes)
+        for item_id, amount in deltas.items():
+            worker_likes[item_id] = worker_likes.get(item_id, 0) + amount
+        # This worker is the only writer of its slot, so no read is needed
+        db.storage.json.put(get_like_shard_key(_worker_slot), {"generation": _like_generation, "likes": worker_likes})
+        _worker_likes = worker_likes
+        _worker_likes_total += sum(deltas.values())
+    
+    for item_id in deltas:
+        entry = _index_entries.get(item_id)
+        if entry is not None:
+            rankings.upsert(with_stored_likes(entry))
+    rankings.fingerprint = get_index_fingerprint(_index)
+
+def clear_like_shards():
+    """Start a new like generation and delete every slot's shard
+    
+    Other workers see the new generation before their next flush and drop
+    the likes they counted for the cleared items.
+    """
+    with _likes_lock:
+        manifest = load_like_manifest()
+        generation = manifest["generation"] + 1
+        db.storage.json.put(SHOWCASE_LIKES_MANIFEST_KEY, {"generation": generation, "slots": {}})
+        for slot in manifest["slots"]:
+            try:
+                db.storage.json.delete(get_like_shard_key(int(slot)))
+            except Exception as e:
+                print(f"Error deleting like shard slot {slot}: {str(e)}")
+        reset_like_generation(generation)
+
+# Registered before the like counter so the lease is released after its final flush
+atexit.register(release_like_slot)
+
+# Likes are counted in memory and flushed to the index in batches
+like_counter = LikeCounter(apply_like_deltas)
+
+def save_showcase_item(item: dict):
+    """Save a single showcase item record"""
+    db.storage.json.put(get_item_storage_key(item["id"]), item)
+
+@lru_cache(maxsize=1024)
+def load_showcase_item(item_id: str) -> dict:
+    """Load a showcase item record (cached, records never change after creation)"""
+    return db.storage.json.get(get_item_storage_key(item_id))
+
+def delete_showcase_items(item_ids: List[str]):
+    """Delete showcase item records"""
+    for item_id in item_ids:
+        try:
+            db.storage.json.delete(get_item_storage_key(item_id))
+        except Exception as e:
+            print(f"Error deleting showcase item {item_id}: {str(e)}")
+    load_showcase_item.cache_clear()
+
+def get_showcase_page(item_ids: List[str]) -> List[dict]:
+    """Load the items for one page, with like counts from the index and like counter"""
+    items = []
+    for item_id in item_ids:
+        try:
+            item = dict(load_showcase_item(item_id))
+        except FileNotFoundError:
+            print(f"Showcase item {item_id} is in the index but has no record")
+            continue
+        item["likes"] = like_counter.merge(item_id, get_stored_likes(item_id))
+        items.append(with_image_urls(item))
+    return items
+
+def write_showcase_items(showcase_items: List[dict]) -> List[dict]:
+    """Write full showcase items as individual records and return their index"""
+    for item in showcase_items:
+        save_showcase_item(item)
+    index = [make_index_entry(item) for item in showcase_items]
+    remember_index(index)
+    rankings.rebuild([with_stored_likes(entry) for entry in index])
+    save_showcase_index(index)
+    return index
+
+def migrate_legacy_showcase() -> Optional[List[dict]]:
+    """Convert the legacy single-document showcase to per-item records
+    
+    Returns:
+        The new index, or None if there is no legacy showcase to migrate
+    """
     try:
         showcase = db.storage.json.get(sanitize_storage_key(SHOWCASE_KEY))
-        if not showcase or len(showcase) == 0:
-            return create_sample_showcase()
-        return showcase
     except FileNotFoundError:
+        return None
+    if not showcase:
+        return None
+    
+    # Legacy items may still embed base64 images
+    migrate_showcase_images(showcase)
+    index = write_showcase_items(showcase)
+    
+    # Drop the legacy document now that the records exist
+    db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), [])
+    print(f"Migrated {len(index)} showcase items to per-item records")
+    return index
+
+# Helper function to ensure we have showcase data
+def ensure_showcase_index() -> List[dict]:
+    """Ensure the showcase index exists, migrating or creating sample data if needed"""
+    try:
+        index = load_showcase_index()
+        if index:
+            return index
+    except FileNotFoundError:
+        with _index_lock:
+            index = migrate_legacy_showcase()
+            if index is None:
+                # The item records survive a lost index, so rebuild it from them
+                entries = find_unindexed_items([])
+                if entries:
+                    index = merge_index_entries([], entries)
+                    rankings.rebuild([with_stored_likes(entry) for entry in index])
+                    save_showcase_index(index)
+        if index:
+            return index
+    with _index_lock:
         return create_sample_showcase()
 
+def get_showcase_index() -> List[dict]:
+    """Get the showcase index, only reading storage when the in-memory copy is stale"""
+    if _index and time.time() - _index_loaded_at < SHOWCASE_INDEX_TTL:
+        if refresh_like_shards():
+            sync_rankings(_index)
+        return _index
+    return ensure_showcase_index()
+
 # Create sample showcase data
 def create_sample_showcase() -> List[dict]:
-    """Create sample showcase data for demonstration"""
+    """Create sample showcase data for demonstration
+    
+    Returns:
+        The showcase index for the sample items
+    """
     # Get existing templates
     try:
         templates = db.storage.json.get(sanitize_storage_key(MEME_TEMPLATES_KEY))
@@ -101,14 +732,20 @@ def create_sample_showcase() -> List[dict]:
         # Sample usernames
         usernames = ["meme_lord", "viral_king", "meme_enthusiast", "doge_lover", "pepe_fan"]
         
+        # Admin-added templates may carry data URLs; keep only a reference
+        template_url, template_image_hash = externalize_image_url(template.get("url", ""))
+        template_image_hash = template.get("image_hash") or template_image_hash
+        
         showcase_items.append({
             "id": f"sample-{i+1}",
             "timestamp": timestamp,
             "template_id": template_id,
             "template_name": template["name"],
             "template_description": template["description"],
-            "template_url": template["url"],
-            "result_url": template["url"],  # In a real system, this would be transformed
+            "template_url": template_url,
+            "result_url": template_url,  # In a real system, this would be transformed
+            "template_image_hash": template_image_hash,
+            "result_image_hash": template_image_hash,
             "likes": random.randint(5, 120),
             "username": random.choice(usernames),
             "caption": random.choice(sample_captions)
@@ -118,24 +755,43 @@ def create_sample_showcase() -> List[dict]:
     showcase_items.sort(key=lambda x: x["timestamp"], reverse=True)
     
     # Save to storage
-    db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), showcase_items)
-    return showcase_items
+    load_showcase_item.cache_clear()
+    return write_showcase_items(showcase_items)
 
 @router.get("/", response_model=ShowcaseResponse)
-async def get_showcase(limit: int = Query(10, description="Number of items to return", ge=1, le=50),
-                      offset: int = Query(0, description="Offset for pagination", ge=0)):
-    """Get public showcase of transformations"""
+async def get_showcase(request: Request,
+                      limit: int = Query(10, description="Number of items to return", ge=1, le=50),
+                      offset: int = Query(0, description="Offset for pagination (ignored when a cursor is given)", ge=0),
+                      sort: Literal["new", "hot", "top"] = Query("new", description="Order of the items"),
+                      cursor: Optional[str] = Query(None, description="Cursor from the previous page's next_cursor")):
+    """Get public showcase of transformations
+    
+    Items can be ordered newest first ("new"), by likes ("top") or by likes
+    decayed by age ("hot"). Use next_cursor to fetch following pages; cursors
+    stay stable as new items and likes arrive.
+    """
     try:
-        # Ensure we have showcase data
-        showcase_items = ensure_showcase_data()
+        # The index comes from memory unless it is stale, and item records are
+        # cached, so a fresh ETag match is answered without touching storage
+        index = get_showcase_index()
+        item_ids, next_cursor = rankings.page(sort, limit, offset=offset, cursor=cursor)
         
-        # Apply pagination
-        paginated_items = showcase_items[offset:offset + limit]
+        # Item records never change, so the page version is the index version,
+        # the query and any likes not yet flushed for the items on the page
+        pending_likes = ",".join(f"{item_id}:{like_counter.pending(item_id)}" for item_id in item_ids)
+        etag = make_etag(f"{rankings.fingerprint}|{sort}|{limit}|{offset}|{cursor}|{pending_likes}")
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return cached_json_response(request, b"", etag, max_age=10, stale_while_revalidate=60)
         
-        return ShowcaseResponse(
-            items=paginated_items,
-            total=len(showcase_items)
+        response = ShowcaseResponse(
+            items=get_showcase_page(item_ids),
+            total=len(index),
+            next_cursor=next_cursor
         )
+        body = response.model_dump_json().encode("utf-8")
+        return cached_json_response(request, body, etag, max_age=10, stale_while_revalidate=60)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting showcase data: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve showcase data")
@@ -144,31 +800,60 @@ async def get_showcase(limit: int = Query(10, description="Number of items to re
 async def like_showcase_item(item_id: str):
     """Add a like to a showcase item"""
     try:
-        showcase_items = ensure_showcase_data()
-        
-        # Find the item by ID
-        for item in showcase_items:
-            if item["id"] == item_id:
-                # Increment likes
-                item["likes"] = item.get("likes", 0) + 1
-                
-                # Save updated showcase
-                db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), showcase_items)
-                
-                return {"success": True, "likes": item["likes"]}
-        
-        # If we get here, item wasn't found
-        raise HTTPException(status_code=404, detail=f"Showcase item {item_id} not found")
+        # Item records are cached, so this does not touch storage for known items
+        try:
+            load_showcase_item(item_id)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Showcase item {item_id} not found")
+        
+        # A fresh worker has not read the stored counts yet
+        if item_id not in _index_entries:
+            try:
+                load_showcase_index()
+            except FileNotFoundError:
+                pass
+        else:
+            refresh_like_shards()
+        
+        # Count the like in memory; it is flushed to this worker's shard in a later batch
+        like_counter.increment(item_id)
+        likes = like_counter.merge(item_id, get_stored_likes(item_id))
+        
+        return {"success": True, "likes": likes}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error liking showcase item: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to like showcase item")
 
+@router.get("/image/{image_hash}")
+def get_showcase_image(image_hash: str):
+    """Serve a showcase image by its content hash
+    
+    Kept for existing authenticated clients; items link to the public media route.
+    """
+    try:
+        # Content-addressed images never change, so they can be cached forever
+        return blob_image_response(SHOWCASE_IMAGE_PREFIX, image_hash)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
 @router.post("/clear", response_model=ClearShowcaseResponse)
 async def clear_showcase():
     """Clear all transformations from the showcase"""
     try:
-        # Save an empty list to the showcase storage
-        db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), [])
+        # Remove item records, then save an empty index
+        with _index_lock:
+            try:
+                index = load_showcase_index()
+            except FileNotFoundError:
+                index = []
+            delete_showcase_items([entry["id"] for entry in index])
+            _recent_adds.clear()
+            clear_like_shards()
+            rankings.rebuild([])
+            save_showcase_index([])
+            db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), [])
         return ClearShowcaseResponse(
             success=True,
             message="All showcase items have been removed successfully. New transformations will appear in the showcase as they are created."
@@ -179,15 +864,21 @@ async def clear_showcase():
 
 # Function to add a real transformation to the showcase
 def add_to_showcase(template_id: str, template_name: str, template_description: str, 
-                    template_url: str, result_url: str, caption: Optional[str] = None,
-                    username: Optional[str] = None) -> dict:
-    """Add a real transformation to the showcase"""
+                    template_url: str, result_url: Optional[str] = None, caption: Optional[str] = None,
+                    username: Optional[str] = None, result_bytes: Optional[bytes] = None) -> dict:
+    """Add a real transformation to the showcase
+    
+    The result image is written to binary storage under its content hash and only
+    a reference is kept in the showcase document. Pass the raw image as result_bytes,
+    or a data URL as result_url.
+    """
     try:
-        # Get existing showcase items
-        try:
-            showcase_items = db.storage.json.get(sanitize_storage_key(SHOWCASE_KEY))
-        except FileNotFoundError:
-            showcase_items = []
+        # Store images as blobs so the showcase document stays small
+        if result_bytes is not None:
+            result_url, result_image_hash = "", store_showcase_image(result_bytes)
+        else:
+            result_url, result_image_hash = externalize_image_url(result_url)
+        template_url, template_image_hash = externalize_image_url(template_url)
         
         # Create new showcase item
         new_item = {
@@ -198,22 +889,46 @@ def add_to_showcase(template_id: str, template_name: str, template_description:
             "template_description": template_description,
             "template_url": template_url,
             "result_url": result_url,
+            "template_image_hash": template_image_hash,
+            "result_image_hash": result_image_hash,
             "likes": 0,
             "username": username,
             "caption": caption
         }
         
-        # Add to the beginning of the list (newest first)
-        showcase_items.insert(0, new_item)
+        # Write the item record before it becomes visible in the index
+        save_showcase_item(new_item)
         
-        # Keep only the most recent 100 items to avoid storage issues
-        if len(showcase_items) > 100:
-            showcase_items = showcase_items[:100]
-        
-        # Save updated showcase
-        db.storage.json.put(sanitize_storage_key(SHOWCASE_KEY), showcase_items)
+        with _index_lock:
+            # Make sure legacy data has been migrated before we add to the index
+            try:
+                index = load_showcase_index()
+            except FileNotFoundError:
+                index = migrate_legacy_showcase() or []
+            
+            # Add to the beginning of the index (newest first); a reconcile
+            # during the load may already have found the new record
+            new_entry = make_index_entry(new_item)
+            index = merge_index_entries(index, [new_entry])
+            rankings.upsert(new_entry)
+            
+            # Keep only the most recent items to bound storage
+            if len(index) > MAX_SHOWCASE_ITEMS:
+                evicted = index[MAX_SHOWCASE_ITEMS:]
+                index = index[:MAX_SHOWCASE_ITEMS]
+                delete_showcase_items([entry["id"] for entry in evicted])
+                for entry in evicted:
+                    rankings.remove(entry["id"])
+            
+            # Save updated index
+            save_showcase_index(index)
+            _recent_adds[new_item["id"]] = (new_entry, time.time())
+            
+            # Another worker may have written the index since we read it; reading
+            # it back restores our entry if that write dropped it
+            load_showcase_index()
         
-        return new_item
+        return with_image_urls(dict(new_item))
     except Exception as e:
         print(f"Error adding to showcase: {str(e)}")
         return None
@@ -0,0 +1,64 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+def get_fingerprint(*parts: Any) -> str:
+    """Fingerprint a request from its parts (bytes are hashed, the rest JSON encoded)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray)):
+            digest.update(hashlib.sha256(part).digest())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class SingleFlight:
+    """Coalesces identical in-flight calls into one
+
+    When a template goes viral, many users send the same request at the same
+    moment. The first caller for a key starts the call; callers arriving while
+    it is in flight await the same result (or error) instead of making their
+    own upstream request. Keys are forgotten as soon as the call finishes, so
+    this only shares work that overlaps in time; caching is left to callers.
+
+    The call runs as its own task, so a caller disconnecting does not cancel it
+    for the others still waiting.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run call() once for all concurrent callers with the same key
+
+        Returns:
+            Tuple of (result, whether this caller shared another caller's call)
+        """
+        task = self._calls.get(key)
+        shared = task is not None and not task.done()
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.leaders += 1
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the error as retrieved in case every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "calls": self.leaders, "coalesced": self.coalesced}
+
+# Shared by the OpenAI and Gemini call sites; keys are prefixed by call type
+ai_flights = SingleFlight("ai")
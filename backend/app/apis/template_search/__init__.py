@@ -0,0 +1,275 @@
+import re
+import math
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+# How much a match in each template field counts towards the score
+FIELD_WEIGHTS = {
+    "id": 2.0,
+    "name": 3.0,
+    "description": 1.0,
+    "prompt": 0.5
+}
+
+# Partial matches: a vocabulary token that starts with the query token scores
+# PREFIX_SIMILARITY; other tokens need at least MIN_TRIGRAM_SIMILARITY of
+# shared trigrams (typos, inflections)
+PREFIX_SIMILARITY = 0.8
+MIN_TRIGRAM_SIMILARITY = 0.45
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase ASCII word tokens"""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(token: str) -> Set[str]:
+    """Get the padded character trigrams of a token"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TemplateSearchIndex:
+    """In-memory inverted index over a template catalog
+
+    Tokens from the id, name, description and prompt are indexed per template
+    with field weights. A trigram index over the vocabulary handles prefixes
+    and typos, so queries only touch the postings of matching tokens. Postings
+    are scored as numpy arrays over per-template slots, built lazily per token.
+
+    Call sync() with the current catalog after writes; only templates whose
+    searchable text changed are reindexed.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._documents: Dict[str, Dict[str, float]] = {}
+        self._signatures: Dict[str, Tuple[str, ...]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._slots: Dict[str, int] = {}
+        self._slot_ids: List[Optional[str]] = []
+        self._free_slots: List[int] = []
+        self._lock = threading.Lock()
+        self.version = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @staticmethod
+    def get_signature(template_id: str, template: Dict[str, Any]) -> Tuple[str, ...]:
+        """Get the searchable text of a template, to detect changes"""
+        return (template_id,) + tuple(str(template.get(field) or "") for field in FIELD_WEIGHTS if field != "id")
+
+    def sync(self, templates: Dict[str, Dict[str, Any]], version=None) -> int:
+        """Bring the index up to date with a catalog
+
+        Args:
+            templates: The full catalog
+            version: Catalog version (e.g. its ETag) to remember
+
+        Returns:
+            Number of templates added, updated or removed
+        """
+        with self._lock:
+            changed = 0
+            for template_id in list(self._documents):
+                if template_id not in templates:
+                    self._remove(template_id)
+                    changed += 1
+            for template_id, template in templates.items():
+                signature = self.get_signature(template_id, template)
+                if self._signatures.get(template_id) != signature:
+                    self._remove(template_id)
+                    self._add(template_id, signature)
+                    changed += 1
+            self.version = version
+            return changed
+
+    def _add(self, template_id: str, signature: Tuple[str, ...]):
+        """Index one template (called with the lock held)"""
+        weights: Dict[str, float] = {}
+        for field, text in zip(FIELD_WEIGHTS, signature):
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            # Long prompts should not outweigh a short name that matches
+            field_weight = FIELD_WEIGHTS[field] / math.sqrt(len(tokens))
+            for token in tokens:
+                weights[token] = weights.get(token, 0.0) + field_weight
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_ids[slot] = template_id
+        else:
+            slot = len(self._slot_ids)
+            self._slot_ids.append(template_id)
+        self._slots[template_id] = slot
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                for trigram in trigrams(token):
+                    self._trigrams.setdefault(trigram, set()).add(token)
+            postings[template_id] = weight
+            self._arrays.pop(token, None)
+
+        self._documents[template_id] = weights
+        self._signatures[template_id] = signature
+
+    def _remove(self, template_id: str):
+        """Drop one template from the index (called with the lock held)"""
+        weights = self._documents.pop(template_id, None)
+        self._signatures.pop(template_id, None)
+        if not weights:
+            return
+        slot = self._slots.pop(template_id)
+        self._slot_ids[slot] = None
+        self._free_slots.append(slot)
+
+        for token in weights:
+            self._arrays.pop(token, None)
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(template_id, None)
+            if not postings:
+                del self._postings[token]
+                for trigram in trigrams(token):
+                    vocabulary = self._trigrams.get(trigram)
+                    if vocabulary is not None:
+                        vocabulary.discard(token)
+                        if not vocabulary:
+                            del self._trigrams[trigram]
+
+    def _posting_arrays(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get a token's postings as (slots, weights) arrays (called with the lock held)"""
+        arrays = self._arrays.get(token)
+        if arrays is None:
+            postings = self._postings[token]
+            slots = np.fromiter((self._slots[template_id] for template_id in postings), dtype=np.int64, count=len(postings))
+            weights = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+            arrays = self._arrays[token] = (slots, weights)
+        return arrays
+
+    def expand_token(self, token: str) -> Dict[str, float]:
+        """Find vocabulary tokens matching a query token, with their similarity"""
+        matches: Dict[str, float] = {}
+        if token in self._postings:
+            matches[token] = 1.0
+
+        query_trigrams = trigrams(token)
+        shared: Dict[str, int] = {}
+        for trigram in query_trigrams:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        for candidate, count in shared.items():
+            if candidate == token:
+                continue
+            if len(token) >= 2 and candidate.startswith(token):
+                similarity = PREFIX_SIMILARITY
+            else:
+                similarity = count / (len(query_trigrams) + len(candidate) + 1 - count)
+                if similarity < MIN_TRIGRAM_SIMILARITY:
+                    continue
+                similarity *= PREFIX_SIMILARITY
+            matches[candidate] = max(matches.get(candidate, 0.0), similarity)
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> Tuple[List[Tuple[str, float]], int]:
+        """Find templates matching every word of a query
+
+        Returns:
+            Tuple of ([(template_id, score)] best first, total number of matches)
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return [], 0
+
+        with self._lock:
+            expansions = [self.expand_token(token) for token in query_tokens]
+            if not all(expansions):
+                return [], 0
+
+            totals: Optional[np.ndarray] = None
+            for matches in expansions:
+                # Best match for this word in each template
+                best = np.zeros(len(self._slot_ids))
+                for candidate, similarity in matches.items():
+                    slots, weights = self._posting_arrays(candidate)
+                    best[slots] = np.maximum(best[slots], weights * similarity)
+
+                # Every query word has to match
+                if totals is None:
+                    totals = best
+                else:
+                    totals = np.where((totals > 0) & (best > 0), totals + best, 0.0)
+
+            matched = np.flatnonzero(totals)
+            if len(matched) > limit:
+                matched = matched[np.argpartition(-totals[matched], limit - 1)[:limit]]
+            results = [(self._slot_ids[slot], float(totals[slot])) for slot in matched]
+            total = int(np.count_nonzero(totals))
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return [(template_id, round(score, 4)) for template_id, score in results], total
+
+def benchmark(templates: int = 10000, queries: int = 200) -> Dict[str, float]:
+    """Build an index over a synthetic catalog and time queries against it
+
+    Usage:
+        python -c "from app.apis.template_search import benchmark; benchmark()"
+    """
+    import random
+    import time
+
+    random.seed(7)
+    themes = ["doge", "pepe", "frog", "laser", "eyes", "anime", "voxel", "pixel", "retro", "cyberpunk",
+              "neon", "wojak", "classic", "viral", "shiba", "cartoon", "vintage", "glitch", "meme", "cat"]
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = themes + ["".join(random.choices(letters, k=random.randint(4, 9))) for _ in range(3000)]
+    # Word frequencies follow a Zipf-like curve, like real descriptions and prompts
+    frequencies = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    catalog = {
+        f"template_{i}": {
+            "name": f"{random.choice(themes)} {random.choice(vocabulary)}".title(),
+            "description": " ".join(random.choices(vocabulary, frequencies, k=12)),
+            "prompt": " ".join(random.choices(vocabulary, frequencies, k=40))
+        }
+        for i in range(templates)
+    }
+
+    index = TemplateSearchIndex()
+    start_time = time.time()
+    index.sync(catalog)
+    build_time = time.time() - start_time
+
+    samples = [random.choice(["doge", "frog las", "cyberpnk", "anim", "neon cat", "retro pixel glitch",
+                              random.choice(vocabulary), random.choice(vocabulary)[:3]])
+               for _ in range(queries)]
+    timings = []
+    for query in samples:
+        start_time = time.perf_counter()
+        index.search(query)
+        timings.append(time.perf_counter() - start_time)
+    timings.sort()
+
+    start_time = time.time()
+    catalog["template_0"] = {**catalog["template_0"], "name": "Renamed Template"}
+    index.sync(catalog)
+    resync_time = time.time() - start_time
+
+    results = {
+        "templates": templates,
+        "build_seconds": build_time,
+        "query_ms": sum(timings) / len(timings) * 1000,
+        "query_p95_ms": timings[int(len(timings) * 0.95)] * 1000,
+        "resync_ms": resync_time * 1000
+    }
+    print(f"Indexed {templates} templates in {build_time:.2f}s, {results['query_ms']:.2f} ms per query "
+          f"(p95 {results['query_p95_ms']:.2f} ms), "
+          f"{results['resync_ms']:.1f} ms to resync one change")
+    return results
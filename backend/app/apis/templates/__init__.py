@@ -1,17 +1,34 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, Response
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, Response, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import databutton as db
-from typing import Dict, List, Optional
-import base64
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from datetime import datetime
 import re
 import requests
 import json
+import io
+import os
+import uuid
+import zipfile
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.apis.common import invalidate_templates, decode_data_url, blob_image_response
+from app.apis.common import store_template_image, load_blob, TEMPLATE_IMAGE_PREFIX
+from app.apis.common import with_template_image_urls, strip_template_image_urls, download_remote_image
+from app.apis.common import TemplateListParams, template_list_params, parse_fields
+from app.apis.common import DEFAULT_TEMPLATE_PAGE_SIZE, get_template_manager, project_template, make_etag, etag_matches, cached_json_response
+from app.apis.common import TEMPLATE_CATALOGS
+from app.apis.catalog_export import export_catalog
+from app.apis.image_processing import generate_template_derivatives, normalize_image
 
 router = APIRouter(prefix="/templates")
 
 # Storage keys
 TEMPLATES_KEY = "meme_templates"
+USAGE_STATS_KEY = "faceswap_usage_stats"
 
 # Helper function for sanitizing storage keys
 def sanitize_storage_key(key: str) -> str:
@@ -38,12 +55,372 @@ class TemplateUpdateRequest(BaseModel):
 class TemplateListResponse(BaseModel):
     templates: Dict[str, Dict]
 
+class TemplatePageResponse(BaseModel):
+    templates: List[Dict]
+    next_cursor: Optional[str] = None
+    total: int
+
 class TemplateResponse(BaseModel):
     success: bool
     message: str
     template_id: Optional[str] = None
     template: Optional[Dict] = None
 
+class ImportJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int = 0
+    processed: int = 0
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[Dict[str, str]] = []
+    template_ids: List[str] = []
+
+# Whether existing data-URL templates have been checked in this process
+_images_migrated = False
+
+# Bulk import limits and workers
+MAX_IMPORT_TEMPLATES = 1000
+MAX_IMPORT_IMAGE_BYTES = 20 * 1024 * 1024
+IMPORT_JOB_PREFIX = "template_import_job_"
+IMPORT_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+_import_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="template-import")
+
+# Import jobs in progress, by job ID; finished jobs are also kept in storage
+_import_jobs: Dict[str, Dict[str, Any]] = {}
+_import_jobs_lock = threading.Lock()
+
+def make_template_id(name: str) -> str:
+    """Create a template ID slug from a name"""
+    # Lowercase, replace spaces with underscores, remove special characters
+    return re.sub(r'[^a-z0-9_]', '', name.lower().replace(' ', '_'))
+
+# Template image helpers
+def set_template_image(template: Dict, image_bytes: bytes):
+    """Store a template image and its derivatives, and reference them from the template
+    
+    The upload is normalized first (EXIF orientation, 8-bit sRGB, capped size,
+    no metadata) and kept as a content-addressed blob; thumbnail, card and
+    working-size derivatives are generated from it in the image worker pool.
+    
+    Raises:
+        ValueError: If the bytes are not a decodable image
+    """
+    normalized = normalize_image(image_bytes)
+    store_template_image(normalized.data)
+    # The URL is built from the hash when the template is served
+    template.pop("url", None)
+    template["image_hash"] = normalized.content_hash
+    template["width"] = normalized.width
+    template["height"] = normalized.height
+    try:
+        template["derivatives"] = generate_template_derivatives(normalized.data)
+    except Exception as e:
+        # The template is still usable from the original image
+        print(f"Error generating template derivatives: {str(e)}")
+        template.pop("derivatives", None)
+
+def migrate_template_images(templates: Dict[str, Dict]) -> int:
+    """Move data-URL template images into binary storage and backfill derivatives
+    
+    Also drops stored image URLs that can be rebuilt from hashes.
+    
+    Returns:
+        Number of templates that were rewritten
+    """
+    migrated = 0
+    for template in templates.values():
+        image_bytes = decode_data_url(template.get("url", ""))
+        if image_bytes is None and template.get("image_hash") and "derivatives" not in template:
+            try:
+                image_bytes = load_blob(TEMPLATE_IMAGE_PREFIX, template["image_hash"])
+            except FileNotFoundError:
+                image_bytes = None
+        if image_bytes is not None:
+            try:
+                set_template_image(template, image_bytes)
+            except ValueError as e:
+                print(f"Skipping undecodable template image: {str(e)}")
+                continue
+            migrated += 1
+        elif strip_template_image_urls(template):
+            migrated += 1
+    return migrated
+
+def ensure_template_images_migrated() -> int:
+    """Run the data-URL migration once per process
+    
+    Returns:
+        Number of templates that were rewritten
+    """
+    global _images_migrated
+    if _images_migrated:
+        return 0
+    try:
+        templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
+    except FileNotFoundError:
+        templates = {}
+    migrated = migrate_template_images(templates)
+    if migrated:
+        db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+        invalidate_templates(TEMPLATES_KEY)
+        print(f"Migrated {migrated} template images to binary storage")
+    _images_migrated = True
+    return migrated
+
+def backfill_remote_template_images() -> int:
+    """Store externally hosted template images and generate their derivatives
+
+    The built-in default templates are seeded with image URLs on a CDN, so
+    they have no stored image and no thumbnail/card/working variants. Images
+    are downloaded without holding the catalog; each template is only written
+    back if it has not been changed in the meantime.
+    
+    Returns:
+        Number of templates that were rewritten
+    """
+    try:
+        templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
+    except FileNotFoundError:
+        return 0
+
+    updated: Dict[str, Tuple[Dict, Dict]] = {}
+    for template_id, template in templates.items():
+        url = template.get("url", "")
+        if template.get("image_hash") or not url.startswith(("http://", "https://")):
+            continue
+        try:
+            image_bytes = download_remote_image(requests.utils.requote_uri(url), MAX_IMPORT_IMAGE_BYTES)
+            backfilled = dict(template)
+            set_template_image(backfilled, image_bytes)
+        except (ValueError, requests.RequestException) as e:
+            print(f"Could not backfill image for template {template_id}: {str(e)}")
+            continue
+        updated[template_id] = (template, backfilled)
+
+    if not updated:
+        return 0
+
+    templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
+    rewritten = 0
+    for template_id, (original, backfilled) in updated.items():
+        if templates.get(template_id) == original:
+            templates[template_id] = backfilled
+            rewritten += 1
+    if rewritten:
+        db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+        invalidate_templates(TEMPLATES_KEY)
+        print(f"Stored images and derivatives for {rewritten} templates")
+    return rewritten
+
+def prepare_template_images():
+    """Seed the default templates if needed, then backfill their images"""
+    try:
+        manager = get_template_manager(TEMPLATES_KEY)
+        if manager is not None:
+            manager.get_templates()
+        ensure_template_images_migrated()
+        backfill_remote_template_images()
+    except Exception as e:
+        print(f"Error preparing template images: {str(e)}")
+
+@router.on_event("startup")
+async def start_template_image_backfill():
+    """Prepare template images in the background so startup is not delayed"""
+    asyncio.ensure_future(run_in_threadpool(prepare_template_images))
+
+# Bulk import helpers
+def parse_import_manifest(lines: List[str]) -> List[Dict[str, Any]]:
+    """Parse NDJSON manifest lines into template entries
+    
+    Each line is a JSON object with "name" and one of "image" (a path inside
+    the uploaded zip), "image_url" or "image_data" (a data URL). "id",
+    "description" and "prompt" are optional.
+    """
+    entries = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON on manifest line {line_number}: {str(e)}")
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise HTTPException(status_code=400, detail=f"Manifest line {line_number} needs a name")
+        if not (entry.get("image") or entry.get("image_url") or entry.get("image_data")):
+            raise HTTPException(status_code=400, detail=f"Manifest line {line_number} needs an image")
+        entries.append(entry)
+    return entries
+
+def read_import_entries(upload_bytes: bytes, filename: str) -> Tuple[List[Dict[str, Any]], Optional[zipfile.ZipFile]]:
+    """Read template entries from an uploaded zip or NDJSON manifest
+    
+    A zip may contain manifest.ndjson; without one, every image in it becomes a
+    template named after its file.
+    
+    Returns:
+        Tuple of (entries, open zip file or None)
+    """
+    if zipfile.is_zipfile(io.BytesIO(upload_bytes)):
+        archive = zipfile.ZipFile(io.BytesIO(upload_bytes))
+        names = archive.namelist()
+        manifest_name = next((name for name in names if os.path.basename(name) in ("manifest.ndjson", "manifest.jsonl")), None)
+        if manifest_name:
+            lines = archive.read(manifest_name).decode("utf-8").splitlines()
+            entries = parse_import_manifest(lines)
+            base_dir = os.path.dirname(manifest_name)
+            for entry in entries:
+                if entry.get("image") and base_dir:
+                    entry["image"] = f"{base_dir}/{entry['image']}"
+        else:
+            entries = []
+            for name in sorted(names):
+                if name.endswith("/") or not name.lower().endswith(IMPORT_IMAGE_EXTENSIONS):
+                    continue
+                stem = os.path.splitext(os.path.basename(name))[0]
+                entries.append({"name": stem.replace("_", " ").replace("-", " ").title(), "image": name})
+        return entries, archive
+    
+    try:
+        lines = upload_bytes.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"{filename} is neither a zip file nor an NDJSON manifest")
+    return parse_import_manifest(lines), None
+
+def load_import_image(entry: Dict[str, Any], archive: Optional[zipfile.ZipFile]) -> bytes:
+    """Get the image bytes for an import entry"""
+    if entry.get("image"):
+        if archive is None:
+            raise ValueError("Image paths are only supported inside a zip upload")
+        info = archive.getinfo(entry["image"])
+        if info.file_size > MAX_IMPORT_IMAGE_BYTES:
+            raise ValueError("Image is too large")
+        return archive.read(info)
+    if entry.get("image_data"):
+        image_bytes = decode_data_url(entry["image_data"])
+        if image_bytes is None:
+            raise ValueError("image_data is not a base64 data URL")
+        return image_bytes
+    
+    return download_remote_image(entry["image_url"], MAX_IMPORT_IMAGE_BYTES)
+
+def compute_landmarks(image_bytes: bytes) -> Optional[Dict[str, List[float]]]:
+    """Precompute face landmarks for a template image, if face detection is available"""
+    try:
+        # Imported here because faceswap loads MediaPipe models at import time
+        from app.apis.faceswap import compute_template_landmarks
+    except ImportError as e:
+        print(f"Face landmarks not available for import: {str(e)}")
+        return None
+    try:
+        return compute_template_landmarks(image_bytes)
+    except Exception as e:
+        # Face swaps fall back to detecting landmarks per request
+        print(f"Error computing template landmarks: {str(e)}")
+        return None
+
+def prepare_import_template(entry: Dict[str, Any], archive: Optional[zipfile.ZipFile]) -> Dict[str, Any]:
+    """Build one template from an import entry (runs in the import pool)
+    
+    Normalizes the image, stores it with its derivatives and precomputes face
+    landmarks, so nothing is left to do at request time.
+    """
+    template = {
+        "name": entry["name"],
+        "description": entry.get("description", ""),
+        "created_at": datetime.now().isoformat()
+    }
+    if entry.get("prompt"):
+        template["prompt"] = entry["prompt"]
+    
+    image_bytes = load_import_image(entry, archive)
+    set_template_image(template, image_bytes)
+    
+    # Landmarks are computed on the working derivative, the image face swaps use
+    working = template.get("derivatives", {}).get("working", {}).get("jpeg", {})
+    landmark_bytes = load_blob(TEMPLATE_IMAGE_PREFIX, working["hash"]) if working.get("hash") else image_bytes
+    landmarks = compute_landmarks(landmark_bytes)
+    if landmarks:
+        template["landmarks"] = landmarks
+    return template
+
+def update_import_job(job_id: str, **changes) -> Dict[str, Any]:
+    """Update an import job's progress and return a copy of it"""
+    with _import_jobs_lock:
+        job = _import_jobs[job_id]
+        job.update(changes)
+        return dict(job)
+
+def save_import_job(job: Dict[str, Any]):
+    """Persist an import job's state so it outlives this process"""
+    try:
+        db.storage.json.put(sanitize_storage_key(f"{IMPORT_JOB_PREFIX}{job['job_id']}"), job)
+    except Exception as e:
+        print(f"Error saving import job {job['job_id']}: {str(e)}")
+
+def run_template_import(job_id: str, entries: List[Dict[str, Any]], archive: Optional[zipfile.ZipFile], overwrite: bool):
+    """Process an import job: prepare templates in parallel, then commit them in one write"""
+    update_import_job(job_id, status="processing")
+    prepared: Dict[str, Dict[str, Any]] = {}
+    
+    try:
+        futures = {
+            _import_pool.submit(prepare_import_template, entry, archive): entry["id"]
+            for entry in entries
+        }
+        for future in as_completed(futures):
+            template_id = futures[future]
+            with _import_jobs_lock:
+                job = _import_jobs[job_id]
+                try:
+                    prepared[template_id] = future.result()
+                except Exception as e:
+                    job["failed"] += 1
+                    job["errors"].append({"template_id": template_id, "error": str(e)})
+                job["processed"] += 1
+        
+        # Commit the whole catalog in a single read-modify-write
+        update_import_job(job_id, status="committing")
+        ensure_template_images_migrated()
+        try:
+            templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
+        except FileNotFoundError:
+            templates = {}
+        
+        imported, skipped = [], 0
+        for entry in entries:
+            template_id = entry["id"]
+            template = prepared.get(template_id)
+            if template is None:
+                continue
+            if template_id in templates and not overwrite:
+                skipped += 1
+                continue
+            templates[template_id] = template
+            imported.append(template_id)
+        
+        if imported:
+            db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+            invalidate_templates(TEMPLATES_KEY)
+        
+        job = update_import_job(job_id, status="completed", imported=len(imported),
+                                skipped=skipped, template_ids=imported)
+        print(f"Import job {job_id}: imported {len(imported)}, skipped {skipped}, failed {job['failed']}")
+    except Exception as e:
+        print(f"Import job {job_id} failed: {str(e)}")
+        with _import_jobs_lock:
+            _import_jobs[job_id]["errors"].append({"template_id": "", "error": str(e)})
+        job = update_import_job(job_id, status="failed")
+    finally:
+        if archive is not None:
+            archive.close()
+    
+    save_import_job(job)
+    with _import_jobs_lock:
+        _import_jobs.pop(job_id, None)
+
 # Authentication helper
 def verify_admin(password: str) -> bool:
     """Verify admin password"""
@@ -60,12 +437,28 @@ def verify_admin(password: str) -> bool:
 
 # API Endpoints
 @router.get("/list")
-def list_templates(password: str = Query(...)):
-    """List all templates in the system"""
+def list_templates(password: str = Query(...), params: TemplateListParams = Depends(template_list_params)):
+    """List all templates in the system
+    
+    Pass fields, sort, limit or cursor to get a TemplatePageResponse instead
+    of every template at once.
+    """
     if not verify_admin(password):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
+        ensure_template_images_migrated()
+        
+        if params.is_paged():
+            # The faceswap manager owns the default templates for this catalog
+            template_manager = get_template_manager(TEMPLATES_KEY)
+            if template_manager is None:
+                raise HTTPException(status_code=503, detail="Template catalog is not available")
+            items, next_cursor, total, _ = template_manager.page_templates(
+                params.sort or "default", params.limit or DEFAULT_TEMPLATE_PAGE_SIZE,
+                params.cursor, parse_fields(params.fields))
+            return TemplatePageResponse(templates=items, next_cursor=next_cursor, total=total)
+        
         # Get templates from storage
         try:
             templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
@@ -73,7 +466,11 @@ def list_templates(password: str = Query(...)):
             # Return empty dict if no templates exist
             templates = {}
         
-        return TemplateListResponse(templates=templates)
+        return TemplateListResponse(templates={
+            template_id: with_template_image_urls(template) for template_id, template in templates.items()
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error listing templates: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to list templates: {str(e)}")
@@ -100,10 +497,9 @@ async def add_template(name: str = Form(...),
         
         # Generate template ID if not provided
         if not template_id:
-            # Create slug from name: lowercase, replace spaces with underscores
-            template_id = name.lower().replace(' ', '_')
-            # Remove special characters
-            template_id = re.sub(r'[^a-z0-9_]', '', template_id)
+            template_id = make_template_id(name)
+        
+        ensure_template_images_migrated()
         
         # Get existing templates
         try:
@@ -115,23 +511,17 @@ async def add_template(name: str = Form(...),
         if template_id in templates:
             raise HTTPException(status_code=400, detail=f"Template ID '{template_id}' already exists")
         
-        # Upload image to databutton static storage
-        # For this demo, we'll store the image data directly in binary storage
-        template_image_key = sanitize_storage_key(f"template_{template_id}_image")
-        db.storage.binary.put(template_image_key, image_bytes)
-        
-        # Create image URL using data URL for demonstration
-        # In a production app, you might use a CDN or other storage service
-        image_extension = image.filename.split('.')[-1] if '.' in image.filename else 'png'
-        image_data_url = f"data:image/{image_extension};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-        
-        # Create new template
+        # Create new template; the image lives in binary storage under its
+        # content hash and the template only keeps a reference to it
         template = {
             "name": name,
             "description": description,
-            "url": image_data_url,
             "created_at": datetime.now().isoformat()
         }
+        try:
+            await run_in_threadpool(set_template_image, template, image_bytes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Add prompt if provided
         if prompt:
@@ -142,12 +532,13 @@ async def add_template(name: str = Form(...),
         
         # Save templates
         db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+        invalidate_templates(TEMPLATES_KEY)
         
         return TemplateResponse(
             success=True,
             message=f"Template '{name}' added successfully",
             template_id=template_id,
-            template=template
+            template=with_template_image_urls(template)
         )
     except HTTPException:
         raise
@@ -167,6 +558,8 @@ async def update_template(template_id: str,
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
+        ensure_template_images_migrated()
+        
         # Get existing templates
         try:
             templates = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
@@ -201,28 +594,24 @@ async def update_template(template_id: str,
             if not content_type or not content_type.startswith('image/'):
                 raise HTTPException(status_code=400, detail="Invalid file type. Only images are accepted.")
             
-            # Update image in storage
-            template_image_key = sanitize_storage_key(f"template_{template_id}_image")
-            db.storage.binary.put(template_image_key, image_bytes)
-            
-            # Create image URL using data URL for demonstration
-            image_extension = image.filename.split('.')[-1] if '.' in image.filename else 'png'
-            image_data_url = f"data:image/{image_extension};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-            
-            # Update template URL
-            template["url"] = image_data_url
+            # Store the new image and its derivatives and point the template at them
+            try:
+                await run_in_threadpool(set_template_image, template, image_bytes)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
         # Update modified timestamp
         template["updated_at"] = datetime.now().isoformat()
         
         # Save templates
         db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+        invalidate_templates(TEMPLATES_KEY)
         
         return TemplateResponse(
             success=True,
             message=f"Template '{template_id}' updated successfully",
             template_id=template_id,
-            template=template
+            template=with_template_image_urls(template)
         )
     except HTTPException:
         raise
@@ -252,8 +641,10 @@ def delete_template(template_id: str, password: str = Query(...)):
         
         # Save updated templates
         db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), templates)
+        invalidate_templates(TEMPLATES_KEY)
         
-        # Try to delete template image
+        # Content-addressed images may be shared with other templates, so only
+        # the legacy per-template image key is removed here
         try:
             template_image_key = sanitize_storage_key(f"template_{template_id}_image")
             # Note: db.storage.binary.delete doesn't exist in the current SDK, so this will fail
@@ -277,3 +668,157 @@ def delete_template(template_id: str, password: str = Query(...)):
     except Exception as e:
         print(f"Error deleting template: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete template: {str(e)}")
+
+@router.get("/search")
+def search_templates(request: Request,
+                     q: str = Query(..., description="Search text", min_length=1, max_length=200),
+                     catalog: Literal["faceswap", "meme_generator", "gemini"] = Query("faceswap", description="Template catalog to search"),
+                     limit: int = Query(20, description="Maximum number of results", ge=1, le=100),
+                     fields: Optional[str] = Query(None, description="Comma-separated fields to include, e.g. id,name,thumbnail")):
+    """Search templates by name, description and prompt
+    
+    Every word of the query has to match, either exactly, as a prefix or with
+    a small typo. Results are ranked by where and how well they match; name
+    matches rank highest.
+    """
+    manager = get_template_manager(TEMPLATE_CATALOGS[catalog])
+    if manager is None:
+        raise HTTPException(status_code=404, detail=f"Catalog '{catalog}' is not available")
+    
+    try:
+        index = manager.get_search_index()
+        etag = make_etag(f"{index.version}|{q}|{catalog}|{limit}|{fields}")
+        # The results only depend on the index version and the query, so a
+        # client that has them is answered before searching
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return cached_json_response(request, b"", etag, max_age=30, stale_while_revalidate=300)
+        
+        matches, total = index.search(q, limit)
+        templates = manager.get_templates()
+        results = []
+        for template_id, score in matches:
+            if template_id in templates:
+                result = project_template(template_id, templates[template_id], parse_fields(fields))
+                result["score"] = score
+                results.append(result)
+        
+        body = json.dumps({"query": q, "results": results, "total": total},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cached_json_response(request, body, etag, max_age=30, stale_while_revalidate=300)
+    except Exception as e:
+        print(f"Error searching templates: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to search templates: {str(e)}")
+
+@router.get("/image/{image_hash}")
+def get_template_image(image_hash: str):
+    """Serve a template image by its content hash"""
+    try:
+        # Content-addressed images never change, so they can be cached forever
+        return blob_image_response(TEMPLATE_IMAGE_PREFIX, image_hash)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+@router.post("/bulk-import")
+async def bulk_import_templates(background_tasks: BackgroundTasks,
+                                file: UploadFile = File(...),
+                                overwrite: bool = Form(False),
+                                password: str = Form(...)) -> ImportJobResponse:
+    """Import many templates at once from a zip or NDJSON manifest
+    
+    Images are normalized, resized into derivatives and analyzed for face
+    landmarks in a worker pool, and the catalog is written once at the end.
+    Poll GET /templates/bulk-import/{job_id} for progress.
+    
+    Args:
+        file: A zip of images (optionally with manifest.ndjson), or an NDJSON manifest
+        overwrite: Replace existing templates with the same ID instead of skipping them
+        password: Admin password
+    """
+    if not verify_admin(password):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    try:
+        upload_bytes = await file.read()
+        entries, archive = await run_in_threadpool(read_import_entries, upload_bytes, file.filename or "upload")
+        if not entries:
+            raise HTTPException(status_code=400, detail="No templates found in upload")
+        if len(entries) > MAX_IMPORT_TEMPLATES:
+            raise HTTPException(status_code=400, detail=f"Too many templates (max {MAX_IMPORT_TEMPLATES})")
+        
+        # Resolve IDs up front so duplicates within the upload are caught early
+        seen = set()
+        for entry in entries:
+            entry["id"] = str(entry.get("id") or make_template_id(entry["name"])).strip()
+            if not entry["id"]:
+                raise HTTPException(status_code=400, detail=f"Template '{entry['name']}' has no usable ID")
+            if entry["id"] in seen:
+                raise HTTPException(status_code=400, detail=f"Duplicate template ID '{entry['id']}' in upload")
+            seen.add(entry["id"])
+        
+        job_id = str(uuid.uuid4())
+        job = ImportJobResponse(job_id=job_id, status="queued", total=len(entries)).model_dump()
+        with _import_jobs_lock:
+            _import_jobs[job_id] = job
+        
+        background_tasks.add_task(run_template_import, job_id, entries, archive, overwrite)
+        return ImportJobResponse(**job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error starting template import: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to start template import: {str(e)}")
+
+@router.get("/bulk-import/{job_id}")
+def get_import_job(job_id: str, password: str = Query(...)) -> ImportJobResponse:
+    """Get the progress of a bulk import job"""
+    if not verify_admin(password):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    with _import_jobs_lock:
+        job = _import_jobs.get(job_id)
+        if job is not None:
+            return ImportJobResponse(**job)
+    
+    try:
+        return ImportJobResponse(**db.storage.json.get(sanitize_storage_key(f"{IMPORT_JOB_PREFIX}{job_id}")))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Import job '{job_id}' not found")
+
+@router.post("/export")
+async def export_static_catalog(password: str = Query(...)):
+    """Write the merged template catalog to the static export directory
+    
+    Needs CATALOG_EXPORT_DIR to be set. After the first export, the catalog is re-exported automatically whenever
+    templates change.
+    """
+    if not verify_admin(password):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    try:
+        return await run_in_threadpool(export_catalog)
+    except ValueError as e:
+        # The export directory is not configured
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"Error exporting catalog: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to export catalog: {str(e)}")
+
+@router.post("/migrate-images")
+def migrate_images(password: str = Query(...)):
+    """Move data-URL and externally hosted template images into binary storage
+    
+    This is a one-time migration for templates added before images were stored
+    by content hash. It is safe to run more than once.
+    """
+    if not verify_admin(password):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    global _images_migrated
+    try:
+        _images_migrated = False
+        migrated = ensure_template_images_migrated()
+        migrated += backfill_remote_template_images()
+        return TemplateResponse(success=True, message=f"Migrated {migrated} template images to binary storage")
+    except Exception as e:
+        print(f"Error migrating template images: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to migrate template images: {str(e)}")
@@ -0,0 +1,588 @@
+import time
+import base64
+import asyncio
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
+import databutton as db
+
+from app.apis.common import get_image_media_type, sanitize_storage_key, invalidate_templates, TemplateManager
+from app.apis.image_processing import normalize_image, prepare_provider_image, ProviderImage
+from app.apis.single_flight import ai_flights
+
+# Transformed images kept in memory, keyed by input image, backend and prompt
+RESULT_CACHE_SIZE = 64
+RESULT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Backends tried in order for a transformation: Gemini, then GPT-4o Vision with DALL-E 3
+DEFAULT_BACKENDS = ("gemini", "openai")
+
+# Seconds between re-reading API keys from secrets, so rotated keys are picked up
+SECRET_REFRESH_SECONDS = 300
+
+# Threads for blocking provider SDK calls, kept apart from the threadpool
+# FastAPI uses for sync endpoints so slow generations cannot starve them
+IO_POOL_SIZE = 32
+_io_pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="transform-io")
+
+class BackendBusyError(Exception):
+    """Raised when too many requests are already waiting for a backend"""
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking provider call in the I/O pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_pool, functools.partial(func, *args, **kwargs))
+
+class TransformJob(NamedTuple):
+    """One image transformation request, independent of the backend"""
+    image_bytes: bytes
+    mime_type: str
+    prompt: str
+    template_id: str
+
+class TransformResult(NamedTuple):
+    """A transformed image and how it was produced"""
+    image_bytes: bytes
+    backend: str
+    cached: bool
+    seconds: float
+
+class TransformBackend:
+    """Base class for transformation backends
+
+    Subclasses implement transform(); the engine handles concurrency limits,
+    caching, fallbacks and stats around it. At most max_concurrency calls run
+    at once; up to max_waiting more wait for a slot before requests are
+    rejected with BackendBusyError.
+    """
+    name = "base"
+    max_concurrency = 4
+    max_waiting = 16
+
+    async def transform(self, engine: "TransformEngine", job: TransformJob) -> bytes:
+        raise NotImplementedError
+
+class GeminiBackend(TransformBackend):
+    """Gemini image generation with the job prompt and the user image as reference"""
+    name = "gemini"
+    max_concurrency = 8
+    max_waiting = 32
+    model_name = "gemini-2.0-flash-exp-image-generation"
+
+    def get_api_key(self, engine: "TransformEngine", refresh: bool = False) -> str:
+        """Get the Gemini API key from the secret cache"""
+        api_key = engine.get_secret("GEMINI_API_KEY", refresh=refresh)
+        if not api_key:
+            api_key = engine.get_secret("SEGMIND_API_KEY", refresh=refresh)  # Fallback to try another key
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found in secrets")
+        return api_key
+
+    def get_model(self, engine: "TransformEngine", refresh: bool = False):
+        """Get the shared Gemini model handle
+
+        The model is created once per API key. genai.configure() sets global
+        state, so it only runs here, under the engine's client lock, when the
+        first model is created or the key has been rotated.
+        """
+        api_key = self.get_api_key(engine, refresh)
+
+        def create_model():
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            return genai.GenerativeModel(self.model_name)
+        return engine.get_client(self.name, create_model, version=hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def is_auth_error(error: Exception) -> bool:
+        """Check whether an error means the API key was rejected"""
+        return type(error).__name__ in ("PermissionDenied", "Unauthenticated") or "API key" in str(error)
+
+    @staticmethod
+    def build_request(job: TransformJob, image: ProviderImage) -> Dict[str, Any]:
+        """Build the generate_content arguments for a job and its prepared image"""
+        contents = (
+            f"Using the following image as reference, {job.prompt}. "
+            f"Maintain the pose, general composition, and key elements of the original image while transforming it."
+        )
+        input_parts = [
+            {"text": contents},
+            {"inline_data": {"mime_type": image.media_type, "data": image.to_base64()}}
+        ]
+        # Configure the generation to return both text and image
+        return {"contents": input_parts, "generation_config": {"response_modalities": ["Text", "Image"]}}
+
+    @staticmethod
+    def extract_image(response) -> bytes:
+        """Get the generated image from a Gemini response"""
+        for part in response.candidates[0].content.parts:
+            if hasattr(part, "inline_data") and part.inline_data is not None:
+                return base64.b64decode(part.inline_data.data)
+        raise ValueError("No image was generated in the response")
+
+    async def generate(self, model, job: TransformJob) -> bytes:
+        """Call Gemini without blocking the event loop"""
+        # Downscale and re-encode the image to Gemini's effective input resolution
+        image = await run_io(prepare_provider_image, job.image_bytes, "gemini")
+        request = self.build_request(job, image)
+        if hasattr(model, "generate_content_async"):
+            response = await model.generate_content_async(**request)
+        else:
+            response = await run_io(model.generate_content, **request)
+        return self.extract_image(response)
+
+    async def transform(self, engine: "TransformEngine", job: TransformJob) -> bytes:
+        model = self.get_model(engine)
+        try:
+            return await self.generate(model, job)
+        except Exception as e:
+            if not self.is_auth_error(e):
+                raise
+            # The key may have been rotated since it was cached: re-read it and retry once
+            refreshed_model = self.get_model(engine, refresh=True)
+            if refreshed_model is model:
+                raise
+            print("Gemini API key changed, retrying with the new key")
+            return await self.generate(refreshed_model, job)
+
+class OpenAIBackend(TransformBackend):
+    """GPT-4o vision analysis followed by DALL-E 3 generation"""
+    name = "openai"
+    max_concurrency = 4
+
+    async def transform(self, engine: "TransformEngine", job: TransformJob) -> bytes:
+        from app.apis.openai import transform_image_with_gpt4_vision, get_openai_client
+        # The shared AsyncOpenAI client handles key rotation itself
+        image_bytes, _ = await transform_image_with_gpt4_vision(get_openai_client(), job.image_bytes, job.template_id, job.prompt)
+        return image_bytes
+
+class TransformEngine:
+    """Shared image transformation engine for all transform endpoints
+
+    Owns one client per backend, a concurrency limit per backend, an LRU cache
+    of results and per-backend stats, so every endpoint that transforms images
+    benefits from the same optimizations.
+    """
+
+    def __init__(self, backends: Sequence[TransformBackend]):
+        self.backends: Dict[str, TransformBackend] = {backend.name: backend for backend in backends}
+        self._clients: Dict[str, Tuple[Any, Any]] = {}
+        self._clients_lock = threading.Lock()
+        self._secrets: Dict[str, Tuple[Optional[str], float]] = {}
+        self._secrets_lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._results: "OrderedDict[str, bytes]" = OrderedDict()
+        self._results_bytes = 0
+        self._results_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._max_wait: Dict[str, float] = {}
+        self._stats_lock = threading.Lock()
+
+    def get_secret(self, name: str, refresh: bool = False) -> Optional[str]:
+        """Get a secret, re-reading it at most every SECRET_REFRESH_SECONDS"""
+        now = time.time()
+        cached = self._secrets.get(name)
+        if cached is not None and not refresh and now - cached[1] < SECRET_REFRESH_SECONDS:
+            return cached[0]
+        with self._secrets_lock:
+            cached = self._secrets.get(name)
+            if cached is not None and not refresh and now - cached[1] < SECRET_REFRESH_SECONDS:
+                return cached[0]
+            try:
+                value = db.secrets.get(name)
+            except Exception as e:
+                # Keep using the last known value if the secret store is unavailable
+                print(f"Error reading secret {name}: {str(e)}")
+                if cached is None:
+                    raise
+                value = cached[0]
+            self._secrets[name] = (value, now)
+            return value
+
+    def get_client(self, name: str, factory: Callable[[], Any], version: Any = None) -> Any:
+        """Get a shared client, creating it on first use
+
+        Args:
+            name: Client name, usually the backend name
+            factory: Creates the client
+            version: Identifies the client's configuration (e.g. a key hash);
+                the client is recreated when it changes
+        """
+        cached = self._clients.get(name)
+        if cached is None or cached[0] != version:
+            with self._clients_lock:
+                cached = self._clients.get(name)
+                if cached is None or cached[0] != version:
+                    if cached is not None:
+                        print(f"Configuration for {name} client changed, recreating it")
+                    cached = self._clients[name] = (version, factory())
+        return cached[1]
+
+    def reset_client(self, name: str):
+        """Drop a shared client so the next call creates a new one"""
+        with self._clients_lock:
+            self._clients.pop(name, None)
+
+    def get_semaphore(self, name: str) -> asyncio.Semaphore:
+        """Get the concurrency limit for a backend (created on the running event loop)"""
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = self._semaphores[name] = asyncio.Semaphore(self.backends[name].max_concurrency)
+        return semaphore
+
+    @staticmethod
+    def get_cache_key(backend: str, job: TransformJob) -> str:
+        """Key a result by input image, backend, prompt and template"""
+        digest = hashlib.sha256(job.image_bytes)
+        digest.update(f"|{backend}|{job.template_id}|{job.prompt}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_cached_result(self, cache_key: str) -> Optional[bytes]:
+        with self._results_lock:
+            result = self._results.get(cache_key)
+            if result is not None:
+                self._results.move_to_end(cache_key)
+            return result
+
+    def cache_result(self, cache_key: str, image_bytes: bytes):
+        with self._results_lock:
+            if cache_key in self._results:
+                return
+            self._results[cache_key] = image_bytes
+            self._results_bytes += len(image_bytes)
+            while self._results and (len(self._results) > RESULT_CACHE_SIZE or self._results_bytes > RESULT_CACHE_MAX_BYTES):
+                _, evicted = self._results.popitem(last=False)
+                self._results_bytes -= len(evicted)
+
+    def record(self, backend: str, **increments: float):
+        """Add to a backend's stats counters"""
+        with self._stats_lock:
+            stats = self._stats.setdefault(backend, {
+                "requests": 0, "cache_hits": 0, "coalesced": 0, "successes": 0, "failures": 0, "rejected": 0,
+                "in_flight": 0, "waiting": 0, "total_seconds": 0.0, "total_wait_seconds": 0.0
+            })
+            for key, value in increments.items():
+                stats[key] += value
+
+    def record_wait(self, backend: str, seconds: float):
+        """Record how long a request waited for a backend slot"""
+        self.record(backend, total_wait_seconds=seconds)
+        with self._stats_lock:
+            self._max_wait[backend] = max(self._max_wait.get(backend, 0.0), seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-backend stats (including queue depth and wait times) and cache usage"""
+        with self._stats_lock:
+            backends = {}
+            for name, stats in self._stats.items():
+                backends[name] = dict(stats)
+                backends[name]["average_seconds"] = round(stats["total_seconds"] / stats["successes"], 3) if stats["successes"] else 0
+                started = (stats["requests"] - stats["cache_hits"] - stats["coalesced"]
+                           - stats["rejected"] - stats["waiting"])
+                backends[name]["average_wait_seconds"] = round(stats["total_wait_seconds"] / started, 3) if started > 0 else 0
+                backends[name]["max_wait_seconds"] = round(self._max_wait.get(name, 0.0), 3)
+                backends[name]["max_concurrency"] = self.backends[name].max_concurrency
+        with self._results_lock:
+            cache = {"entries": len(self._results), "bytes": self._results_bytes}
+        return {"backends": backends, "result_cache": cache}
+
+    async def run_backend(self, name: str, job: TransformJob) -> TransformResult:
+        """Run one backend with caching, its concurrency limit and stats"""
+        self.record(name, requests=1)
+        cache_key = self.get_cache_key(name, job)
+        cached = self.get_cached_result(cache_key)
+        if cached is not None:
+            self.record(name, cache_hits=1)
+            return TransformResult(cached, name, True, 0.0)
+
+        # Identical requests already in flight share that call (and its slot)
+        result, shared = await ai_flights.run(
+            f"transform:{cache_key}", lambda: self.run_uncached(name, job, cache_key)
+        )
+        if shared:
+            self.record(name, coalesced=1)
+            return TransformResult(result.image_bytes, name, True, 0.0)
+        return result
+
+    async def run_uncached(self, name: str, job: TransformJob, cache_key: str) -> TransformResult:
+        """Call a backend within its concurrency limit and cache the result"""
+        # Wait for a slot, unless the queue for this backend is already full
+        backend = self.backends[name]
+        semaphore = self.get_semaphore(name)
+        if semaphore.locked():
+            with self._stats_lock:
+                waiting = self._stats[name]["waiting"]
+            if waiting >= backend.max_waiting:
+                self.record(name, rejected=1)
+                raise BackendBusyError(f"Too many requests waiting for {name}")
+
+        wait_start = time.time()
+        self.record(name, waiting=1)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.record(name, waiting=-1)
+        self.record_wait(name, time.time() - wait_start)
+
+        try:
+            self.record(name, in_flight=1)
+            start_time = time.time()
+            try:
+                image_bytes = await backend.transform(self, job)
+            except Exception:
+                self.record(name, failures=1)
+                raise
+            finally:
+                self.record(name, in_flight=-1)
+        finally:
+            semaphore.release()
+
+        seconds = time.time() - start_time
+        self.record(name, successes=1, total_seconds=seconds)
+        self.cache_result(cache_key, image_bytes)
+        return TransformResult(image_bytes, name, False, seconds)
+
+    async def transform(self, job: TransformJob, backends: Sequence[str] = DEFAULT_BACKENDS) -> TransformResult:
+        """Transform an image, trying each backend in order until one succeeds
+
+        Raises:
+            ValueError: If the input is rejected
+            Exception: The last backend's error if every backend fails
+        """
+        last_error: Optional[Exception] = None
+        for name in backends:
+            try:
+                return await self.run_backend(name, job)
+            except Exception as e:
+                print(f"Transform backend {name} failed: {str(e)}")
+                last_error = e
+        raise last_error if last_error else ValueError("No transform backend available")
+
+engine = TransformEngine([GeminiBackend(), OpenAIBackend()])
+
+# Prompt-driven transform templates, shared by the meme_generator and
+# gemini_transform routers (one catalog, template cache and set of usage stats)
+TEMPLATES_KEY = "meme_generator_templates"
+USAGE_STATS_KEY = "meme_generator_usage_stats"
+
+# Catalog gemini_transform used to keep separately (see merge_legacy_gemini_templates)
+LEGACY_GEMINI_TEMPLATES_KEY = "gemini_meme_templates"
+
+# Default templates with Gemini-specific prompts
+DEFAULT_TEMPLATES = {
+    "doge": {
+        "name": "Doge",
+        "description": "The iconic Shiba Inu meme that became a global sensation",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/doge_classic.jpg",
+        "prompt": "Transform this person into the iconic 'Doge' Shiba Inu meme. Keep their pose and expression, but make them look like the famous Doge meme with golden/tan fur, pointed ears, and the characteristic skeptical/surprised expression. Make it convincing and maintain the person's original emotion and composition."
+    },
+    "pepe": {
+        "name": "Pepe",
+        "description": "The internet's favorite green frog character",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/pepe_classic.jpg",
+        "prompt": "Transform this person into the iconic 'Pepe the Frog' meme character. Maintain their pose and expression, but give them Pepe's green skin, large eyes, and red lips. Keep the same facial expression as the original photo but in Pepe style. Make it a high-quality, convincing transformation."
+    },
+    "btc_laser_eyes": {
+        "name": "Laser Eyes",
+        "description": "Add intense glowing laser eyes for a dramatic effect",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/laser_eyes_generic.jpg",
+        "prompt": "Add glowing, intense red/orange laser eyes to this person's photo. The lasers should emerge dramatically from their eyes, creating an intense, powerful effect. Don't change anything else about the person or the background - just add the glowing laser eyes. Make it look realistic but stylized like a viral internet meme."
+    },
+    "voxel": {
+        "name": "Voxel Art",
+        "description": "Transform your photo into vibrant 3D voxel art",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/voxel_example.jpg",
+        "prompt": "Transform this person's photo into a colorful, vibrant 3D voxel art style. Convert everything to a cube-based aesthetic with a limited color palette, resembling pixel art but in 3D. Maintain the person's recognizable features and pose. Make it look like something from a stylized voxel video game with clean, distinct cubes."
+    },
+    "anime": {
+        "name": "Anime",
+        "description": "Convert your photo into Japanese anime style",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/anime_example.jpg",
+        "prompt": "Transform this person into a high-quality anime character in Japanese anime style. Give them large expressive eyes, simplified facial features, and stylized hair that matches their original color but in anime style. Maintain their original pose, clothing, and background, but convert everything to anime aesthetic. Make it look like a frame from a modern anime show."
+    },
+    "pixel_art": {
+        "name": "Pixel Art",
+        "description": "Transform your photo into retro pixel art style",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/pixel_art_example.jpg",
+        "prompt": "Convert this person's photo into authentic pixel art style with a limited color palette. Make it look like it belongs in a retro video game from the 80s or 90s with clear pixel blocks. Keep the person recognizable by maintaining their key features, pose, and colors, but simplify everything into a grid of distinct pixels with no anti-aliasing or gradients."
+    },
+    "wojak": {
+        "name": "Wojak",
+        "description": "Transform into the iconic Wojak/Feels Guy meme",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/wojak_example.jpg",
+        "prompt": "Transform this person into the 'Wojak' (also known as 'Feels Guy') meme character. Keep their pose and general expression, but give them the characteristic Wojak minimalist line art style with a bald head, simple facial features, and that distinct melancholic expression. Maintain their clothing and background but in the simplified Wojak style."
+    },
+    "cyberpunk": {
+        "name": "Cyberpunk",
+        "description": "Transform into a futuristic cyberpunk character",
+        "url": "https://static.databutton.com/public/ec7be075-eaf6-40e6-b540-920274c1dc36/cyberpunk_example.jpg",
+        "prompt": "Transform this person into a cyberpunk character with neon lights, cybernetic implants, and a futuristic dystopian aesthetic. Add glowing elements, tech lines, or subtle HUD elements around their features. Keep their pose and general appearance, but add cybernetic enhancements, modified clothing with tech elements, and a blue/purple/pink neon color scheme typical of the cyberpunk genre."
+    },
+}
+
+template_manager = TemplateManager(TEMPLATES_KEY, USAGE_STATS_KEY, DEFAULT_TEMPLATES)
+
+def merge_legacy_gemini_templates() -> int:
+    """Copy templates that only exist in the old gemini_transform catalog into the shared one
+
+    Templates already in the shared catalog are left alone, so this is safe to
+    run on every startup; the old catalog is kept as it was.
+
+    Returns:
+        Number of templates copied
+    """
+    try:
+        legacy = db.storage.json.get(sanitize_storage_key(LEGACY_GEMINI_TEMPLATES_KEY))
+    except FileNotFoundError:
+        return 0
+    templates = template_manager.get_templates()
+    missing = {template_id: template for template_id, template in legacy.items() if template_id not in templates}
+    if not missing:
+        return 0
+    try:
+        stored = db.storage.json.get(sanitize_storage_key(TEMPLATES_KEY))
+    except FileNotFoundError:
+        stored = dict(templates)
+    for template_id, template in missing.items():
+        stored.setdefault(template_id, template)
+    db.storage.json.put(sanitize_storage_key(TEMPLATES_KEY), stored)
+    invalidate_templates(TEMPLATES_KEY)
+    print(f"Merged {len(missing)} templates from {LEGACY_GEMINI_TEMPLATES_KEY} into {TEMPLATES_KEY}")
+    return len(missing)
+
+
+async def transform_uploaded_image(user_image: UploadFile, template_id: str, template_manager,
+                                   backends: Sequence[str] = DEFAULT_BACKENDS) -> TransformResult:
+    """Validate, normalize and transform an uploaded image with a template's prompt
+
+    Shared by the transform endpoints. Usage is tracked on the given template
+    manager and errors are raised as HTTP exceptions.
+
+    Raises:
+        400: Invalid image or template
+        500: Processing error
+        503: Backend queue is full
+    """
+    try:
+        # Check file type
+        content_type = user_image.content_type
+        if not content_type or not content_type.startswith('image/'):
+            template_manager.track_template_usage(template_id, False, "invalid_file_type")
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid file type. Only images are accepted."
+            )
+
+        # Get user image bytes
+        user_image_bytes = await user_image.read()
+        if not user_image_bytes:
+            template_manager.track_template_usage(template_id, False, "empty_file")
+            raise HTTPException(status_code=400, detail="Empty image file")
+
+        # Normalize once: orientation, sRGB, capped size, no metadata
+        try:
+            normalized = await run_in_threadpool(normalize_image, user_image_bytes)
+        except ValueError as ve:
+            template_manager.track_template_usage(template_id, False, "invalid_image")
+            raise HTTPException(status_code=400, detail=str(ve)) from ve
+
+        try:
+            prompt = template_manager.get_template_prompt(template_id)
+            job = TransformJob(normalized.data, normalized.media_type, prompt, template_id)
+            result = await engine.transform(job, backends)
+
+            # Track successful usage
+            template_manager.track_template_usage(template_id, True)
+            return result
+
+        except BackendBusyError as be:
+            template_manager.track_template_usage(template_id, False, "busy")
+            raise HTTPException(
+                status_code=503,
+                detail="The image generator is busy. Please try again in a moment.",
+                headers={"Retry-After": "10"}
+            ) from be
+
+        except ValueError as ve:
+            # Handle specific errors
+            template_manager.track_template_usage(template_id, False, "value_error")
+            raise HTTPException(status_code=400, detail=str(ve)) from ve
+
+        except Exception as e:
+            # Handle general errors
+            print(f"Error in image transformation: {str(e)}")
+            template_manager.track_template_usage(template_id, False, "processing_error")
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to transform image. Please try again with a different photo."
+            ) from e
+
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        template_manager.track_template_usage(template_id, False, "unexpected_error")
+        raise HTTPException(
+            status_code=500,
+            detail="An unexpected error occurred. Please try again later."
+        ) from e
+
+def parse_accept(accept: str) -> Dict[str, float]:
+    """Parse an Accept header into {media_range: quality}"""
+    ranges: Dict[str, float] = {}
+    for item in accept.split(","):
+        media_range, _, params = item.strip().partition(";")
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_range.strip().lower()] = quality
+    return ranges
+
+def wants_image_response(request: Request) -> bool:
+    """Check whether the client asked for the image itself rather than JSON
+
+    True when Accept names image/* (or a specific image type) with a higher
+    quality than application/json. Clients sending no Accept header, */* or
+    application/json keep getting JSON.
+    """
+    ranges = parse_accept(request.headers.get("accept", ""))
+    image_quality = max((quality for media_range, quality in ranges.items() if media_range.startswith("image/")), default=0.0)
+    json_quality = ranges.get("application/json", 0.0)
+    return image_quality > 0 and image_quality > json_quality
+
+def image_response(result: TransformResult, template_id: str) -> Response:
+    """Return a transformed image as the response body, with metadata in headers"""
+    return Response(
+        content=result.image_bytes,
+        media_type=get_image_media_type(result.image_bytes),
+        headers={
+            "X-Template-Id": template_id,
+            "X-Transform-Backend": result.backend,
+            "X-Transform-Cached": "true" if result.cached else "false",
+            "X-Transform-Seconds": f"{result.seconds:.3f}",
+            "Cache-Control": "private, no-store",
+            "Vary": "Accept"
+        }
+    )
+
+def image_data_url(image_bytes: bytes) -> str:
+    """Encode a transformed image as a data URL for JSON responses"""
+    media_type = get_image_media_type(image_bytes)
+    if media_type == "application/octet-stream":
+        media_type = "image/png"
+    return f"data:{media_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
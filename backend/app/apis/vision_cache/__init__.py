@@ -0,0 +1,66 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# How long vision outputs for an image are reused, and how many are kept
+VISION_CACHE_TTL = 1800
+VISION_CACHE_SIZE = 512
+
+# Kinds of vision output
+GUIDANCE = "guidance"  # GPT-4o artistic guidance for a template (openai)
+DESCRIPTION = "description"  # Plain description of the person for DALL-E (image_generation)
+MEME_RESULT = "meme_result"  # GPT-4o meme generation reply (image_generation)
+
+def get_image_hash(image_bytes: bytes) -> str:
+    """Hash image bytes for vision cache keys"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+class VisionCache:
+    """TTL memo of GPT-4o vision outputs, keyed by image hash, kind and parameters
+
+    The faceswap fallback chain sends the same image through several vision
+    calls (guidance in openai, then meme generation and a description in
+    image_generation). Caching their outputs per image lets fallbacks and
+    retries skip repeated multi-second calls.
+    """
+
+    def __init__(self, ttl: float = VISION_CACHE_TTL, max_entries: int = VISION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_hash: str, kind: str, params: str = "") -> Optional[str]:
+        """Get a fresh cached output, or None"""
+        key = (image_hash, kind, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, image_hash: str, kind: str, value: str, params: str = ""):
+        """Cache an output"""
+        if not value:
+            return
+        key = (image_hash, kind, params)
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+vision_cache = VisionCache()
@@ -0,0 +1,84 @@
+import io
+import base64
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from app.apis import openai as openai_api
+from app.apis import image_generation
+from app.apis.image_generation import BACKUP_MODEL
+
+
+class FakeOpenAIClient:
+    """Counts GPT-4o vision calls; DALL-E fails the first time, then succeeds"""
+
+    def __init__(self, analysis: str):
+        self.analysis = analysis
+        self.vision_calls = 0
+        self.image_calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat))
+        self.images = SimpleNamespace(generate=self.generate_image)
+
+    async def create_chat(self, model, messages, **kwargs):
+        content = messages[-1]["content"]
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            self.vision_calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.analysis))])
+
+    async def generate_image(self, **kwargs):
+        self.image_calls += 1
+        if self.image_calls == 1:
+            raise RuntimeError("DALL-E is unavailable")
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "blue").save(buffer, format="PNG")
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=base64.b64encode(buffer.getvalue()).decode("ascii"))])
+
+
+def make_user_image(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeOpenAIClient(
+        "Give the face big green frog eyes.\n"
+        f"{openai_api.PERSON_DESCRIPTION_MARKER} A smiling person in a red jacket in front of a brick wall."
+    )
+    monkeypatch.setattr(openai_api, "get_extended_prompt", lambda template_id: "")
+    monkeypatch.setattr(openai_api, "track_model_performance", lambda *args, **kwargs: None)
+    monkeypatch.setattr(image_generation, "track_model_performance", lambda *args, **kwargs: None)
+    monkeypatch.setattr(image_generation, "get_openai_client", lambda: client)
+    return client
+
+
+def test_fallback_chain_reuses_the_vision_analysis(client):
+    user_image = make_user_image((200, 30, 30))
+
+    async def run_chain():
+        # The faceswap chain: GPT-4o Vision transform first, viral meme generation on failure
+        with pytest.raises(RuntimeError):
+            await openai_api.transform_image_with_gpt4_vision(client, user_image, "pepe")
+        return await image_generation.generate_viral_meme_image(user_image, "pepe")
+
+    image_bytes, model_used = asyncio.run(run_chain())
+
+    assert image_bytes
+    assert model_used == BACKUP_MODEL
+    assert client.vision_calls == 1
+    assert client.image_calls == 2
+
+
+def test_viral_meme_generation_without_prior_analysis_tries_gpt4o(client):
+    user_image = make_user_image((30, 200, 30))
+    client.image_calls = 1  # DALL-E works straight away
+
+    image_bytes, model_used = asyncio.run(image_generation.generate_viral_meme_image(user_image, "pepe"))
+
+    assert image_bytes
+    assert model_used == BACKUP_MODEL
+    # GPT-4o did not return an image URL, then DALL-E described the image itself
+    assert client.vision_calls == 2